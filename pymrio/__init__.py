@@ -46,6 +46,8 @@ from pymrio.core.mriosystem import concate_extension
 from pymrio.core.fileio import *
 
 from pymrio.tools.ioparser import *
+from pymrio.tools.iobatch import parse_many
+from pymrio.tools.iobatch import download_and_parse
 
 from pymrio.tools.iodownloader import download_eora26
 from pymrio.tools.iodownloader import download_wiod2013
@@ -56,8 +58,13 @@ from pymrio.tools.iodownloader import download_exiobase1
 
 from pymrio.tools.iometadata import MRIOMetaData
 
+from pymrio.tools.iocache import ParseCache
+from pymrio.tools.iocache import set_parse_cache
+from pymrio.tools.iocache import get_parse_cache
+
 from pymrio.tools.ioutil import build_agg_vec
 from pymrio.tools.ioutil import build_agg_matrix
+from pymrio.tools.ioutil import ArchiveSession
 
 from pymrio.tools.iomath import calc_x
 from pymrio.tools.iomath import calc_x_from_L
@@ -71,5 +78,14 @@ from pymrio.tools.iomath import calc_F_Y
 from pymrio.tools.iomath import calc_M
 from pymrio.tools.iomath import calc_e
 from pymrio.tools.iomath import calc_accounts
+from pymrio.tools.iomath import calc_Z_from_SUT
+from pymrio.tools.iospa import structural_path_analysis
+from pymrio.tools.iolinkages import calc_B
+from pymrio.tools.iolinkages import calc_G
+from pymrio.tools.iolinkages import calc_G_from_L
+from pymrio.tools.iolinkages import calc_linkages
+from pymrio.tools.iolinkages import hypothetical_extraction
+from pymrio.tools.iolinkages import extraction_losses
+from pymrio.tools.ioprices import calc_prices
 
 from pymrio.tools.iofunctions import *
\ No newline at end of file
@@ -6,7 +6,6 @@ Methods to load previously save mrios
 import collections
 import configparser
 import logging
-import json
 import re
 import pandas as pd
 import os
@@ -20,6 +19,9 @@ from pymrio.core.mriosystem import IOSystem
 from pymrio.core.mriosystem import Extension
 from pymrio.tools.iometadata import MRIOMetaData
 from pymrio.tools.ioutil import get_file_para
+from pymrio.tools.ioutil import open_archive
+from pymrio.tools.ioutil import load_sparse_table
+from pymrio.tools.ioutil import read_csv_table
 
 from pymrio.core.constants import DEFAULT_FILE_NAMES
 from pymrio.core.constants import GENERIC_NAMES
@@ -31,7 +33,8 @@ class ReadError(Exception):
     pass
 
 
-def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
+def load_all(path, include_core=True, subfolders=None, path_in_arc=None,
+             workers=None, sparse='dataframe', engine='c'):
     """ Loads a full IO system with all extension in path
 
     Parameters
@@ -71,6 +74,22 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
         zip archive (thus only one file_parameter file as the systemtype entry
         'IOSystem'.
 
+    workers: int, optional
+        Number of threads for reading the tables from a zip archive,
+        passed to 'load'. Default: None (sequential reading)
+
+    sparse: string, optional
+        How to return tables stored in the sparse npz format,
+        passed to 'load'. Default: 'dataframe' (sparse backed DataFrame)
+
+    engine: string, optional
+        CSV engine for the numerical text tables (see
+        pymrio.tools.ioutil.read_csv_table): 'c' (default) reads each table
+        in chunks, which bounds the memory requirement, 'pyarrow' (requires
+        pyarrow) parses each table at once with multiple threads, which is
+        faster but needs memory for the parsed table in addition to the
+        loaded one. Passed to 'load'.
+
     """
     def clean(varStr):
         """ get valid python name from folder
@@ -79,9 +98,20 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
 
     path = Path(path)
 
-    if zipfile.is_zipfile(str(path)):
-        with zipfile.ZipFile(file=str(path), mode='r') as zz:
-            zipcontent = zz.namelist()
+    arc = open_archive(path)
+    try:
+        return _load_all(path, include_core, subfolders, path_in_arc,
+                         workers, sparse, engine, arc, clean)
+    finally:
+        if arc:
+            arc.close()
+
+
+def _load_all(path, include_core, subfolders, path_in_arc, workers, sparse,
+              engine, arc, clean):
+    """ Implementation of load_all with an (optionally) open archive """
+    if arc:
+        zipcontent = arc.namelist
         if path_in_arc:
             path_in_arc = str(path_in_arc)
             if path_in_arc not in zipcontent:
@@ -102,13 +132,11 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
                                         DEFAULT_FILE_NAMES['filepara'], path))
 
         else:
-            with zipfile.ZipFile(file=str(path), mode='r') as zz:
-                fpfiles = [
-                    f for f in zz.namelist()
-                    if
-                    os.path.basename(f) == DEFAULT_FILE_NAMES['filepara'] and
-                    json.loads(zz.read(f).decode('utf-8')
-                               )['systemtype'] == 'IOSystem']
+            fpfiles = [
+                f for f in zipcontent
+                if
+                os.path.basename(f) == DEFAULT_FILE_NAMES['filepara'] and
+                arc.read_json(f)['systemtype'] == 'IOSystem']
             if len(fpfiles) == 0:
                 raise ReadError('File parameter file {} not found in {}. '
                                 'Tip: specify fileparameter filename '
@@ -125,9 +153,10 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
         logging.debug("Expect file parameter-file at {} in {}".format(
             path_in_arc, path))
 
-    io = load(path, include_core=include_core, path_in_arc=path_in_arc)
+    io = load(path, include_core=include_core, path_in_arc=path_in_arc,
+              archive=arc, workers=workers, sparse=sparse, engine=engine)
 
-    if zipfile.is_zipfile(str(path)):
+    if arc:
         root_in_zip = os.path.dirname(path_in_arc)
         if subfolders is None:
             subfolders = {
@@ -157,7 +186,9 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
             if subfolder_full_meta in zipcontent:
                 ext = load(path,
                            include_core=include_core,
-                           path_in_arc=subfolder_full_meta)
+                           path_in_arc=subfolder_full_meta,
+                           archive=arc, workers=workers, sparse=sparse,
+                           engine=engine)
                 setattr(io, clean(subfolder_name), ext)
                 io.meta._add_fileio("Added satellite account "
                                     "from {}".format(subfolder_full))
@@ -182,7 +213,8 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
                 subfolder_full_meta = subfolder_full
 
             if subfolder_full_meta.exists():
-                ext = load(subfolder_full, include_core=include_core)
+                ext = load(subfolder_full, include_core=include_core,
+                           sparse=sparse, engine=engine)
                 setattr(io, clean(subfolder_name), ext)
                 io.meta._add_fileio("Added satellite account "
                                     "from {}".format(subfolder_full))
@@ -192,7 +224,8 @@ def load_all(path, include_core=True, subfolders=None, path_in_arc=None):
     return io
 
 
-def load(path, include_core=True, path_in_arc=''):
+def load(path, include_core=True, path_in_arc='', archive=None, workers=None,
+         sparse='dataframe', engine='c'):
     """ Loads a IOSystem or Extension previously saved with pymrio
 
     This function can be used to load a IOSystem or Extension specified in a
@@ -200,7 +233,9 @@ def load(path, include_core=True, path_in_arc=''):
 
     DataFrames (tables) are loaded from text or binary pickle files.
     For the latter, the extension .pkl or .pickle is assumed, in all other case
-    the tables are assumed to be in .txt format.
+    the tables are assumed to be in .txt format. Tables saved in the
+    sparse format (see parameter 'sparse_threshold' of save) have the
+    extension .npz.
 
     Parameters
     ----------
@@ -223,6 +258,31 @@ def load(path, include_core=True, path_in_arc=''):
         for data in e.g. the folder 'emissions' pass 'emissions/'.  Only used
         if parameter 'path' points to an compressed zip file.
 
+    archive: ArchiveSession, optional
+        Open session of the zip archive at 'path' (see
+        pymrio.tools.ioutil.ArchiveSession). If given, the archive
+        is not opened again. Used by load_all to share one session
+        between the IOSystem and all extensions.
+
+    workers: int, optional
+        Number of threads for reading the tables from a zip archive.
+        Each thread reads through its own handle of the archive.
+        Default: None (sequential reading)
+
+    sparse: string, optional
+        How to return tables stored in the sparse npz format:
+
+            - 'dataframe' : sparse backed DataFrame (default)
+            - 'dense' : standard DataFrame
+
+    engine: string, optional
+        CSV engine for the numerical text tables (see
+        pymrio.tools.ioutil.read_csv_table): 'c' (default) reads each table
+        in chunks, which bounds the memory requirement, 'pyarrow' (requires
+        pyarrow) parses each table at once with multiple threads, which is
+        faster but needs memory for the parsed table in addition to the
+        loaded one.
+
     Returns
     -------
 
@@ -235,10 +295,25 @@ def load(path, include_core=True, path_in_arc=''):
     if not path.exists():
         raise ReadError('Given path does not exist')
 
-    file_para = get_file_para(path=path, path_in_arc=path_in_arc)
+    if sparse not in ['dataframe', 'dense']:
+        raise ValueError('Parameter sparse must be "dataframe" or "dense"')
+
+    arc = open_archive(path, archive)
+    try:
+        return _load(path, include_core, path_in_arc, arc, workers, sparse,
+                     engine)
+    finally:
+        if arc and arc is not archive:
+            arc.close()
+
+
+def _load(path, include_core, path_in_arc, arc, workers, sparse, engine):
+    """ Implementation of load with an (optionally) open archive """
+    file_para = get_file_para(path=path, path_in_arc=path_in_arc,
+                              archive=arc)
 
     if file_para.content['systemtype'] == GENERIC_NAMES['iosys']:
-        if zipfile.is_zipfile(str(path)):
+        if arc:
             # Not using os.path.join here b/c this adds the wrong
             # separator when reading the zip in windows
             if file_para.folder != '':
@@ -250,7 +325,8 @@ def load(path, include_core=True, path_in_arc=''):
 
             ret_system = IOSystem(meta=MRIOMetaData(
                 location=path,
-                path_in_arc=metadata_folder))
+                path_in_arc=metadata_folder,
+                archive=arc))
             ret_system.meta._add_fileio(
                 "Loaded IO system from {} - {}".format(path, path_in_arc))
         else:
@@ -266,22 +342,45 @@ def load(path, include_core=True, path_in_arc=''):
         raise ReadError('Type of system no defined in the file parameters')
         return None
 
+    def _read_table(file_handle, file_name, nr_index_col, nr_header):
+        if os.path.splitext(str(file_name))[1] == '.npz':
+            return load_sparse_table(file_handle, dense=(sparse == 'dense'))
+        elif (os.path.splitext(str(file_name))[1] == '.pkl' or
+                os.path.splitext(str(file_name))[1] == '.pickle'):
+            return pd.read_pickle(file_handle)
+
+        try:
+            # dtype=None: keep the types of the saved tables (e.g. int64)
+            return read_csv_table(file_name, nr_index_col, nr_header,
+                                  sep='\t', dtype=None, zip_file=arc,
+                                  engine=engine)
+        except ValueError:
+            # Non-numerical table (e.g. unit) - use the generic reader
+            logging.debug('Non-numerical data in {}'.format(file_name))
+        _index_col = list(range(nr_index_col))
+        _header = list(range(nr_header))
+        _index_col = 0 if _index_col == [0] else _index_col
+        _header = 0 if _header == [0] else _header
+        if arc:
+            with arc.open(file_name) as ff:
+                return pd.read_csv(ff, index_col=_index_col,
+                                   header=_header, sep='\t')
+        return pd.read_csv(file_name, index_col=_index_col,
+                           header=_header, sep='\t')
+
+    arc_tables = dict()
     for key in file_para.content['files']:
         if not include_core and key not in ['A', 'L', 'Z']:
             continue
 
         file_name = file_para.content['files'][key]['name']
-        nr_index_col = file_para.content['files'][key]['nr_index_col']
-        nr_header = file_para.content['files'][key]['nr_header']
-        _index_col = list(range(int(nr_index_col)))
-        _header = list(range(int(nr_header)))
-        _index_col = 0 if _index_col == [0] else _index_col
-        _header = 0 if _header == [0] else _header
+        nr_index_col = int(file_para.content['files'][key]['nr_index_col'])
+        nr_header = int(file_para.content['files'][key]['nr_header'])
 
         if key == 'FY':  # Legacy code to read data saved with version < 0.4
             key = 'F_Y'
 
-        if zipfile.is_zipfile(str(path)):
+        if arc:
             # Not using os.path.join here b/c this adds the wrong
             # separator when reading the zip in windows
             if file_para.folder != '':
@@ -290,31 +389,24 @@ def load(path, include_core=True, path_in_arc=''):
             else:
                 full_file_name = file_name
             logging.info('Load data from {}'.format(full_file_name))
-
-            with zipfile.ZipFile(file=str(path)) as zf:
-                if (os.path.splitext(str(full_file_name))[1] == '.pkl' or
-                        os.path.splitext(str(full_file_name))[1] == '.pickle'):
-                    setattr(ret_system, key,
-                            pd.read_pickle(zf.open(full_file_name)))
-                else:
-                    setattr(ret_system, key,
-                            pd.read_csv(zf.open(full_file_name),
-                                        index_col=_index_col,
-                                        header=_header, sep='\t'))
+            arc_tables[full_file_name] = (key, nr_index_col, nr_header)
         else:
             full_file_name = path / file_name
             logging.info('Load data from {}'.format(full_file_name))
+            setattr(ret_system, key,
+                    _read_table(full_file_name, full_file_name,
+                                nr_index_col, nr_header))
+
+    if arc_tables:
+        members = list(arc_tables.keys())
+        tables = arc.map_members(
+            lambda member, mf: _read_table(mf, member,
+                                           arc_tables[member][1],
+                                           arc_tables[member][2]),
+            members, workers=workers)
+        for member, table in zip(members, tables):
+            setattr(ret_system, arc_tables[member][0], table)
 
-            if (os.path.splitext(str(full_file_name))[1] == '.pkl' or
-                    os.path.splitext(str(full_file_name))[1] == '.pickle'):
-                setattr(ret_system, key,
-                        pd.read_pickle(full_file_name))
-            else:
-                setattr(ret_system, key,
-                        pd.read_csv(full_file_name,
-                                    index_col=_index_col,
-                                    header=_header,
-                                    sep='\t'))
     return ret_system
 
 
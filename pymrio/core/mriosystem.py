@@ -10,6 +10,7 @@ import collections
 import copy
 import json
 import logging
+import os
 import re
 import string
 import time
@@ -204,6 +205,10 @@ class CoreSystem():
          if key not in self.__coefficients__]
         return self
 
+    def _reset_label_index(self):
+        """ Removes the cached region/sector index (see label_index) """
+        self.__dict__.pop('_label_idx', None)
+
     def copy(self, new_name=None):
         """ Returns a deep copy of the system
 
@@ -438,7 +443,8 @@ class CoreSystem():
                     yield key
 
     def save(self, path, table_format='txt', sep='\t',
-             table_ext=None, float_format='%.12g'):
+             table_ext=None, float_format='%.12g', incremental=True,
+             sparse_threshold=None):
         """ Saving the system to path
 
 
@@ -466,6 +472,26 @@ class CoreSystem():
         float_format : string, optional
             Format for saving the DataFrames,
             default = '%.12g', only for txt files
+
+        incremental : boolean, optional
+            If True (default), a content fingerprint of each table is stored
+            in the file parameter file and tables which did not change since
+            the last save to path are not written again.
+            Set to False to rewrite all tables.
+
+        sparse_threshold : float, optional
+            Numeric tables with a share of zeros of at least sparse_threshold
+            (e.g. 0.9) are stored as compressed sparse npz files (with the
+            non-zero values and the labels), independent of table_format.
+            Sparse backed DataFrames are always stored in this format if a
+            threshold is given. If None (default) all tables are stored in
+            table_format.
+
+        Note
+        ----
+        Tables are first written to a temporary file which then replaces
+        the previous file. An interrupted save thus never leaves a
+        partially written table.
         """
 
         path = Path(path)
@@ -476,6 +502,16 @@ class CoreSystem():
         file_para = dict()
         file_para['files'] = dict()
 
+        prev_files = dict()
+        stale_files = list()
+        if incremental and para_file_path.exists():
+            try:
+                with para_file_path.open(mode='r') as pf:
+                    prev_files = json.load(pf).get('files', dict())
+            except ValueError:
+                logging.warning('Could not read {} - all tables will be '
+                                'saved'.format(para_file_path))
+
         if table_format in ['text', 'csv', 'txt']:
             table_format = 'txt'
         elif table_format in ['pickle', 'bin', 'binary', 'pkl']:
@@ -512,22 +548,59 @@ class CoreSystem():
             else:
                 nr_header = 1
 
-            save_file = df_name + table_ext
+            save_sparse = False
+            if sparse_threshold is not None:
+                density = ioutil.table_density(df)
+                save_sparse = (density is not None and
+                               1 - density >= sparse_threshold)
+                if all(isinstance(dt, pd.SparseDtype) for dt in df.dtypes):
+                    save_sparse = True
+
+            if save_sparse:
+                save_file = df_name + '.npz'
+                fingerprint = ioutil.get_table_fingerprint(df, 'sparse')
+            else:
+                save_file = df_name + table_ext
+                fingerprint = ioutil.get_table_fingerprint(
+                    df, table_format, sep, float_format)
             save_file_with_path = path / save_file
-            logging.info('Save file {}'.format(save_file_with_path))
-            if table_format == 'txt':
-                df.to_csv(save_file_with_path, sep=sep,
-                          float_format=float_format)
+            prev = prev_files.get(df_name, dict())
+            if (incremental and
+                    prev.get('name') == save_file and
+                    prev.get('fingerprint') == fingerprint and
+                    save_file_with_path.exists()):
+                logging.info('Skip unchanged file {}'.format(
+                    save_file_with_path))
             else:
-                df.to_pickle(save_file_with_path)
+                logging.info('Save file {}'.format(save_file_with_path))
+                tmp_file = save_file_with_path.with_name(save_file + '.tmp')
+                if save_sparse:
+                    with tmp_file.open(mode='wb') as tf:
+                        ioutil.save_sparse_table(df, tf)
+                elif table_format == 'txt':
+                    df.to_csv(tmp_file, sep=sep,
+                              float_format=float_format)
+                else:
+                    df.to_pickle(tmp_file)
+                os.replace(str(tmp_file), str(save_file_with_path))
+                if prev.get('name') not in (None, save_file):
+                    stale_files.append(path / prev['name'])
 
             file_para['files'][df_name] = dict()
             file_para['files'][df_name]['name'] = save_file
             file_para['files'][df_name]['nr_index_col'] = str(nr_index_col)
             file_para['files'][df_name]['nr_header'] = str(nr_header)
+            file_para['files'][df_name]['fingerprint'] = fingerprint
 
-        with para_file_path.open(mode='w') as pf:
+        tmp_para_file = para_file_path.with_name(
+            para_file_path.name + '.tmp')
+        with tmp_para_file.open(mode='w') as pf:
             json.dump(file_para, pf, indent=4)
+        os.replace(str(tmp_para_file), str(para_file_path))
+
+        for stale_file in stale_files:
+            if stale_file.exists():
+                stale_file.unlink()
 
         if file_para['systemtype'] == GENERIC_NAMES['iosys']:
             if not self.meta:
@@ -567,6 +640,7 @@ class CoreSystem():
         except:
             pass
 
+        self._reset_label_index()
         self.meta._add_modify("Changed country names")
         return self
 
@@ -596,6 +670,7 @@ class CoreSystem():
                     df.rename(index=sectors, columns=sectors, inplace=True)
         except:
             pass
+        self._reset_label_index()
         self.meta._add_modify("Changed sector names")
         return self
 
@@ -1708,13 +1783,15 @@ class IOSystem(CoreSystem):
         return self
 
     def save_all(self, path, table_format='txt', sep='\t',
-                 table_ext=None, float_format='%.12g'):
+                 table_ext=None, float_format='%.12g', incremental=True,
+                 sparse_threshold=None):
         """ Saves the system and all extensions
 
         Extensions are saved in separate folders (names based on extension)
 
         Parameters are passed to the .save methods of the IOSystem and
-        Extensions. See parameters description there.
+        Extensions. See parameters description there. With incremental=True
+        (default) only tables which changed since the last save are written.
         """
 
         path = Path(path)
@@ -1725,7 +1802,9 @@ class IOSystem(CoreSystem):
                   table_format=table_format,
                   sep=sep,
                   table_ext=table_ext,
-                  float_format=float_format)
+                  float_format=float_format,
+                  incremental=incremental,
+                  sparse_threshold=sparse_threshold)
 
         for ext, ext_name in zip(self.get_extensions(data=True),
                                  self.get_extensions()):
@@ -1735,7 +1814,9 @@ class IOSystem(CoreSystem):
                      table_format=table_format,
                      sep=sep,
                      table_ext=table_ext,
-                     float_format=float_format)
+                     float_format=float_format,
+                     incremental=incremental,
+                     sparse_threshold=sparse_threshold)
         return self
 
     def aggregate(self, region_agg=None, sector_agg=None,
@@ -1921,6 +2002,7 @@ class IOSystem(CoreSystem):
         conc_y = np.kron(region_conc, np.eye(len(self.get_Y_categories())))
 
         # Aggregate
+        self._reset_label_index()
         self.meta._add_modify('Aggregate final demand y')
         self.Y = pd.DataFrame(
             data=conc.dot(self.Y).dot(conc_y.T),
@@ -5,6 +5,7 @@ import sys
 import os
 
 import pytest
+import numpy as np
 import pandas as pd
 import pandas.util.testing as pdt
 
@@ -154,6 +155,203 @@ def test_rename_sectors(fix_testmrio):
     assert fix_testmrio.testmrio.get_sectors()[4] == new_sec_list[4]
 
 
+def test_label_index(fix_testmrio):
+    tt = fix_testmrio.testmrio
+    secs = ['mining', 'trade', 'foo']
+    regs = ['reg2', 'reg5']
+    expected = [r in regs and s in secs
+                for r in fix_testmrio.regions for s in fix_testmrio.sectors]
+    assert list(tt.is_in(secs, regs)) == expected
+    assert list(tt.index_secs_regs(secs, regs)) == [
+        i for i, ee in enumerate(expected) if ee]
+    assert tt.is_in().all()
+    assert list(tt.is_in('food', 'reg1')).count(True) == 1
+    assert list(tt.index_secs(['mining', 'trade'])) == [1, 5]
+    assert list(tt.index_regs('reg3')) == [2]
+    assert list(tt.index_secs('trade', ['a', 'trade', 'b', 'trade'])) == [1, 3]
+    assert tt.regions == fix_testmrio.regions
+    assert tt.label_index() is tt.label_index()
+
+    tt.rename_regions({'reg2': 'new2'})
+    assert tt.regions[1] == 'new2'
+    assert list(tt.index_secs_regs('food', ['reg2', 'new2'])) == [8]
+    tt.rename_sectors({'mining': 'new_mining'})
+    assert list(tt.index_secs(['mining', 'new_mining'])) == [1]
+
+    # new tables with other labels replace the index
+    old_index = tt.label_index()
+    tt.Z = tt.Z.loc[['reg1', 'new2'], ['reg1', 'new2']]
+    tt.Y = tt.Y.loc[['reg1', 'new2'], ['reg1', 'new2']]
+    tt.A = tt.L = None
+    assert tt.label_index() is not old_index
+    assert tt.regions == ['reg1', 'new2']
+    assert len(tt.is_in()) == 2 * len(fix_testmrio.sectors)
+
+
+def test_result_cache(fix_testmrio):
+    tt = fix_testmrio.testmrio
+    tt.calc_all()
+    prod = tt.x.values[:, 0] * tt.is_in(['food', 'mining'], 'reg2')
+    expected = tt.L.values.dot(prod)
+
+    first = tt.embodied_prod(prod=prod)
+    second = tt.embodied_prod(prod=prod.copy())
+    np.testing.assert_allclose(first, expected)
+    np.testing.assert_array_equal(second, first)
+    assert second is not first
+    assert first.flags.writeable and second.flags.writeable
+    assert tt.result_cache().cache_info().hits == 1
+    assert tt.result_cache().cache_info().misses == 1
+
+    # replacing L, A or x invalidates the cached results
+    tt.L = tt.L * 2
+    np.testing.assert_allclose(tt.embodied_prod(prod=prod), 2 * expected)
+    assert tt.result_cache().cache_info().misses == 2
+    assert len(tt.result_cache()) == 1
+
+    # LRU eviction
+    tt.result_cache(maxsize=2)
+    for factor in [2, 3]:
+        tt.embodied_prod(prod=factor * prod)
+    assert tt.result_cache().cache_info().currsize == 2
+    tt.embodied_prod(prod=prod)
+    assert tt.result_cache().cache_info().misses == 5
+    tt.embodied_prod(prod=3 * prod)
+    assert tt.result_cache().cache_info().hits == 2
+
+
+def test_final_demand(fix_testmrio):
+    tt = fix_testmrio.testmrio
+    total = tt.Y.sum(axis=1)
+    pdt.assert_series_equal(tt.final_demand(), total, check_names=False)
+
+    # positive categories only apply to Exiobase by default
+    positive = [cat for cat in fix_testmrio.Y_cat if cat not in
+                ['Changes in inventories', 'Changes in valuables']]
+    expected = tt.Y.loc[:, (slice(None), positive)].sum(axis=1)
+    np.testing.assert_allclose(tt.final_demand(categories='positive'),
+                               expected)
+    tt.meta.change_meta('name', 'EXIOBASE')
+    np.testing.assert_allclose(tt.final_demand(), expected)
+    np.testing.assert_allclose(tt.final_demand(only_positive=False), total)
+
+    gfcf = 'Gross fixed capital formation'
+    invest = tt.final_demand(['food', 'mining'], 'reg2', categories=gfcf)
+    assert list(invest.index) == list(tt.Y.index)
+    assert (invest != 0).sum() == 2
+    assert invest[('reg2', 'mining')] == pytest.approx(
+        tt.Y.loc[('reg2', 'mining'), (slice(None), gfcf)].sum())
+
+    blocks = tt.final_demand_blocks(categories='all')
+    np.testing.assert_allclose(
+        blocks, tt.Y.groupby(level='region', axis=1, sort=False).sum())
+    assert tt.final_demand_blocks(categories='all') is blocks
+    tt.Y = tt.Y * 2
+    np.testing.assert_allclose(tt.final_demand_blocks(categories='all'),
+                               2 * blocks)
+
+
+def test_embodied_trade(fix_testmrio):
+    tt = fix_testmrio.testmrio
+    tt.calc_all()
+    air = ('emission_type1', 'air')
+    trade = tt.embodied_trade(extension='emissions')
+    assert list(trade.columns) == ['region_exp', 'region_imp',
+                                   'stressor', 'value']
+    assert len(trade) == 6 * 6 * 2
+
+    # summing over the regions of origin gives the footprints
+    footprint = trade.groupby(['stressor', 'region_imp']).value.sum()
+    cba = tt.emissions.D_cba.groupby(level='region', axis=1).sum()
+    for reg in fix_testmrio.regions:
+        assert footprint[(air, reg)] == pytest.approx(cba.loc[air, reg])
+
+    # bilateral flow against the explicit product
+    y_reg3 = tt.Y['reg3'].sum(axis=1)
+    expected = (tt.emissions.S.loc[air] * tt.L.dot(y_reg3))['reg2'].sum()
+    value = trade.loc[(trade.region_exp == 'reg2') &
+                      (trade.region_imp == 'reg3') &
+                      (trade.stressor == air), 'value']
+    assert value.iloc[0] == pytest.approx(expected)
+
+    by_sec = tt.embodied_trade(air, extension='emissions',
+                               secs=['food', 'mining'], by_sector=True)
+    assert len(by_sec) == 6 * 2 * 6
+    imports = tt.embodied_import(air, ['food', 'mining'], ['reg3', 'reg4'],
+                                 extension='emissions')
+    expected = by_sec[(by_sec.region_exp != 'reg3') &
+                      (by_sec.region_imp == 'reg3')].value.sum()
+    assert imports[0] == pytest.approx(expected)
+    joined = tt.embodied_import(air, ['food', 'mining'], 'reg3',
+                                join=True, extension='emissions')
+    assert joined == pytest.approx(expected)
+    secs = ['food', 'mining']
+    by_reg = tt.embodied_trade(air, extension='emissions', secs=secs)
+    np.testing.assert_allclose(
+        by_reg.groupby(['region_exp', 'region_imp']).value.sum(),
+        by_sec.groupby(['region_exp', 'region_imp']).value.sum())
+    with pytest.raises(ValueError):
+        tt.embodied_import(air, secs, 'reg3', 'reg2', extension='emissions')
+    with pytest.raises(ValueError):
+        tt.embodied_import(air, secs, None, join=True, extension='emissions')
+    with pytest.raises(ValueError):
+        tt.imports(['food'], None)
+
+    # direct imports
+    rows = [(r, s) for r in ['reg2', 'reg5'] for s in secs]
+    expected = (tt.Z.loc[rows, 'reg1'].sum(axis=1) +
+                tt.Y.loc[rows, 'reg1'].sum(axis=1))
+    pdt.assert_series_equal(tt.imports(secs, 'reg1', ['reg2', 'reg5']),
+                            expected, check_names=False)
+    assert tt.impact_imports(air, secs, 'reg1', ['reg2', 'reg5'],
+                             extension='emissions') == pytest.approx(
+        (tt.emissions.S.loc[air, rows] * expected).sum())
+
+    hits = tt.result_cache().cache_info().hits
+    tt.embodied_trade(extension='emissions')
+    assert tt.result_cache().cache_info().hits > hits
+
+
+def test_extract(fix_testmrio):
+    tt = fix_testmrio.testmrio
+    tt.calc_all()
+    air = ('emission_type1', 'air')
+    A = tt.A.values
+    x = tt.x.values.ravel()
+    f = tt.emissions.S.loc[air].values
+
+    # against the inversion of the reduced system
+    extracted = tt.index_secs_regs(['food', 'mining'], 'reg2')
+    keep = np.setdiff1d(np.arange(len(x)), extracted)
+    x_ext = np.zeros(len(x))
+    x_ext[keep] = np.linalg.solve(np.eye(len(keep)) - A[np.ix_(keep, keep)],
+                                  (x - A.dot(x))[keep])
+    res = tt.extract(['food', 'mining'], 'reg2', var=air,
+                     extension='emissions')
+    np.testing.assert_allclose(res.output, x - x_ext)
+    np.testing.assert_allclose(res.impact, f * (x - x_ext))
+    assert res.index.names == ['region', 'sector']
+
+    # batches against single extractions
+    by_sector = tt.extract(var=air, extension='emissions', batch='sector')
+    assert list(by_sector.index) == fix_testmrio.sectors
+    food = tt.extract('food', var=air, extension='emissions')
+    assert by_sector.loc['food', 'output'] == pytest.approx(
+        food.output.sum())
+    assert by_sector.loc['food', 'impact_share'] == pytest.approx(
+        food.impact.sum() / f.dot(x))
+    by_row = tt.extract(['food'], batch='region_sector', kind='backward')
+    assert len(by_row) == len(fix_testmrio.regions)
+    assert by_row.loc[('reg3', 'food'), 'output'] == pytest.approx(
+        tt.extract('food', 'reg3', kind='backward').output.sum())
+    by_region = tt.extract(regs=['reg1', 'reg3'], batch='region',
+                           kind='forward')
+    assert list(by_region.index) == ['reg1', 'reg3']
+
+    with pytest.raises(ValueError):
+        tt.extract('food', var=air, extension='emissions', kind='forward')
+
+
 def test_rename_Ycat(fix_testmrio):
     new_cat_name = 'HouseCons'
     new_cat_list = ['y1', 'y2', 'y3', 'y4', 'y5', 'y6', 'y7']
@@ -0,0 +1,242 @@
+""" Tests the download manager against a local http server """
+
+import hashlib
+import io
+import os
+import sys
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas.util.testing as pdt
+import pytest
+
+_pymriopath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _pymriopath + '/../../')
+
+import pymrio                                               # noqa
+from pymrio.tools.iodownloader import _download_urls       # noqa
+from pymrio.tools.iodownloader import OECD_CONFIG          # noqa
+from pymrio.tools.iodownloader import PARTIAL_EXT          # noqa
+from pymrio.tools.iometadata import MRIOMetaData           # noqa
+
+
+class _MockServer(object):
+    """ Serves files with range support, failures can be scheduled """
+
+    def __init__(self, files):
+        self.files = files
+        self.failures = dict()
+        self.truncate = dict()
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body=True):
+                name = self.path.lstrip('/')
+                server.requests.append((self.command, name,
+                                        self.headers.get('Range')))
+                if name not in server.files:
+                    self.send_error(404)
+                    return
+                if body and server.failures.get(name, 0) > 0:
+                    server.failures[name] -= 1
+                    self.send_error(500)
+                    return
+                data = server.files[name]
+                start = 0
+                rng = self.headers.get('Range')
+                if rng and body:
+                    start = int(rng.split('=')[1].rstrip('-'))
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                        start, len(data) - 1, len(data)))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(data) - start))
+                self.end_headers()
+                if not body:
+                    return
+                send = data[start:]
+                if server.truncate.get(name, 0) > 0:
+                    server.truncate[name] -= 1
+                    send = send[:len(send) // 2]
+                    self.close_connection = True
+                self.wfile.write(send)
+
+            def do_GET(self):
+                self._send()
+
+            def do_POST(self):
+                self._send()
+
+            def do_HEAD(self):
+                self._send(body=False)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def get_requests(self, name, command=None):
+        return [req for req in self.requests if req[1] == name and
+                (command is None or req[0] == command)]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture()
+def mock_server():
+    files = {'f{}.zip'.format(nr): os.urandom(10000 + nr) for nr in range(5)}
+    server = _MockServer(files)
+    yield server
+    server.close()
+
+
+class _CountingMeta(MRIOMetaData):
+    saves = 0
+
+    def save(self, location=None):
+        self.saves += 1
+        super().save(location)
+
+
+def _meta(folder):
+    return _CountingMeta(location=folder, description='test download',
+                         name='mock', system='ixi', version='1')
+
+
+def _downloaded(meta):
+    return [ent for ent in meta.file_io_history if 'Downloaded' in ent]
+
+
+def test_download_urls(mock_server, tmpdir):
+    """ Parallel downloads, single metadata save and skipping """
+    folder = str(tmpdir)
+    names = sorted(mock_server.files)
+    urls = [mock_server.url + name for name in names]
+
+    meta = _meta(folder)
+    _download_urls(urls, folder, overwrite_existing=False, meta_handler=meta,
+                   workers=3)
+    for name in names:
+        with open(os.path.join(folder, name), 'rb') as ff:
+            assert ff.read() == mock_server.files[name]
+    assert meta.saves == 1
+    assert len(_downloaded(meta)) == len(names)
+    assert not any(ff.endswith(PARTIAL_EXT) for ff in os.listdir(folder))
+
+    # complete files are skipped, truncated ones downloaded again
+    with open(os.path.join(folder, 'f1.zip'), 'r+b') as ff:
+        ff.truncate(100)
+    mock_server.requests.clear()
+    meta = _meta(folder)
+    nr_entries = len(_downloaded(meta))
+    _download_urls(urls, folder, overwrite_existing=False, meta_handler=meta,
+                   workers=3)
+    assert [req[1] for req in mock_server.requests
+            if req[0] == 'POST'] == ['f1.zip']
+    with open(os.path.join(folder, 'f1.zip'), 'rb') as ff:
+        assert ff.read() == mock_server.files['f1.zip']
+    assert meta.saves == 1
+    assert len(_downloaded(meta)) == nr_entries + 1
+
+
+def test_download_resume_retry(mock_server, tmpdir, monkeypatch):
+    """ Resume of partial files, retries and checksum verification """
+    monkeypatch.setattr('pymrio.tools.iodownloader.DOWNLOAD_CHUNK_SIZE', 1000)
+    folder = str(tmpdir)
+    data = mock_server.files['f2.zip']
+    with open(os.path.join(folder, 'f2.zip' + PARTIAL_EXT), 'wb') as ff:
+        ff.write(data[:4000])
+    mock_server.failures['f3.zip'] = 2
+    mock_server.truncate['f4.zip'] = 1
+    names = ['f2.zip', 'f3.zip', 'f4.zip']
+    checksums = {'f3.zip': hashlib.sha256(
+        mock_server.files['f3.zip']).hexdigest(),
+                 'f4.zip': 'md5:' + hashlib.md5(
+        mock_server.files['f4.zip']).hexdigest()}
+
+    _download_urls([mock_server.url + name for name in names], folder,
+                   overwrite_existing=False, meta_handler=_meta(folder),
+                   method='get', checksums=checksums, backoff=0)
+    for name in names:
+        with open(os.path.join(folder, name), 'rb') as ff:
+            assert ff.read() == mock_server.files[name]
+
+    assert mock_server.get_requests('f2.zip') == [
+        ('GET', 'f2.zip', 'bytes=4000-')]
+    assert len(mock_server.get_requests('f3.zip')) == 3
+    f4_requests = mock_server.get_requests('f4.zip')
+    assert len(f4_requests) == 2
+    resumed_at = int(f4_requests[1][2].split('=')[1].rstrip('-'))
+    assert 0 < resumed_at <= len(mock_server.files['f4.zip']) // 2
+
+    # wrong checksum: fails after all retries, metadata of others stored
+    meta = _meta(folder)
+    nr_entries = len(_downloaded(meta))
+    with pytest.raises(IOError):
+        _download_urls([mock_server.url + 'f0.zip',
+                        mock_server.url + 'f1.zip'], folder,
+                       overwrite_existing=False, meta_handler=meta,
+                       checksums={'f0.zip': 'sha256:' + '0' * 64},
+                       max_retries=1, backoff=0)
+    assert not os.path.exists(os.path.join(folder, 'f0.zip'))
+    assert len(mock_server.get_requests('f0.zip', 'POST')) == 2
+    assert os.path.exists(os.path.join(folder, 'f1.zip'))
+    assert meta.saves == 1
+    assert len(_downloaded(meta)) == nr_entries + 1
+
+
+def test_download_and_parse(tmpdir, monkeypatch):
+    """ Parsing of OECD years while the download is still running """
+    oecd_csv = os.path.join(_pymriopath, 'mock_mrios', 'oecd_mock',
+                            'ICIO2016_2003.csv')
+    files = dict()
+    for year in [2003, 2004]:
+        name = 'ICIO2016_{}'.format(year)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zz:
+            zz.write(oecd_csv, name + '.csv')
+        files[name + '.zip'] = buffer.getvalue()
+    files['index.htm'] = ' '.join(files.keys()).encode()
+    server = _MockServer(files)
+    monkeypatch.setitem(OECD_CONFIG, 'url_db_view',
+                        server.url + 'index.htm')
+    monkeypatch.setitem(OECD_CONFIG, 'datafiles', {'v2016': {
+        '2003': server.url + 'ICIO2016_2003.zip',
+        '2004': server.url + 'ICIO2016_2004.zip'}})
+
+    storage = str(tmpdir.mkdir('download'))
+    out = tmpdir.mkdir('parsed')
+    messages = []
+    try:
+        res = pymrio.download_and_parse(
+            'oecd', storage, years=[2003, 2004], out=str(out), workers=2,
+            download_kwargs=dict(version='v2016'),
+            progress_function=messages.append)
+    finally:
+        server.close()
+
+    assert sorted(os.listdir(storage)) == [
+        'ICIO2016_2003.zip', 'ICIO2016_2004.zip', 'metadata.json']
+    assert list(res.systems.keys()) == [2003, 2004]
+    assert {'parse', 'save', 'ready', 'total'} == set(res.timings.columns)
+    assert len(messages) == 2
+    assert out.join('timings.txt').check()
+
+    expected = pymrio.parse_oecd(oecd_csv)
+    for year in [2003, 2004]:
+        pdt.assert_frame_equal(expected.Z,
+                               pymrio.load_all(res.systems[year]).Z)
+
+    with pytest.raises(ValueError):
+        pymrio.download_and_parse('eora26', storage, years=[2003],
+                                  out=str(out))
@@ -9,6 +9,8 @@ Might be the slowest test to run - make optional if it takes to long.
 import sys
 import os
 import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
 import pytest
 import numpy.testing as npt
 
@@ -82,6 +84,8 @@ def test_fileio(tmpdir):
 
     mr2 = pymrio.load_all(save_path)
     npt.assert_allclose(mr.Z.values, mr2.Z.values, rtol=1e-5)
+    # integer columns of saved tables stay integers
+    assert list(mr2.Y.dtypes) == list(mr.Y.dtypes)
 
     # Testing the zip archive functions
     zip_arc = os.path.join(save_path, 'test_mrio.zip')
@@ -121,6 +125,12 @@ def test_fileio(tmpdir):
 
     mr3 = pymrio.load_all(zip_arc)
     npt.assert_allclose(mr.Z.values, mr3.Z.values, rtol=1e-5)
+    assert list(mr3.Y.dtypes) == list(mr.Y.dtypes)
+
+    mr4 = pymrio.load_all(zip_arc, workers=4, engine='c')
+    npt.assert_allclose(mr.Z.values, mr4.Z.values, rtol=1e-5)
+    npt.assert_allclose(mr3.emissions.F.values, mr4.emissions.F.values,
+                        rtol=1e-5)
 
     with pytest.raises(pymrio.ReadError):
         pymrio.load_all(zip_arc, path_in_arc='./foo')
@@ -129,6 +139,61 @@ def test_fileio(tmpdir):
         pymrio.load(path='./foo')
 
 
+def test_incremental_save(tmpdir):
+    """ Only changed tables are rewritten by save_all """
+    mr = pymrio.load_test()
+    save_path = str(tmpdir.mkdir('pymrio_incr'))
+    mr.save_all(save_path)
+
+    files = {ff: os.path.join(save_path, *ff) for ff in
+             [('Z.txt',), ('Y.txt',), ('emissions', 'F.txt')]}
+    for ff in files.values():
+        os.utime(ff, ns=(0, 0))
+
+    mr.Y = mr.Y * 2
+    mr.save_all(save_path)
+    assert os.stat(files[('Z.txt',)]).st_mtime_ns == 0
+    assert os.stat(files[('emissions', 'F.txt')]).st_mtime_ns == 0
+    assert os.stat(files[('Y.txt',)]).st_mtime_ns != 0
+    assert not [ff for ff in os.listdir(save_path) if ff.endswith('.tmp')]
+
+    mr2 = pymrio.load_all(save_path)
+    npt.assert_allclose(mr.Y.values, mr2.Y.values, rtol=1e-5)
+    npt.assert_allclose(mr.Z.values, mr2.Z.values, rtol=1e-5)
+
+    # changing the format or disabling incremental saving rewrites all
+    mr.save_all(save_path, incremental=False)
+    assert os.stat(files[('Z.txt',)]).st_mtime_ns != 0
+    os.utime(files[('Z.txt',)], ns=(0, 0))
+    mr.save_all(save_path, float_format='%.6g')
+    assert os.stat(files[('Z.txt',)]).st_mtime_ns != 0
+
+
+def test_sparse_save(tmpdir):
+    """ Sparse tables are stored as npz and read back with labels """
+    mr = pymrio.load_test()
+    mr.diag = mr.emissions.diag_stressor(('emission_type1', 'air'))
+    save_path = str(tmpdir.mkdir('pymrio_sparse'))
+    mr.save_all(save_path, sparse_threshold=0.9)
+
+    assert 'F.npz' in os.listdir(os.path.join(save_path, 'diag'))
+    assert 'Z.txt' in os.listdir(save_path)
+
+    mr2 = pymrio.load_all(save_path)
+    assert isinstance(mr2.diag.F.dtypes.iloc[0], pd.SparseDtype)
+    pdt.assert_frame_equal(mr.diag.F, mr2.diag.F.sparse.to_dense())
+
+    zip_arc = os.path.join(str(tmpdir), 'sparse_mrio.zip')
+    pymrio.archive(source=save_path, archive=zip_arc)
+    mr3 = pymrio.load_all(zip_arc, sparse='dense')
+    pdt.assert_frame_equal(mr.diag.F, mr3.diag.F)
+
+    # switching back to the dense format removes the npz file
+    mr.save_all(save_path)
+    assert 'F.npz' not in os.listdir(os.path.join(save_path, 'diag'))
+    assert 'F.txt' in os.listdir(os.path.join(save_path, 'diag'))
+
+
 def test_reports(tmpdir):
     """ Tests the reporting function
 
@@ -0,0 +1,224 @@
+""" Testing the IOSystem methods of iofunctions on a synthetic THEMIS system
+"""
+
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+_pymriopath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _pymriopath + '/../../')
+
+import pymrio  # noqa
+
+
+def _themis_mock(nr_regions=3, seed=3):
+    """ Small system with the structure of the THEMIS tables """
+    rng = np.random.RandomState(seed)
+    probe = pymrio.IOSystem(name='THEMIS')
+    sectors = (['Agriculture', 'Manufacturing'] +
+               [sec for sec in probe.energy_sectors('secondary')] +
+               ['Electricity by ' + ss for ss in
+                ['coal w CCS', 'gas w CCS', 'biomass w CCS']])
+    regions = np.array(['Reg{}'.format(nr) for nr in range(nr_regions)])
+    nn = len(sectors) * nr_regions
+
+    A = sp.random(nn, nn, density=0.2, random_state=rng, format='csr')
+    A = sp.csr_matrix(A.multiply(0.6 / np.maximum(A.sum(axis=0), 1e-9)))
+    idx_impacts = ['Energy Carrier Supply: total'] + [
+        'impact {}'.format(nr) for nr in range(1, 1631)]
+    S = sp.lil_matrix((1631, nn))
+    S[0, :] = rng.uniform(0.5, 2, nn)
+    for row in list(range(1618, 1627)) + [1630]:
+        S[row, :] = rng.uniform(0, 1, nn)
+    labels = dict(name='labels', regions=regions,
+                  sectors=np.array(sectors),
+                  idx_regions=np.repeat(regions, len(sectors)),
+                  idx_sectors=np.tile(np.array(sectors), nr_regions),
+                  idx_impacts=np.array(idx_impacts))
+    energy = dict(name='energy',
+                  secondary_demand=rng.uniform(1, 10, nn) * np.tile(
+                      [sec != 'Agriculture' for sec in sectors], nr_regions))
+    themis = pymrio.IOSystem(A=A, name='THEMIS', labels=labels,
+                             impact=dict(name='impact', S=sp.csr_matrix(S)),
+                             energy=energy)
+    themis.scenario = 'BL'
+    return themis
+
+
+@pytest.fixture()
+def themis():
+    return _themis_mock()
+
+
+def test_embodied_prods(themis):
+    prods = np.random.RandomState(1).uniform(0, 1, (themis.A.shape[0], 4))
+    embodied = themis.embodied_prods(prods)
+    np.testing.assert_allclose(
+        (sp.eye(themis.A.shape[0]) - themis.A).dot(embodied), prods,
+        atol=1e-10)
+    themis.L = np.linalg.inv(np.eye(themis.A.shape[0]) - themis.A.toarray())
+    np.testing.assert_allclose(themis.embodied_prods(prods), embodied)
+
+
+def test_embodied_prod_cache(themis):
+    secs = 'Electricity by coal'
+    embodied = themis.embodied_prod(secs, 'Reg1')
+    impact = themis.embodied_impact(secs, 'Reg1')
+    # the production is part of the key: changing the energy demand
+    # (even in place) gives new results
+    themis.energy.secondary_demand *= 2
+    np.testing.assert_allclose(themis.embodied_prod(secs, 'Reg1'),
+                               2 * embodied)
+    np.testing.assert_allclose(themis.embodied_impact(secs, 'Reg1'),
+                               2 * impact)
+    themis.embodied_prod(secs, 'Reg1')
+    assert themis.result_cache().cache_info().hits == 1
+
+
+def test_erois_and_prices(themis):
+    res = themis.erois_and_prices()
+    secs = themis.energy_sectors('electricities')
+    assert list(res.index.levels[0]) == sorted(list(themis.regions) +
+                                               ['World'])
+    assert len(res) == (len(themis.regions) + 1) * (len(secs) + 1)
+
+    regs_sel = [[reg] for reg in themis.regions] + [list(themis.regions)]
+    secs_sel = [[sec] for sec in secs] + [secs]
+    erois, prices = pymrio.tools.iofunctions._erois_and_prices_loop(
+        themis, secs, regs_sel, secs_sel, 'Total Energy supply',
+        'secondary', True, 1)
+    np.testing.assert_allclose(res['eroi'].values, erois, atol=0.11)
+    np.testing.assert_allclose(res['price'].values, prices, rtol=1e-5)
+
+    assert themis.erois_and_prices() is themis.eroi_price
+    assert res.loc[('World', 'total'), 'eroi'] == themis.ger(
+        secs, themis.regions)
+
+
+def test_structural_paths(themis):
+    secs = ['Electricity by coal', 'Electricity by wind onshore']
+    res = themis.structural_paths(secs, 'Reg1', top_k=15, threshold=0)
+    assert res.complete
+    assert len(res.paths) == 15
+    assert all(path[0][0] == 'Reg1' and path[0][1] in secs
+               for path in res.paths.path)
+    assert res.paths.contribution.is_monotonic_decreasing
+
+    prod = themis.production(secs, 'Reg1')
+    np.testing.assert_allclose(res.total, themis.embodied_impact(
+        secs, 'Reg1', source='secondary', production=prod).sum() +
+        (themis.secondary_energy_supply * prod).sum())
+
+    production_paths = themis.structural_paths(secs, 'Reg1', var=None,
+                                               top_k=5, max_paths=2)
+    assert not production_paths.complete
+    assert len(production_paths.paths) == 2
+
+
+def test_inputs(themis):
+    tiers = themis.inputs('Electricity by coal', order_recursion=3,
+                          nb_main=4)
+    assert len(tiers) == 3
+    assert tiers[0][0] == ('Electricity by coal', float(len(themis.regions)))
+    values = [val for _, val in tiers[1]]
+    assert values == sorted(values, reverse=True) and len(values) == 4
+    direct = themis.A.dot(themis.is_in('Electricity by coal').astype(float))
+    sector_sums = pd.Series(direct, index=themis.labels.idx_sectors).groupby(
+        level=0).sum()
+    assert tiers[1][0][1] == pytest.approx(sector_sums.max())
+
+
+def test_indicators(themis):
+    S = themis.impact.S.tocsr()
+    np.testing.assert_allclose(
+        themis.VA, S[list(range(1618, 1624)) + [1630]].sum(axis=0).A1)
+    np.testing.assert_allclose(themis.employment_medium, S[1625].toarray()[0])
+    np.testing.assert_allclose(
+        themis.employment_all, themis.employment_low +
+        themis.employment_medium + themis.employment_high)
+    supply = S[0].toarray()[0]
+    csp = themis.index_secs_regs('Electricity by solar CSP')
+    supply[csp] = supply[csp].max()
+    np.testing.assert_allclose(themis.energy_supply, supply)
+    assert themis.VA is themis.VA
+    assert not themis.VA.flags.writeable
+
+    # rows by label or position
+    np.testing.assert_allclose(
+        themis.indicator(['impact 1624', 1625]),
+        themis.indicator([1624, 1625]))
+    with pytest.raises(KeyError):
+        themis.indicator('unknown impact')
+
+    # replacing S rebuilds the cache
+    indicators = themis.indicators()
+    themis.impact.S = 2 * S
+    assert themis.indicators() is not indicators
+    np.testing.assert_allclose(themis.employment_high,
+                               2 * S[1626].toarray()[0])
+
+
+def test_key_sectors(themis):
+    res = themis.key_sectors()
+    assert res.index.names == ['region', 'sector']
+    assert len(res) == themis.A.shape[0]
+    L = np.linalg.inv(np.eye(themis.A.shape[0]) - themis.A.toarray())
+    np.testing.assert_allclose(res.backward, L.sum(axis=0))
+    x = themis.production()
+    np.testing.assert_allclose(res.extraction_total,
+                               x * L.sum(axis=0) / np.diag(L))
+
+    energy = themis.key_sectors('Total Energy supply')
+    pd.testing.assert_frame_equal(res[['backward', 'forward']],
+                                  energy[['backward', 'forward']])
+    assert 'extraction_forward' not in energy.columns
+    hits = themis.result_cache().cache_info().hits
+    themis.key_sectors()
+    assert themis.result_cache().cache_info().hits > hits
+
+
+def test_prices(themis):
+    L = np.linalg.inv(np.eye(themis.A.shape[0]) - themis.A.toarray())
+    prices = themis.prices()
+    assert prices.index.names == ['region', 'sector']
+    np.testing.assert_allclose(prices, themis.VA @ L)
+    assert themis.prices() is not prices
+    assert themis.result_cache().cache_info().hits >= 1
+
+    secs = 'Electricity by coal'
+    prod = themis.production(secs, 'Reg1')
+    expected = (themis.VA @ L @ prod) / (themis.energy_supply @ prod / 3.6e3)
+    assert themis.price_energy(secs, 'Reg1', digits=5) == pytest.approx(
+        expected, abs=1e-5)
+
+    # energy price shock
+    energy = themis.energy_sectors('secondary')
+    shocked = themis.prices(shock=0.1, secs=energy)
+    fixed = themis.index_secs_regs(energy)
+    np.testing.assert_allclose(shocked.values[fixed],
+                               1.1 * prices.values[fixed])
+    free = np.setdiff1d(np.arange(len(prices)), fixed)
+    assert (shocked.values[free] >= prices.values[free] - 1e-12).all()
+    assert (shocked.values[free] > prices.values[free]).any()
+
+
+def test_themis_compute_all():
+    from pymrio.tools.ioparser import themis_compute_all
+
+    def make():
+        return {'BL': {2010: _themis_mock(seed=3), 2030: _themis_mock(seed=4)}}
+
+    seq = themis_compute_all(make(), progress_function=None)
+    seq['BL'][2010].prices()
+    pickle.loads(pickle.dumps(seq['BL'][2010]))  # the result cache is not pickled
+    par = themis_compute_all(make(), workers=2, progress_function=None)
+    for y in [2010, 2030]:
+        assert '_result_cache' not in vars(par['BL'][y])
+        for att in ['eroi', 'eroi_adj', 'energy_price', 'employ_direct']:
+            pd.testing.assert_series_equal(getattr(seq['BL'][y], att),
+                                           getattr(par['BL'][y], att))
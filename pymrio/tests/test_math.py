@@ -3,6 +3,7 @@
 import sys
 import os
 import numpy as np
+import scipy.sparse as sp
 import pandas as pd
 import pytest
 import numpy.testing as npt
@@ -25,6 +26,16 @@ from pymrio.tools.iomath import calc_F_Y         # noqa
 from pymrio.tools.iomath import calc_M          # noqa
 from pymrio.tools.iomath import calc_e          # noqa
 from pymrio.tools.iomath import calc_accounts   # noqa
+from pymrio.tools.iomath import calc_Z_from_SUT  # noqa
+from pymrio.tools.iospa import calc_multipliers  # noqa
+from pymrio.tools.iospa import structural_path_analysis  # noqa
+from pymrio.tools.iolinkages import calc_B  # noqa
+from pymrio.tools.iolinkages import calc_G  # noqa
+from pymrio.tools.iolinkages import calc_G_from_L  # noqa
+from pymrio.tools.iolinkages import calc_linkages  # noqa
+from pymrio.tools.iolinkages import hypothetical_extraction  # noqa
+from pymrio.tools.iolinkages import extraction_losses  # noqa
+from pymrio.tools.ioprices import calc_prices  # noqa
 
 
 # test data
@@ -117,6 +128,27 @@ def td_IO_Data_Miller():
     return IO_Data_Miller
 
 
+@pytest.fixture()
+def td_random_IO():
+    """ A random system with 8 sectors (about half of the technical
+    coefficients are 0), balanced by a positive final demand and the value
+    added.
+    """
+    class IO_Data_Random():
+        _rng = np.random.RandomState(2)
+        nn = 8
+        A = (_rng.uniform(0, 0.2, (nn, nn)) *
+             (_rng.uniform(size=(nn, nn)) > 0.5))
+        x = _rng.uniform(1, 10, nn)
+        f = _rng.uniform(0, 1, nn)
+        Z = A * x
+        y = x - A @ x
+        B = Z / x.reshape((-1, 1))
+        v = x - B.T @ x
+        L = np.linalg.inv(np.eye(nn) - A)
+    return IO_Data_Random
+
+
 @pytest.fixture()
 def td_small_MRIO():
     """ A small MRIO with three sectors and two regions.
@@ -472,3 +504,190 @@ def test_calc_accounts_MRIO(td_small_MRIO):
             nD_imp.sum(axis=1) -
             nD_exp.sum(axis=1),
             )
+
+
+def test_calc_Z_from_SUT():
+    """ Supply-use to IO transformation against the explicit formulas """
+    products = pd.Index(['p1', 'p2', 'p3'], name='product')
+    industries = pd.Index(['i1', 'i2', 'i3'], name='industry')
+    V = pd.DataFrame([[90, 10, 0],
+                      [5, 60, 5],
+                      [0, 0, 40]],
+                     index=products, columns=industries, dtype=float)
+    U = pd.DataFrame([[10, 20, 5],
+                      [15, 5, 10],
+                      [5, 10, 2]],
+                     index=products, columns=industries, dtype=float)
+    q = V.values.sum(axis=1)
+    g = V.values.sum(axis=0)
+    V_inv = np.linalg.inv(V.values)
+
+    expected = {
+        ('product', 'pxp'): U.values @ V_inv @ np.diag(q),
+        ('industry', 'pxp'): U.values @ np.diag(1 / g) @ V.values.T,
+        ('product', 'ixi'): np.diag(g) @ V_inv @ U.values,
+        ('industry', 'ixi'): V.values.T @ np.diag(1 / q) @ U.values,
+    }
+    for (technology, output), Z_exp in expected.items():
+        Z_df = calc_Z_from_SUT(V, U, technology=technology, output=output)
+        npt.assert_allclose(Z_df.values, Z_exp)
+        assert Z_df.index.equals(products if output == 'pxp' else industries)
+        npt.assert_allclose(
+            calc_Z_from_SUT(V.values, U.values, technology, output), Z_exp)
+        npt.assert_allclose(
+            calc_Z_from_SUT(sp.csr_matrix(V.values), sp.csr_matrix(U.values),
+                            technology, output), Z_exp)
+
+    with pytest.raises(ValueError):
+        calc_Z_from_SUT(V, U, technology='mixed')
+
+
+def test_structural_path_analysis(td_random_IO):
+    # first sectors of the random system, such that all paths can be
+    # enumerated
+    nn = 4
+    A, f = td_random_IO.A[:nn, :nn], td_random_IO.f[:nn]
+    y = np.array([1., 0, 2, 0.5])
+    L = np.linalg.inv(np.eye(nn) - A)
+    npt.assert_allclose(calc_multipliers(A, f), f @ L)
+
+    # brute force enumeration of all paths up to depth 3
+    paths = {(ii,): y[ii] for ii in range(nn) if y[ii]}
+    frontier = dict(paths)
+    for depth in range(3):
+        frontier = {path + (jj,): flow * A[jj, path[-1]]
+                    for path, flow in frontier.items() for jj in range(nn)
+                    if A[jj, path[-1]]}
+        paths.update(frontier)
+    expected = sorted(((flow * f[path[-1]], path)
+                       for path, flow in paths.items()), reverse=True)[:10]
+
+    res = structural_path_analysis(sp.csr_matrix(A), y, f, top_k=10,
+                                   threshold=0, max_depth=3)
+    assert res.complete
+    npt.assert_allclose(res.total, f @ L @ y)
+    npt.assert_allclose(res.paths.contribution, [ee[0] for ee in expected])
+    assert list(res.paths.path) == [ee[1] for ee in expected]
+    assert list(res.paths.depth) == [len(ee[1]) - 1 for ee in expected]
+    npt.assert_allclose(res.coverage, res.paths.share.sum())
+
+    # all paths sum up to the total impact
+    res_all = structural_path_analysis(A, y, f, top_k=10**5, threshold=1e-9,
+                                       max_depth=50)
+    npt.assert_allclose(res_all.paths.contribution.sum(), res.total,
+                        rtol=1e-6)
+
+    # pruning and budget
+    res_pruned = structural_path_analysis(A, y, f, top_k=10**5,
+                                          threshold=1e-2, max_depth=50)
+    assert len(res_pruned.paths) < len(res_all.paths)
+    assert res_pruned.nr_expanded < res_all.nr_expanded
+    res_budget = structural_path_analysis(A, y, f, top_k=10, max_paths=3)
+    assert not res_budget.complete
+    assert res_budget.nr_expanded == 3
+
+
+def test_linkages(td_IO_Data_Miller):
+    Z = td_IO_Data_Miller.Z_df
+    x = td_IO_Data_Miller.x_arr.ravel()
+    A = calc_A(Z, x)
+    L = calc_L(A)
+    B = calc_B(Z, x)
+    npt.assert_allclose(B.values, Z.values / x.reshape((-1, 1)))
+    G = calc_G(B)
+    pdt.assert_frame_equal(G, calc_G_from_L(L, x))
+
+    links = calc_linkages(A, x)
+    npt.assert_allclose(links.backward, L.sum(axis=0))
+    npt.assert_allclose(links.forward, G.sum(axis=1))
+    npt.assert_allclose(links.backward_index.mean(), 1)
+    assert list(links.index) == list(A.index)
+    pdt.assert_frame_equal(links, calc_linkages(None, x, L=L))
+
+
+def test_hypothetical_extraction(td_random_IO):
+    A, x, y, f, nn = (td_random_IO.A, td_random_IO.x, td_random_IO.y,
+                      td_random_IO.f, td_random_IO.nn)
+    B = calc_B(td_random_IO.Z, x)
+    npt.assert_allclose(B, td_random_IO.B)
+    v = td_random_IO.v
+
+    total, backward, forward, impact = [], [], [], []
+    for jj in range(nn):
+        keep = np.arange(nn) != jj
+        x_ext = np.linalg.solve(np.eye(nn - 1) - A[np.ix_(keep, keep)],
+                                y[keep])
+        total.append(x.sum() - x_ext.sum())
+        impact.append(f @ x - f[keep] @ x_ext)
+        A_back = A.copy()
+        A_back[:, jj] = 0
+        backward.append(x.sum() - np.linalg.solve(np.eye(nn) - A_back,
+                                                  y).sum())
+        B_forw = B.copy()
+        B_forw[jj, :] = 0
+        forward.append(x.sum() - np.linalg.solve(np.eye(nn) - B_forw.T,
+                                                 v).sum())
+
+    res = hypothetical_extraction(A, x, block_size=4)
+    npt.assert_allclose(res.total, total)
+    npt.assert_allclose(res.backward, backward)
+    npt.assert_allclose(res.forward, forward)
+    npt.assert_allclose(res.total_share, np.array(total) / x.sum())
+    pdt.assert_frame_equal(
+        res, hypothetical_extraction(None, x, L=td_random_IO.L))
+
+    res_f = hypothetical_extraction(sp.csr_matrix(A), x, f=f)
+    assert 'forward' not in res_f.columns
+    npt.assert_allclose(res_f.total, impact)
+
+
+def test_extraction_losses(td_random_IO):
+    A, x, y, B, v, L, nn = (td_random_IO.A, td_random_IO.x, td_random_IO.y,
+                            td_random_IO.B, td_random_IO.v, td_random_IO.L,
+                            td_random_IO.nn)
+    extracted = [1, 4, 5]
+
+    keep = np.setdiff1d(np.arange(nn), extracted)
+    x_ext = np.zeros(nn)
+    x_ext[keep] = np.linalg.solve(np.eye(nn - 3) - A[np.ix_(keep, keep)],
+                                  y[keep])
+    npt.assert_allclose(extraction_losses(x, extracted, A=A), x - x_ext)
+    npt.assert_allclose(extraction_losses(x, extracted, L=L), x - x_ext)
+
+    A_back = A.copy()
+    A_back[:, extracted] = 0
+    npt.assert_allclose(
+        extraction_losses(x, extracted, A=A, kind='backward'),
+        x - np.linalg.solve(np.eye(nn) - A_back, y))
+
+    B_forw = B.copy()
+    B_forw[extracted, :] = 0
+    expected = x - np.linalg.solve(np.eye(nn) - B_forw.T, v)
+    npt.assert_allclose(
+        extraction_losses(x, extracted, A=A, kind='forward'), expected)
+    npt.assert_allclose(
+        extraction_losses(x, extracted, L=L, kind='forward'), expected)
+
+    with pytest.raises(ValueError):
+        extraction_losses(x, extracted, A=A, kind='foo')
+
+
+def test_calc_prices(td_IO_Data_Miller, td_random_IO):
+    A = td_IO_Data_Miller.A_arr
+    L = td_IO_Data_Miller.L_arr
+    v = 1 - A.sum(axis=0)
+    npt.assert_allclose(calc_prices(v, A=A), [1, 1])
+    npt.assert_allclose(calc_prices([0.3, 0.25], L=L), np.dot([0.3, 0.25], L))
+
+    A, v, nn = td_random_IO.A, td_random_IO.v, td_random_IO.nn
+    fixed = [2, 5]
+    free = np.setdiff1d(np.arange(nn), fixed)
+    p_fixed = np.array([1.2, 0.9])
+    expected = np.linalg.solve((np.eye(len(free)) - A[np.ix_(free, free)]).T,
+                               v[free] + A[np.ix_(fixed, free)].T @ p_fixed)
+    prices = calc_prices(v, A=A, exogenous={2: 1.2, 5: 0.9})
+    npt.assert_allclose(prices[free], expected)
+    npt.assert_allclose(prices[fixed], p_fixed)
+    npt.assert_allclose(
+        calc_prices(v, L=td_random_IO.L, exogenous={2: 1.2, 5: 0.9}),
+        prices)
@@ -1,11 +1,16 @@
 """ Tests the parsing of different MRIOs """
 
 import os
+import shutil
 import sys
+import zipfile
 
+import pandas as pd
 import pandas.util.testing as pdt
 import pytest
 
+from unittest.mock import patch
+
 import numpy as np
 
 try:
@@ -34,7 +39,7 @@ def test_parse_exio1(fix_testmrio_calc):
 
     test_mrio = fix_testmrio_calc.testmrio
 
-    exio1 = pymrio.parse_exiobase1(exio1_mockpath)
+    exio1 = pymrio.parse_exiobase1(exio1_mockpath, workers=2)
     exio1.calc_all()
 
     assert (test_mrio.emissions.S.iloc[1, 1] ==
@@ -45,6 +50,19 @@ def test_parse_exio1(fix_testmrio_calc):
 
     assert exio1.get_regions()[0] == 'reg1'
 
+    # the csv engine is passed to the table reader (which parses with the
+    # c engine here, pyarrow is optional)
+    from pymrio.tools import ioparser
+    read_csv_table = ioparser.read_csv_table
+    with patch.object(ioparser, 'read_csv_table', side_effect=lambda *args,
+                      **kwargs: read_csv_table(*args,
+                                               **dict(kwargs, engine='c'))
+                      ) as reader:
+        _ = pymrio.parse_exiobase1(exio1_mockpath, engine='pyarrow')
+    assert reader.call_count > 0
+    assert all(cc[1]['engine'] == 'pyarrow'
+               for cc in reader.call_args_list)
+
     with pytest.raises(pymrio.ParserError):
         _ = pymrio.parse_exiobase1('foo')
 
@@ -55,7 +73,8 @@ def test_parse_exio2(fix_testmrio_calc):
 
     test_mrio = fix_testmrio_calc.testmrio
 
-    exio2 = pymrio.parse_exiobase2(exio2_mockpath, popvector=None)
+    exio2 = pymrio.parse_exiobase2(exio2_mockpath, popvector=None,
+                                   excel_cache=False)
     exio2.calc_all()
 
     assert (test_mrio.emissions.S.iloc[1, 1] ==
@@ -70,6 +89,12 @@ def test_parse_exio2(fix_testmrio_calc):
 
     assert exio2.get_regions()[0] == 'reg1'
 
+    exio2_concurrent = pymrio.parse_exiobase2(exio2_mockpath,
+                                              popvector=None, workers=4,
+                                              excel_cache=False)
+    pdt.assert_frame_equal(exio2.A, exio2_concurrent.A)
+    pdt.assert_frame_equal(exio2.emissions.S, exio2_concurrent.emissions.S)
+
     with pytest.raises(pymrio.ParserError):
         _ = pymrio.parse_exiobase2('foo')
 
@@ -77,6 +102,40 @@ def test_parse_exio2(fix_testmrio_calc):
         _ = pymrio.parse_exiobase2('foo.zip')
 
 
+def test_parse_exio2_charact(tmpdir):
+    exio2_zip = os.path.join(testpath, 'mock_mrios', 'exio2_mock',
+                             'mrIOT_PxP_ita_coefficient_version2.2.2.zip')
+    exio2_mockpath = str(tmpdir.join('exio2.zip'))
+    shutil.copy(exio2_zip, exio2_mockpath)
+
+    exio2 = pymrio.parse_exiobase2(exio2_mockpath, popvector=None,
+                                   excel_cache=False)
+    assert exio2.impact.S.index.name == 'impact'
+    assert exio2.impact.S.index.is_unique
+    assert exio2.impact.unit.shape == (exio2.impact.S.shape[0], 1)
+    pdt.assert_series_equal(
+        exio2.impact.S.loc['total emissions'],
+        exio2.emissions.S.sum(axis=0), check_names=False)
+
+    exio2_cache = pymrio.parse_exiobase2(exio2_mockpath, popvector=None)
+    assert os.path.isdir(str(tmpdir.join('.excel_cache')))
+    with patch('pandas.ExcelFile', side_effect=AssertionError):
+        exio2_cached = pymrio.parse_exiobase2(exio2_mockpath, popvector=None)
+    for exio in [exio2_cache, exio2_cached]:
+        pdt.assert_frame_equal(exio2.impact.S, exio.impact.S)
+        pdt.assert_frame_equal(exio2.impact.F_Y, exio.impact.F_Y)
+        pdt.assert_frame_equal(exio2.impact.unit, exio.impact.unit)
+
+    charact_file = str(tmpdir.join('characterisation.xlsx'))
+    with zipfile.ZipFile(exio2_zip) as zz:
+        with open(charact_file, 'wb') as cf:
+            cf.write(zz.read('characterisation_mock_version2.2.2.xlsx'))
+    exio2_file = pymrio.parse_exiobase2(exio2_mockpath, popvector=None,
+                                        charact=charact_file,
+                                        excel_cache=False)
+    pdt.assert_frame_equal(exio2.impact.S, exio2_file.impact.S)
+
+
 def test_parse_exio3(fix_testmrio_calc):
     exio3_mockpath = os.path.join(testpath, 'mock_mrios', 'exio3_mock')
 
@@ -140,9 +199,11 @@ def test_parse_exio_ext():
 @pytest.mark.filterwarnings("ignore:Extension data")
 def test_parse_wiod():
     wiod_mockpath = os.path.join(testpath, 'mock_mrios', 'wiod_mock')
-    ww_path = pymrio.parse_wiod(path=wiod_mockpath, year=2009)
+    ww_path = pymrio.parse_wiod(path=wiod_mockpath, year=2009,
+                                excel_cache=False)
     ww_file = pymrio.parse_wiod(path=os.path.join(wiod_mockpath,
-                                                  'wiot09_row_sep12.xlsx'))
+                                                  'wiot09_row_sep12.xlsx'),
+                                excel_cache=False)
 
     ww_path.calc_all()
     ww_file.calc_all()
@@ -156,6 +217,40 @@ def test_parse_wiod():
     assert ww_file.SEA.F.loc['EMP', ('RoW', '19')] == 0
 
 
+@pytest.mark.filterwarnings("ignore:Extension data")
+def test_parse_wiod_excel_cache(tmpdir):
+    wiod_mockpath = str(tmpdir.join('wiod'))
+    shutil.copytree(os.path.join(testpath, 'mock_mrios', 'wiod_mock'),
+                    wiod_mockpath)
+    ww_excel = pymrio.parse_wiod(path=wiod_mockpath, year=2009,
+                                 excel_cache=False)
+    ww_first = pymrio.parse_wiod(path=wiod_mockpath, year=2009)
+    assert os.path.isdir(os.path.join(wiod_mockpath, '.excel_cache'))
+
+    # second parse must not open any Excel file
+    with patch('pandas.ExcelFile', side_effect=AssertionError):
+        ww_cached = pymrio.parse_wiod(path=wiod_mockpath, year=2009)
+
+    for ww in [ww_first, ww_cached]:
+        pdt.assert_frame_equal(ww_excel.Z, ww.Z)
+        pdt.assert_frame_equal(ww_excel.Y, ww.Y)
+        pdt.assert_frame_equal(ww_excel.lan.F, ww.lan.F)
+        pdt.assert_frame_equal(ww_excel.AIR.F_Y, ww.AIR.F_Y)
+        pdt.assert_frame_equal(ww_excel.SEA.F, ww.SEA.F)
+
+    # changed source files renew the cache
+    wiot_file = os.path.join(wiod_mockpath, 'wiot09_row_sep12.xlsx')
+    os.utime(wiot_file, ns=(0, 0))
+    with pytest.raises(AssertionError):
+        with patch('pandas.ExcelFile', side_effect=AssertionError):
+            pymrio.parse_wiod(path=wiod_mockpath, year=2009)
+
+    ext_cache = str(tmpdir.join('ext_cache'))
+    ww_ext = pymrio.parse_wiod(path=wiot_file, excel_cache=ext_cache)
+    assert len(os.listdir(ext_cache)) > 0
+    pdt.assert_frame_equal(ww_excel.Z, ww_ext.Z)
+
+
 def test_oecd_2016():
     oecd_mockpath = os.path.join(testpath, 'mock_mrios', 'oecd_mock')
     oecd_IO_file = os.path.join(oecd_mockpath, 'ICIO2016_2003.csv')
@@ -225,6 +320,53 @@ def test_oecd_2018():
         'MEX_TAXSUB', ('BEL', '16')], 1.66161232097811)
 
 
+def test_parse_cache(tmpdir):
+    oecd_mockpath = os.path.join(testpath, 'mock_mrios', 'oecd_mock')
+    oecd_IO_file = os.path.join(oecd_mockpath, 'ICIO2016_2003.csv')
+    cache = pymrio.ParseCache(str(tmpdir.mkdir('parse_cache')))
+
+    oecd_parsed = pymrio.parse_oecd(path=oecd_IO_file, parse_cache=cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    oecd_cached = pymrio.parse_oecd(path=oecd_IO_file, parse_cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    pdt.assert_frame_equal(oecd_parsed.Z, oecd_cached.Z)
+    assert 'cache' in oecd_cached.meta.file_io_history[0]
+    assert 'cache' not in oecd_parsed.meta.file_io_history[0]
+
+    # different arguments give a new entry
+    _ = pymrio.parse_oecd(path=oecd_mockpath, year=2003, parse_cache=cache)
+    assert cache.misses == 2
+
+    # cache set for all parsers, bypassed with parse_cache=False
+    pymrio.set_parse_cache(cache)
+    try:
+        _ = pymrio.parse_oecd(path=oecd_IO_file)
+        assert cache.hits == 2
+        _ = pymrio.parse_oecd(path=oecd_IO_file, parse_cache=False)
+        assert (cache.hits, cache.misses) == (2, 2)
+    finally:
+        pymrio.set_parse_cache(None)
+
+    # lru eviction removes the least recently used entry (parse by year)
+    cache.max_size = cache.size / 2 + 1000
+    cache.put('small_entry', 1)
+    assert cache.size <= cache.max_size
+    _ = pymrio.parse_oecd(path=oecd_IO_file, parse_cache=cache)
+    assert (cache.hits, cache.misses) == (3, 2)
+    _ = pymrio.parse_oecd(path=oecd_mockpath, year=2003, parse_cache=cache)
+    assert cache.misses == 3
+
+    # only the files of the parsed year are part of the key, no temporary
+    # files are left in the cache folder
+    year_path = tmpdir.mkdir('oecd_years')
+    shutil.copy(oecd_IO_file, str(year_path))
+    year_path.join('ICIO2016_2005.csv').write('other year')
+    year_path.join('ICIO2016_2006.csv.part').write('partial download')
+    _ = pymrio.parse_oecd(path=str(year_path), year=2003, parse_cache=cache)
+    assert (cache.hits, cache.misses) == (4, 3)
+    assert not list(cache.cache_dir.glob('*.tmp'))
+
+
 def test_parse_eora26(fix_testmrio_calc):
     eora_mockpath = os.path.join(
         testpath, 'mock_mrios', 'eora26_mock')
@@ -246,3 +388,199 @@ def test_parse_eora26(fix_testmrio_calc):
     with pytest.raises(pymrio.ParserError):
         _ = pymrio.parse_eora26(eora_mockpath, year=2010,
                                 country_names='bogus')
+
+
+def test_parse_many(tmpdir):
+    oecd_mockpath = os.path.join(testpath, 'mock_mrios', 'oecd_mock')
+    out = tmpdir.mkdir('oecd_parsed')
+    messages = []
+
+    res = pymrio.parse_many('oecd', oecd_mockpath, years=[2003, 2010],
+                            workers=2, out=str(out), calc_all=True,
+                            progress_function=messages.append)
+
+    assert list(res.systems.keys()) == [2003, 2010]
+    assert list(res.timings.index) == [2003, 2010]
+    assert {'parse', 'calc_all', 'save', 'total'} == set(
+        res.timings.columns)
+    assert len(messages) == 2
+    assert out.join('timings.txt').check()
+
+    oecd_2003 = pymrio.parse_oecd(oecd_mockpath, year=2003)
+    oecd_2003.calc_all()
+    loaded_2003 = pymrio.load_all(res.systems[2003])
+    pdt.assert_frame_equal(oecd_2003.Z, loaded_2003.Z)
+    pdt.assert_frame_equal(oecd_2003.factor_inputs.D_cba,
+                           loaded_2003.factor_inputs.D_cba)
+
+    seq = pymrio.parse_many('oecd', oecd_mockpath, years=[2003],
+                            progress_function=None)
+    pdt.assert_frame_equal(seq.systems[2003].Z,
+                           pymrio.parse_oecd(oecd_mockpath, year=2003).Z)
+
+    with pytest.raises(ValueError):
+        pymrio.parse_many('foo', oecd_mockpath, years=[2003])
+
+
+def test_themis_file_cache(tmpdir):
+    from pymrio.tools.ioparser import _MatMatrices, _LazySystems
+    import pickle
+    import scipy.io
+    import scipy.sparse as sp
+
+    mat_file = str(tmpdir.join('THEMIS2.mat'))
+    A = sp.random(20, 20, density=0.1, format='csc', random_state=1)
+    S_f = np.random.random((4, 3, 3))
+    scipy.io.savemat(mat_file, {'A_2010_BL': A, 'S_f_BL': S_f})
+
+    cache_dir = str(tmpdir.join('npz_cache'))
+    converted = _MatMatrices(mat_file, cache_dir)
+    assert sorted(converted.keys()) == ['A_2010_BL', 'S_f_BL']
+    assert len(os.listdir(cache_dir)) == 3
+
+    with patch('scipy.io.loadmat', side_effect=AssertionError):
+        cached = _MatMatrices(mat_file, cache_dir)
+        assert sp.issparse(cached['A_2010_BL'])
+        assert (cached['A_2010_BL'] != A).nnz == 0
+        np.testing.assert_array_equal(cached['S_f_BL'][:, :, 2],
+                                      S_f[:, :, 2])
+
+    built = []
+
+    def build(key):
+        built.append(key)
+        if key == 2030:
+            systems[2030] = systems[2010] + 1
+        else:
+            systems[key] = key
+
+    systems = _LazySystems([2010, 2030, 2050], build)
+    assert list(systems) == [2010, 2030, 2050]
+    assert built == []
+    assert systems[2030] == 2011
+    assert built == [2030, 2010]
+    with pytest.raises(KeyError):
+        systems[2040]
+    assert pickle.loads(pickle.dumps(systems)) == {
+        2010: 2010, 2030: 2011, 2050: 2050}
+
+
+class _FakeThemisSystem:
+    """ Records the compute_all steps of a THEMIS system """
+
+    def __init__(self, value, wo_GW_adj=False):
+        self.value = value
+        self.agg_mix = pd.Series({'wind': value})
+        if wo_GW_adj:
+            self.wo_GW_adj = _FakeThemisSystem(value * 10)
+
+    def aggregate_mix(self, recompute=False):
+        return self.agg_mix * 2
+
+    def erois(self, factor_elec=1, recompute=False):
+        return pd.Series({'Power sector': self.value * factor_elec})
+
+    def energy_prices(self):
+        self.energy_price = self.value + 0.5
+
+    def employments(self, indirect=True, recompute=True):
+        self.employ = pd.Series({'indirect': indirect, 'v': self.value})
+        return self.employ
+
+
+def test_themis_compute_all():
+    from pymrio.tools.ioparser import themis_compute_all
+
+    def make():
+        return {s: {y: _FakeThemisSystem(y + nr, wo_GW_adj=(s == 'ADV'))
+                    for y in [2010, 2030, 2050]}
+                for nr, s in enumerate(['BL', 'ADV', 'combo'])}
+
+    messages = []
+    seq = themis_compute_all(make(), progress_function=messages.append)
+    par = themis_compute_all(make(), workers=3, progress_function=None)
+    assert len(messages) == 9
+
+    for s in seq:
+        for y in seq[s]:
+            for ss, pp in [(seq[s][y], par[s][y]),
+                           (getattr(seq[s][y], 'wo_GW_adj', None),
+                            getattr(par[s][y], 'wo_GW_adj', None))]:
+                if ss is None:
+                    assert pp is None
+                    continue
+                assert sorted(vars(ss)) == sorted(vars(pp))
+                pdt.assert_series_equal(ss.eroi_adj, pp.eroi_adj)
+                pdt.assert_series_equal(ss.employ_direct, pp.employ_direct)
+                assert ss.energy_price == pp.energy_price
+    assert 'total' in par['BL'][2030].eroi.index
+    assert par['combo'][2050].world_mix is not None
+    assert not hasattr(par['BL'][2010], 'wo_GW_adj')
+    assert hasattr(par['ADV'][2030].wo_GW_adj, 'eroi')
+
+
+def _write_cecilia_mock(root):
+    """ Random Cecilia 2050 files with the layout expected by the parser """
+    rng = np.random.RandomState(2)
+    nr_sec = 129 * 4
+
+    def write_aggregated(name, data, nr_label_cols):
+        with open(os.path.join(root, 'preprocess', name), 'w') as ff:
+            ff.write('header\nheader\n')
+            for nr, row in enumerate(data):
+                ff.write('\t'.join(['lab{}'.format(nr)] * nr_label_cols +
+                                   [repr(val) for val in row]) + '\n')
+
+    os.makedirs(os.path.join(root, 'preprocess'))
+    sut = dict(V=rng.rand(nr_sec, nr_sec) + np.eye(nr_sec) * 50,
+               U=rng.rand(nr_sec, nr_sec),
+               Y=rng.rand(nr_sec, 28) * 10)
+    write_aggregated('mrSupplyAggregated.txt', sut['V'], 3)
+    write_aggregated('mrUseAggregated.txt', sut['U'], 3)
+    write_aggregated('mrFinalDemandAggregated.txt', sut['Y'], 3)
+    write_aggregated('mrMaterialsAggregated.txt', rng.rand(3, nr_sec), 2)
+    for step in ['0', '1', '2a', '2b', '3']:
+        folder = 'preprocess' if step == '0' else 'step' + step
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+        for matrix, data in sut.items():
+            name = matrix + ('.txt' if step == '0' else 'end.txt')
+            np.savetxt(os.path.join(root, folder, name),
+                       data * (1 + 0.1 * len(step)), delimiter='\t')
+    sectors = pd.DataFrame({'a': 0, 'b': 0,
+                            'sector': ['sec{}'.format(nr)
+                                       for nr in range(131)]})
+    with pd.ExcelWriter(os.path.join(root,
+                                     'supply_use_tables_bau_2050.xlsx')) as xw:
+        for sheet in range(3):
+            sectors.to_excel(xw, sheet_name='s{}'.format(sheet), index=False)
+    return sut
+
+
+def test_cecilia_parser(tmpdir):
+    root = str(tmpdir) + '/'
+    sut = _write_cecilia_mock(root)
+
+    cecilias = pymrio.cecilia_parser(root, workers=3)
+    assert list(cecilias.keys()) == [-1, 0, 1, '2a', '2b', 3]
+    step_1 = pymrio.cecilia_parser(root, step=1)
+    pdt.assert_frame_equal(cecilias[1].Z, step_1.Z)
+    pdt.assert_frame_equal(cecilias[1].materials.F, step_1.materials.F)
+
+    # previous construction of the industry technology pxp table
+    S, U = sut['V'] * 1.1, sut['U'] * 1.1
+    Z = np.transpose(U.dot(S / np.sum(S, axis=1).reshape((-1, 1))))
+    np.testing.assert_allclose(step_1.Z.values, Z)
+    x = sut['Y'].sum(axis=1) * 1.1 + Z.sum(axis=1)
+    np.testing.assert_allclose(step_1.A, Z / x.reshape((1, -1)))
+    np.testing.assert_allclose(
+        step_1.L, np.linalg.inv(np.eye(Z.shape[0]) - step_1.A))
+
+    # materials intensities are based on the initial output in all steps
+    pdt.assert_frame_equal(cecilias[-1].materials.S, cecilias[3].materials.S)
+    assert cecilias[-1].materials.F is not cecilias[3].materials.F
+
+    ixi = pymrio.cecilia_parser(root, step=-1, system='ixi',
+                                technology='product')
+    S, U = sut['V'], sut['U']
+    np.testing.assert_allclose(
+        ixi.Z.values, np.diag(S.sum(axis=1)) @ np.linalg.inv(S.T) @ U)
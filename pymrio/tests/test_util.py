@@ -2,8 +2,11 @@
 
 import os
 import sys
+import zipfile
 import numpy as np
 import numpy.testing as npt
+import pandas as pd
+import pandas.util.testing as pdt
 
 from unittest.mock import mock_open, patch
 from collections import namedtuple
@@ -19,6 +22,9 @@ from pymrio.tools.ioutil import sniff_csv_format           # noqa
 from pymrio.tools.ioutil import build_agg_matrix           # noqa
 from pymrio.tools.ioutil import build_agg_vec              # noqa
 from pymrio.tools.ioutil import set_block                  # noqa
+from pymrio.tools.ioutil import ArchiveSession             # noqa
+from pymrio.tools.ioutil import open_archive               # noqa
+from pymrio.tools.ioutil import read_csv_table             # noqa
 
 
 @pytest.fixture()
@@ -116,6 +122,12 @@ def test_build_agg_matrix():
     np.testing.assert_allclose(am_num, expected)
     np.testing.assert_allclose(am_str, expected)
 
+    am_sparse = build_agg_matrix([1, 0, 0, 1, 0], sparse=True)
+    np.testing.assert_allclose(am_sparse.toarray(), expected)
+    am_excl = build_agg_matrix([1, -1, 0, 1, 0], sparse=True)
+    np.testing.assert_allclose(
+        am_excl.toarray(), build_agg_matrix([1, -1, 0, 1, 0]))
+
 
 def test_build_agg_vec():
     """ Simple test based on the test mrio
@@ -143,3 +155,94 @@ def test_set_block():
         full_arr = np.random.random((10, 12))
         block_arr = np.zeros((2, 2))
         mod_arr = set_block(full_arr, block_arr)
+
+
+def test_archive_session(tmpdir):
+    """ Archive session: cached content and parallel member reads """
+    arc_file = str(tmpdir.join('arc.zip'))
+    with zipfile.ZipFile(arc_file, 'w') as zz:
+        zz.writestr('para.json', '{"a": 1, "b": [1, 2]}')
+        for nr in range(6):
+            zz.writestr('data/f{}.txt'.format(nr), str(nr) * 100)
+
+    with ArchiveSession(arc_file) as arc:
+        assert 'para.json' in arc
+        assert 'foo.json' not in arc
+        assert len(arc.namelist) == 7
+
+        para = arc.read_json('para.json')
+        assert para == {'a': 1, 'b': [1, 2]}
+        para['a'] = 5
+        assert arc.read_json('para.json')['a'] == 1
+
+        members = ['data/f{}.txt'.format(nr) for nr in range(6)]
+        seq = arc.map_members(lambda mm, ff: (mm, ff.read()), members)
+        par = arc.map_members(lambda mm, ff: (mm, ff.read()), members,
+                              workers=3)
+        assert seq == par
+        assert par[2] == ('data/f2.txt', b'2' * 100)
+
+        assert open_archive(arc_file, arc) is arc
+
+    assert arc.closed
+    assert open_archive(str(tmpdir)) is None
+
+
+def test_read_csv_table(tmpdir):
+    """ Fast csv reader against pandas read_csv """
+    mock_path = os.path.join(_pymriopath, 'mock_mrios')
+    test_files = [
+        (os.path.join(mock_path, 'exio1_mock', 'mrIot.txt'), 3, 2),
+        (os.path.join(mock_path, 'exio3_mock', 'A.txt'), 2, 2),
+        (os.path.join(mock_path, 'exio_ext_mock', 'ext_1col.txt'), 1, 2),
+    ]
+    for csv_file, index_col, header_rows in test_files:
+        expected = pd.read_csv(csv_file, sep='\t',
+                               index_col=list(range(index_col)),
+                               header=list(range(header_rows)))
+        pdt.assert_frame_equal(
+            expected.astype(float),
+            read_csv_table(csv_file, index_col, header_rows))
+        with open(csv_file, 'rb') as ff:
+            pdt.assert_frame_equal(
+                expected.astype(float),
+                read_csv_table(ff, index_col, header_rows, chunksize=3))
+
+    single = read_csv_table(test_files[1][0], 2, 2, dtype='float32')
+    assert all(single.dtypes == np.float32)
+    for csv_file, index_col, header_rows in test_files:
+        pdt.assert_frame_equal(
+            pd.read_csv(csv_file, sep='\t', index_col=list(range(index_col)),
+                        header=list(range(header_rows))),
+            read_csv_table(csv_file, index_col, header_rows, dtype=None,
+                           chunksize=3))
+
+    # labels like NA (Namibia) are kept, empty values become NaN
+    csv_text = ('\t\treg1\treg1\n\t\ts1\ts2\n'
+                'region\tsector\t\t\n'
+                'NA\ts1\t1\t\nNA\ts2\t3\t4\n')
+    arc_file = str(tmpdir.join('csv.zip'))
+    with zipfile.ZipFile(arc_file, 'w') as zz:
+        zz.writestr('data/table.txt', csv_text)
+    tab = read_csv_table('data/table.txt', 2, 2, zip_file=arc_file,
+                         chunksize=1)
+    assert tab.index.names == ['region', 'sector']
+    assert tab.index[0] == ('NA', 's1')
+    assert np.isnan(tab.iloc[0, 1])
+    assert tab.loc[('NA', 's2'), ('reg1', 's2')] == 4
+
+    with pytest.raises(ValueError):
+        read_csv_table(os.path.join(mock_path, 'exio3_mock', 'unit.txt'),
+                       2, 1)
+
+
+def test_read_csv_table_pyarrow():
+    pytest.importorskip('pyarrow')
+    mock_path = os.path.join(_pymriopath, 'mock_mrios')
+    for csv_file, index_col, header_rows in [
+            (os.path.join(mock_path, 'exio1_mock', 'mrIot.txt'), 3, 2),
+            (os.path.join(mock_path, 'exio3_mock', 'A.txt'), 2, 2)]:
+        pdt.assert_frame_equal(
+            read_csv_table(csv_file, index_col, header_rows),
+            read_csv_table(csv_file, index_col, header_rows,
+                           engine='pyarrow'))
@@ -0,0 +1,350 @@
+""" Batch processing of multi-year MRIO databases
+
+The parsers for WIOD, OECD and Eora26 parse a single year at a time. The
+functions in this module parse a series of years in parallel processes,
+optionally aggregate and calculate each system and store each result as
+soon as it is available. Only one IOSystem per worker process is kept in
+memory, independent of the number of years.
+
+>>> res = pymrio.parse_many('wiod', '/path/to/wiod',
+...                         years=range(1995, 2012),
+...                         workers=8, out='/path/to/wiod_parsed')
+>>> res.timings
+
+For WIOD and OECD, download_and_parse combines the download with the
+parsing: each year is parsed as soon as its files are downloaded.
+
+"""
+
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from pymrio.tools.iodownloader import DOWNLOAD_WORKERS
+from pymrio.tools.iodownloader import WIOD_CONFIG
+from pymrio.tools.iodownloader import download_oecd
+from pymrio.tools.iodownloader import download_wiod2013
+from pymrio.tools.ioparser import parse_eora26
+from pymrio.tools.ioparser import parse_oecd
+from pymrio.tools.ioparser import parse_wiod
+
+# Parsers (accepting path and year) available for parse_many
+YEAR_PARSERS = {
+    'wiod': parse_wiod,
+    'oecd': parse_oecd,
+    'eora26': parse_eora26,
+    }
+
+# Downloaders (accepting storage_folder and years) for download_and_parse
+YEAR_DOWNLOADERS = {
+    'wiod': download_wiod2013,
+    'oecd': download_oecd,
+    }
+
+# Name of the summary file written to the output folder
+TIMINGS_FILE = 'timings.txt'
+
+batch_result = namedtuple('batch_result', ['systems', 'timings'])
+
+
+def _process_year(database, path, year, out, parser_kwargs,
+                  aggregate, calc_all, table_format):
+    """ Parses, processes and stores a single year
+
+    This is executed in the worker processes and must therefore be
+    defined at the module level.
+
+    Returns
+    -------
+    tuple with (year, IOSystem or path to the stored system, timings dict)
+    """
+    timings = dict()
+    start = time.perf_counter()
+    io = YEAR_PARSERS[database](path, year=year, **parser_kwargs)
+    timings['parse'] = time.perf_counter() - start
+
+    if aggregate:
+        step = time.perf_counter()
+        io.aggregate(**aggregate)
+        timings['aggregate'] = time.perf_counter() - step
+
+    if calc_all:
+        step = time.perf_counter()
+        io.calc_all()
+        timings['calc_all'] = time.perf_counter() - step
+
+    result = io
+    if out:
+        step = time.perf_counter()
+        year_path = Path(out) / str(year)
+        io.save_all(year_path, table_format=table_format)
+        timings['save'] = time.perf_counter() - step
+        result = year_path
+        del io
+
+    timings['total'] = time.perf_counter() - start
+    return year, result, timings
+
+
+def _progress_message(database, year, nr_done, nr_years, timings):
+    return 'Finished {} {} ({}/{}) in {:.1f} s ({})'.format(
+        database, year, nr_done, nr_years, timings['total'],
+        ', '.join('{} {:.1f} s'.format(step, sec)
+                  for step, sec in timings.items() if step != 'total'))
+
+
+def _timings_table(timings, years, out):
+    timings = pd.DataFrame.from_dict(timings, orient='index').reindex(years)
+    timings.index.name = 'year'
+    if out:
+        timings.to_csv(Path(out) / TIMINGS_FILE, sep='\t')
+    return timings
+
+
+def parse_many(database, path, years, workers=None, out=None,
+               aggregate=None, calc_all=False, table_format='pkl',
+               progress_function=logging.info, **parser_kwargs):
+    """ Parses several years of a MRIO database in parallel
+
+    Each year is parsed (and optionally aggregated and calculated) in a
+    separate process. If an output folder is given, the result of each year
+    is stored in a subfolder (named by the year) as soon as it is available
+    and the system is released afterwards. Thus, the memory requirement
+    only depends on the number of workers, not on the number of years.
+
+    Parameters
+    ----------
+    database : str
+        Database to parse, one of 'wiod', 'oecd', 'eora26'
+
+    path : pathlib.Path or string
+        Path to the source files, passed to the parser of the database
+
+    years : iterable of int
+        Years to parse
+
+    workers : int, optional
+        Number of worker processes. If None or 1 (default),
+        the years are parsed sequentially in the current process.
+
+    out : pathlib.Path or string, optional
+        Folder for storing the parsed systems (one subfolder per year).
+        If None (default), the IOSystems are returned instead
+        (all years are then kept in memory).
+
+    aggregate : dict, optional
+        Keyword arguments passed to IOSystem.aggregate
+        (e.g. dict(region_agg='global')) for each year.
+
+    calc_all : boolean, optional
+        If True, calc_all is called for each year before storing.
+        Default: False
+
+    table_format : str, optional
+        Format of the stored tables, passed to IOSystem.save_all.
+        Default: 'pkl' (binary)
+
+    progress_function : function, optional
+        Function receiving a progress message after each finished year.
+        Default: logging.info
+
+    **parser_kwargs
+        All other keyword arguments are passed to the parser
+
+    Returns
+    -------
+    namedtuple with
+
+        systems : dict
+            year: IOSystem (or the path to the stored system if out is given)
+
+        timings : pandas.DataFrame
+            Time in seconds of the processing steps for each year
+
+    """
+    if database not in YEAR_PARSERS:
+        raise ValueError('Database must be one of {}'.format(
+            ', '.join(YEAR_PARSERS.keys())))
+
+    years = list(years)
+    if out:
+        Path(out).mkdir(parents=True, exist_ok=True)
+    args = (database, path)
+    kwargs = dict(out=out, parser_kwargs=parser_kwargs,
+                  aggregate=aggregate, calc_all=calc_all,
+                  table_format=table_format)
+
+    systems = dict()
+    timings = dict()
+
+    def _collect(year, result, year_timings):
+        systems[year] = result
+        timings[year] = year_timings
+        if progress_function:
+            progress_function(_progress_message(
+                database, year, len(systems), len(years), year_timings))
+
+    if not workers or workers <= 1 or len(years) <= 1:
+        for year in years:
+            _collect(*_process_year(*args, year, **kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_process_year, *args, year, **kwargs)
+                       for year in years]
+            for future in as_completed(futures):
+                _collect(*future.result())
+
+    return batch_result(systems={year: systems[year] for year in years},
+                        timings=_timings_table(timings, years, out))
+
+
+def _downloaded_year(database, file_name):
+    """ Year of a downloaded file, None for files needed by all years """
+    if database == 'oecd':
+        match = re.search(r'ICIO\d{4}_(\d{4})', file_name)
+        return int(match.group(1)) if match else None
+    match = re.search(r'wiot(\d\d)', file_name)
+    if not match:
+        return None
+    year = int(match.group(1))
+    return year + (1900 if year > 50 else 2000)
+
+
+def download_and_parse(database, storage_folder, years, out, workers=None,
+                       download_workers=DOWNLOAD_WORKERS, aggregate=None,
+                       calc_all=False, table_format='pkl',
+                       progress_function=logging.info, download_kwargs=None,
+                       **parser_kwargs):
+    """ Downloads and parses several years of WIOD or OECD
+
+    Each year is handed to a parse worker process as soon as all of its
+    files are downloaded (for WIOD, this includes the satellite accounts
+    which are needed for each year). The parsed system is stored in a
+    subfolder of out (named by the year) while the remaining files are
+    still downloading. The total time is thus about the maximum of the
+    download and the parse time instead of their sum.
+
+    Parameters
+    ----------
+    database : str
+        Database to download and parse, one of 'wiod', 'oecd'
+
+    storage_folder : pathlib.Path or string
+        Folder for the downloaded files, passed to the downloader
+
+    years : iterable of int
+        Years (4 digits) to download and parse
+
+    out : pathlib.Path or string
+        Folder for storing the parsed systems (one subfolder per year)
+
+    workers : int, optional
+        Number of parse worker processes, default 1
+
+    download_workers : int, optional
+        Maximum number of parallel downloads
+
+    aggregate, calc_all, table_format, progress_function
+        See parse_many
+
+    download_kwargs : dict, optional
+        Further keyword arguments for the downloader
+        (e.g. dict(version='v2016') for OECD)
+
+    **parser_kwargs
+        All other keyword arguments are passed to the parser
+
+    Returns
+    -------
+    namedtuple with
+
+        systems : dict
+            year: path to the stored system
+
+        timings : pandas.DataFrame
+            Time in seconds of the processing steps for each year,
+            'ready' gives the time after the start at which all files
+            of the year were downloaded.
+
+    Raises
+    ------
+    IOError for failed downloads - raised after all years with
+    complete downloads are parsed and stored.
+
+    """
+    if database not in YEAR_DOWNLOADERS:
+        raise ValueError('Database must be one of {}'.format(
+            ', '.join(YEAR_DOWNLOADERS.keys())))
+
+    years = [int(yy) for yy in years]
+    Path(out).mkdir(parents=True, exist_ok=True)
+    download_kwargs = dict(download_kwargs or {})
+    if database == 'wiod':
+        shared_files = {os.path.basename(url) for url in download_kwargs.get(
+            'satellite_urls', WIOD_CONFIG['satellite_urls'])}
+    else:
+        shared_files = set()
+
+    start = time.perf_counter()
+    lock = threading.Lock()
+    year_done = set()
+    pending = set(years)
+    futures = dict()
+    kwargs = dict(out=out, parser_kwargs=parser_kwargs,
+                  aggregate=aggregate, calc_all=calc_all,
+                  table_format=table_format)
+
+    # spawn instead of fork: the workers are started from download threads
+    with ProcessPoolExecutor(
+            max_workers=workers or 1,
+            mp_context=multiprocessing.get_context('spawn')) as pool:
+
+        def _file_complete(storage_file):
+            file_name = os.path.basename(storage_file)
+            with lock:
+                year = _downloaded_year(database, file_name)
+                if year is None:
+                    shared_files.discard(file_name)
+                else:
+                    year_done.add(year)
+                if shared_files:
+                    return
+                for ready_year in sorted(pending & year_done):
+                    pending.discard(ready_year)
+                    future = pool.submit(_process_year, database,
+                                         storage_folder, ready_year, **kwargs)
+                    futures[future] = time.perf_counter() - start
+
+        download_error = None
+        try:
+            YEAR_DOWNLOADERS[database](
+                storage_folder, years=years, workers=download_workers,
+                on_complete=_file_complete, **download_kwargs)
+        except Exception as err:
+            download_error = err
+
+        systems = dict()
+        timings = dict()
+        for future in as_completed(futures):
+            year, result, year_timings = future.result()
+            year_timings['ready'] = futures[future]
+            systems[year] = result
+            timings[year] = year_timings
+            if progress_function:
+                progress_function(_progress_message(
+                    database, year, len(systems), len(years), year_timings))
+
+    timings = _timings_table(timings, years, out)
+    if download_error:
+        raise download_error
+    return batch_result(
+        systems={year: systems[year] for year in years if year in systems},
+        timings=timings)
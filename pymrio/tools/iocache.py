@@ -0,0 +1,353 @@
+""" On-disk cache for parsed MRIO databases
+
+Parsing the original database files (txt, Excel or mat files) can take
+several minutes. The parse cache stores the result of a parser call in a
+binary (pickle) file. The cache key is based on the content hashes of the
+source files and the arguments passed to the parser, thus changes in either
+of them result in a new parse.
+
+The cache is disabled by default. Activate it for all parsers with
+
+>>> pymrio.set_parse_cache('/path/to/cache', max_size=20e9)
+
+or pass a ParseCache (or a path) for a single call
+
+>>> pymrio.parse_exiobase2(path, parse_cache='/path/to/cache')
+
+Passing parse_cache=False bypasses the cache for a single call.
+
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from pymrio.tools.ioutil import EXCEL_CACHE_FOLDER
+from pymrio.version import __version__
+
+# Chunk size for hashing the source files
+HASH_CHUNK_SIZE = 2**20
+
+# Default maximum size of all cache files (in bytes)
+DEFAULT_CACHE_SIZE = 10e9
+
+# Name of the file storing the hashes of previously seen source files
+HASH_INDEX_FILE = 'file_hashes.json'
+
+# Extension of the cache files
+CACHE_FILE_EXT = '.pkl'
+
+# Extension of partially downloaded files (see iodownloader), never sources
+PARTIAL_EXT = '.part'
+
+# Parser arguments which do not change the result (not part of the key)
+NON_KEY_ARGUMENTS = ['workers', 'excel_cache', 'file_cache', 'engine']
+
+_parse_cache = None
+
+
+class ParseCache(object):
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        """ Size bounded on-disk cache for parser results
+
+        Each entry is stored as a pickle file named by its key. When the
+        total size of all entries exceeds max_size, the least recently used
+        entries are removed (the modification time of an entry is updated
+        at each cache hit).
+
+        Parameters
+        ----------
+        cache_dir: pathlib.Path or string
+            Folder for storing the cache files, will be created if it
+            does not exist.
+
+        max_size: int or float, optional
+            Maximum size of all cache files in bytes, default 10 GB.
+
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._hash_index_file = self.cache_dir / HASH_INDEX_FILE
+        try:
+            with self._hash_index_file.open('r') as hf:
+                self._hash_index = json.load(hf)
+        except (OSError, ValueError):
+            self._hash_index = dict()
+
+    def __repr__(self):
+        return ('ParseCache at {} ({} entries, {:.1f} MB of max {:.1f} MB, '
+                '{} hits, {} misses)'.format(
+                    self.cache_dir, len(self._entries()),
+                    self.size / 1e6, self.max_size / 1e6,
+                    self.hits, self.misses))
+
+    def _entries(self):
+        return [ff for ff in self.cache_dir.glob('*' + CACHE_FILE_EXT)
+                if ff.is_file()]
+
+    @property
+    def size(self):
+        """ Current size of all cache entries in bytes """
+        return sum(ff.stat().st_size for ff in self._entries())
+
+    def file_hash(self, file_path):
+        """ Content hash (sha1) of file_path
+
+        The hashes are stored together with the size and modification
+        time of the file. Unchanged files are thus only hashed once.
+        """
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+        memo = self._hash_index.get(str(file_path))
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+
+        sha = hashlib.sha1()
+        with file_path.open('rb') as ff:
+            for chunk in iter(lambda: ff.read(HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        file_hash = sha.hexdigest()
+        self._hash_index[str(file_path)] = [
+            stat.st_size, stat.st_mtime_ns, file_hash]
+        self._save_hash_index()
+        return file_hash
+
+    def _temp_file(self, mode):
+        """ New file in the cache folder, to be renamed when complete
+
+        The name is unique, thus processes sharing the cache folder do not
+        write to the same temporary file.
+        """
+        return tempfile.NamedTemporaryFile(mode=mode, dir=str(self.cache_dir),
+                                           suffix='.tmp', delete=False)
+
+    def _save_hash_index(self):
+        with self._temp_file('w') as hf:
+            json.dump(self._hash_index, hf)
+        os.replace(hf.name, str(self._hash_index_file))
+
+    def make_key(self, parser_name, source_files, arguments):
+        """ Cache key for a parser call
+
+        Parameters
+        ----------
+        parser_name: str
+
+        source_files: list of pathlib.Path or str
+            Files read by the parser
+
+        arguments: dict
+            All other (json serializable) arguments of the parser call
+
+        Returns
+        -------
+        str (sha1 hexdigest)
+        """
+        source_files = sorted(Path(ff).resolve() for ff in source_files)
+        key_content = dict(
+            parser=parser_name,
+            pymrio_version=__version__,
+            arguments=arguments,
+            files=[(ff.name, self.file_hash(ff)) for ff in source_files])
+        return hashlib.sha1(json.dumps(
+            key_content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_file(self, key):
+        return self.cache_dir / (key + CACHE_FILE_EXT)
+
+    def get(self, key):
+        """ Cached object for key, None if not in the cache """
+        entry = self._entry_file(key)
+        if not entry.is_file():
+            self.misses += 1
+            return None
+        try:
+            with entry.open('rb') as ef:
+                obj = pickle.load(ef)
+        except Exception as ex:
+            logging.warning(
+                'Removing unreadable parse cache entry {}: {}'.format(
+                    entry, ex))
+            entry.unlink()
+            self.misses += 1
+            return None
+        os.utime(str(entry))
+        self.hits += 1
+        return obj
+
+    def put(self, key, obj):
+        """ Stores obj under key and evicts old entries if necessary """
+        entry = self._entry_file(key)
+        with self._temp_file('wb') as ef:
+            pickle.dump(obj, ef, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_file = Path(ef.name)
+        if tmp_file.stat().st_size > self.max_size:
+            logging.warning(
+                'Parse result larger than the maximum cache size - '
+                'not stored in the parse cache')
+            tmp_file.unlink()
+            return
+        os.replace(str(tmp_file), str(entry))
+        self._evict(keep=entry)
+
+    def _evict(self, keep=None):
+        """ Removes least recently used entries until below max_size """
+        entries = sorted(self._entries(), key=lambda ff: ff.stat().st_mtime)
+        total_size = sum(ff.stat().st_size for ff in entries)
+        for entry in entries:
+            if total_size <= self.max_size:
+                break
+            if keep and entry == keep:
+                continue
+            total_size -= entry.stat().st_size
+            entry.unlink()
+            logging.info('Evicted {} from the parse cache'.format(entry.name))
+
+    def clear(self):
+        """ Removes all entries from the cache """
+        for entry in self._entries():
+            entry.unlink()
+        self._hash_index = dict()
+        self._save_hash_index()
+
+
+def set_parse_cache(cache_dir, max_size=DEFAULT_CACHE_SIZE):
+    """ Sets the parse cache used by all parsers
+
+    Parameters
+    ----------
+    cache_dir: pathlib.Path, string, ParseCache or None
+        Folder for the cache files (or an existing ParseCache).
+        Pass None to deactivate the cache.
+
+    max_size: int or float, optional
+        Maximum size of all cache files in bytes, default 10 GB.
+        Only used if a folder is passed.
+
+    Returns
+    -------
+    ParseCache or None
+    """
+    global _parse_cache
+    if cache_dir is None or isinstance(cache_dir, ParseCache):
+        _parse_cache = cache_dir
+    else:
+        _parse_cache = ParseCache(cache_dir, max_size=max_size)
+    return _parse_cache
+
+
+def get_parse_cache():
+    """ The parse cache used by all parsers (None if not set) """
+    return _parse_cache
+
+
+def _source_files(path):
+    """ All files in path (path can be a file or a folder)
+
+    Files in Excel cache folders (see ioutil.CachedExcelFile) and
+    partial downloads are not considered as source files.
+    """
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return [ff for ff in path.glob('**/*') if ff.is_file() and
+            ff.suffix != PARTIAL_EXT and
+            EXCEL_CACHE_FOLDER not in ff.relative_to(path).parts]
+
+
+def _is_cacheable_arg(value):
+    """ True if value can be used as part of the cache key """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_cacheable_arg(vv) for vv in value)
+    return False
+
+
+def _note_cache_hit(obj, entry):
+    """ Records the cache hit in the metadata of all IOSystems in obj """
+    if isinstance(obj, dict):
+        for val in obj.values():
+            _note_cache_hit(val, entry)
+    elif hasattr(obj, 'meta') and hasattr(obj.meta, '_add_fileio'):
+        obj.meta._add_fileio('Loaded parse result from cache {}'.format(entry))
+
+
+def cached_parser(path_arg='path', sources=None):
+    """ Decorator adding the parse cache to a parser function
+
+    The decorated function accepts the additional keyword argument
+    'parse_cache' (a ParseCache, a path to a cache folder, or False
+    to bypass the cache). If not given, the cache set by set_parse_cache
+    is used.
+
+    Calls with arguments which can not be represented in the cache key
+    (e.g. DataFrames) are passed to the parser without caching.
+
+    Parameters
+    ----------
+    path_arg: str, optional
+        Name of the argument pointing to the source data
+
+    sources: function, optional
+        Function receiving the bound arguments (dict) and returning the list
+        of source files read by the parser. By default all files in
+        the location given at path_arg are used.
+
+    """
+    def decorator(parser):
+        signature = inspect.signature(parser)
+
+        @functools.wraps(parser)
+        def wrapper(*args, parse_cache=None, **kwargs):
+            if parse_cache is None:
+                parse_cache = _parse_cache
+            if not parse_cache:
+                return parser(*args, **kwargs)
+            if not isinstance(parse_cache, ParseCache):
+                parse_cache = ParseCache(parse_cache)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            source_path = arguments.pop(path_arg)
+            for non_key_arg in NON_KEY_ARGUMENTS:
+                arguments.pop(non_key_arg, None)
+
+            if not all(_is_cacheable_arg(val) for val in arguments.values()):
+                logging.debug('Arguments of {} not cacheable - parse without '
+                              'cache'.format(parser.__name__))
+                return parser(*args, **kwargs)
+
+            if sources:
+                source_files = sources(bound.arguments)
+            else:
+                source_files = _source_files(source_path)
+            source_files = [ff for ff in source_files if Path(ff).is_file()]
+
+            key = parse_cache.make_key(parser.__name__,
+                                       source_files, arguments)
+            result = parse_cache.get(key)
+            if result is not None:
+                logging.info('Parse result of {} loaded from cache'.format(
+                    parser.__name__))
+                _note_cache_hit(result, parse_cache._entry_file(key))
+                return result
+
+            result = parser(*args, **kwargs)
+            if result is not None:
+                parse_cache.put(key, result)
+            return result
+
+        return wrapper
+    return decorator
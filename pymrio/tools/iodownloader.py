@@ -1,12 +1,28 @@
 """ Utility functions for automatic downloading of public MRIO databases
 """
 
+import hashlib
+import logging
 import os
 import re
+import time
 import requests
 from collections import namedtuple
 
 from pymrio.tools.iometadata import MRIOMetaData
+from pymrio.tools.ioutil import thread_map
+
+# Number of parallel downloads
+DOWNLOAD_WORKERS = 4
+
+# Chunk size for writing downloads (bytes)
+DOWNLOAD_CHUNK_SIZE = 2**20
+
+# Timeout (seconds) for connecting and between received bytes
+DOWNLOAD_TIMEOUT = 60
+
+# Extension of incomplete downloads, these are resumed in the next attempt
+PARTIAL_EXT = '.part'
 
 WIOD_CONFIG = {
     'url_db_view': 'http://www.wiod.org/database/wiots13',
@@ -112,8 +128,111 @@ def _get_url_datafiles(url_db_view, url_db_content,
     return returnvalue(raw_text=url_text, data_urls=data_urls)
 
 
+def _file_checksum(file, algorithm='sha256'):
+    """ Hexdigest of file with the hashlib algorithm """
+    file_hash = hashlib.new(algorithm)
+    with open(file, 'rb') as ff:
+        for chunk in iter(lambda: ff.read(DOWNLOAD_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _checksum_ok(file, checksum):
+    """ Compares file with checksum ('algorithm:hexdigest', default sha256) """
+    algorithm, _, digest = checksum.rpartition(':')
+    return _file_checksum(file, algorithm or 'sha256') == digest.lower()
+
+
+def _expected_length(response):
+    """ Length of the response body in bytes, None if unknown """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    length = response.headers.get('Content-Length')
+    return int(length) if length is not None else None
+
+
+def _fetch(url, part_file, method, access_cookie):
+    """ Downloads url to part_file, resumes if part_file exists
+
+    Raises IOError if the download is not complete.
+    """
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    headers = {'Range': 'bytes={}-'.format(offset)} if offset else None
+
+    # Using requests here - tried with aiohttp but was actually slower
+    # Also don’t use shutil.copyfileobj - corrupts zips from Eora
+    with requests.request(method, url, stream=True, cookies=access_cookie,
+                          headers=headers, timeout=DOWNLOAD_TIMEOUT) as req:
+        if req.status_code == 416:
+            os.remove(part_file)
+            raise IOError('Partial download of {} not accepted by the server '
+                          '- restart download'.format(url))
+        req.raise_for_status()
+        if req.status_code != 206:
+            # server does not support ranges, restart from scratch
+            offset = 0
+        length = _expected_length(req)
+        expected_size = offset + length if length is not None else None
+        with open(part_file, 'ab' if offset else 'wb') as lf:
+            for chunk in req.iter_content(DOWNLOAD_CHUNK_SIZE):
+                lf.write(chunk)
+
+    size = os.path.getsize(part_file)
+    if expected_size is not None and size != expected_size:
+        raise IOError('Incomplete download of {} ({} of {} bytes)'.format(
+            url, size, expected_size))
+
+
+def _download_file(url, storage_file, method='post', access_cookie=None,
+                   checksum=None, max_retries=3, backoff=1):
+    """ Downloads url to storage_file
+
+    The data is first stored in storage_file + PARTIAL_EXT and moved to
+    storage_file after the size and (if given) the checksum are verified.
+    Failed downloads are retried max_retries times with exponential backoff
+    (backoff, 2*backoff, 4*backoff... seconds), resuming from the
+    partial file if the server supports HTTP range requests.
+    """
+    part_file = storage_file + PARTIAL_EXT
+    for attempt in range(max_retries + 1):
+        try:
+            _fetch(url, part_file, method, access_cookie)
+            if checksum and not _checksum_ok(part_file, checksum):
+                os.remove(part_file)
+                raise IOError('Checksum of {} does not match'.format(url))
+            os.replace(part_file, storage_file)
+            return storage_file
+        except IOError as err:
+            if attempt == max_retries:
+                raise
+            wait = backoff * 2 ** attempt
+            logging.warning('Download of {} failed ({}) - retry in {} '
+                            'seconds'.format(url, err, wait))
+            time.sleep(wait)
+
+
+def _is_complete(url, storage_file, access_cookie=None, checksum=None):
+    """ Checks a previously downloaded file against checksum or remote size
+
+    Without checksum, the size of storage_file is compared with the size
+    reported by the server. If the server does not report a size, the file
+    is assumed to be complete.
+    """
+    if checksum:
+        return _checksum_ok(storage_file, checksum)
+    try:
+        head = requests.head(url, cookies=access_cookie,
+                             allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException:
+        return True
+    length = _expected_length(head) if head.ok else None
+    return length is None or length == os.path.getsize(storage_file)
+
+
 def _download_urls(url_list, storage_folder, overwrite_existing,
-                   meta_handler, access_cookie=None):
+                   meta_handler, access_cookie=None, filenames=None,
+                   method='post', workers=DOWNLOAD_WORKERS, checksums=None,
+                   max_retries=3, backoff=1, on_complete=None):
     """ Save url from url_list to storage_folder
 
     Parameters
@@ -129,37 +248,96 @@ def _download_urls(url_list, storage_folder, overwrite_existing,
     overwrite_existing: boolean, optional
         If False, skip download of file already existing in
         the storage folder (default). Set to True to replace
-        files.
+        files. Existing files which are not complete (checksum or
+        size different from the remote file) are downloaded again.
 
     meta_handler: instance of MRIOMetaData
 
+    access_cookie: dict, optional
+        If needed, cookie to access the database
+
+    filenames: list of str, optional
+        Names of the stored files (same order as url_list).
+        Default: the last part of the url
+
+    method: str, optional
+        HTTP method for the download requests ('post' (default) or 'get')
+
+    workers: int, optional
+        Maximum number of parallel downloads, default DOWNLOAD_WORKERS
+
+    checksums: dict, optional
+        Checksums of the files as {filename: 'algorithm:hexdigest'},
+        the algorithm defaults to sha256 if not given.
+
+    max_retries: int, optional
+        Number of retries for failed downloads, default 3
+
+    backoff: float, optional
+        Waiting time in seconds before the first retry, doubled for
+        each further retry. Default: 1
+
+    on_complete: function, optional
+        Function receiving the path of each stored file as soon as it is
+        available (downloaded or already present and complete).
+        Called from the download threads.
+
     Returns
     -------
 
     The meta_handler is passed back
 
-    """
-    for url in url_list:
-        filename = os.path.basename(url)
-        if not overwrite_existing and filename in os.listdir(storage_folder):
-            continue
-        storage_file = os.path.join(storage_folder, filename)
-
-        # Using requests here - tried with aiohttp but was actually slower
-        # Also don’t use shutil.copyfileobj - corrupts zips from Eora
-        req = requests.post(url, stream=True, cookies=access_cookie)
-        with open(storage_file, 'wb') as lf:
-            for chunk in req.iter_content(1024*5):
-                lf.write(chunk)
+    Raises
+    ------
+    IOError (requests.RequestException)
+        For downloads which failed after all retries. The metadata of all
+        successful downloads is stored before.
 
-        meta_handler._add_fileio('Downloaded {} to {}'.format(url, filename))
-        meta_handler.save()
+    """
+    os.makedirs(storage_folder, exist_ok=True)
+    if filenames is None:
+        filenames = [os.path.basename(url) for url in url_list]
+    checksums = checksums or dict()
 
+    def _download_job(job):
+        url, filename = job
+        storage_file = os.path.join(storage_folder, filename)
+        checksum = checksums.get(filename)
+        if (not overwrite_existing and os.path.exists(storage_file) and
+                _is_complete(url, storage_file, access_cookie, checksum)):
+            result = None
+        else:
+            try:
+                _download_file(url, storage_file, method=method,
+                               access_cookie=access_cookie, checksum=checksum,
+                               max_retries=max_retries, backoff=backoff)
+            except IOError as err:
+                return err
+            result = url
+        if on_complete:
+            on_complete(storage_file)
+        return result
+
+    results = thread_map(_download_job, list(zip(url_list, filenames)),
+                         workers=workers)
+
+    errors = []
+    for (url, filename), result in zip(zip(url_list, filenames), results):
+        if isinstance(result, Exception):
+            errors.append(result)
+        elif result:
+            meta_handler._add_fileio('Downloaded {} to {}'.format(
+                url, filename))
+    meta_handler.save()
+
+    if errors:
+        raise errors[0]
     return meta_handler
 
 
 def download_oecd(storage_folder, version='v2018',
-                  years=None, overwrite_existing=False):
+                  years=None, overwrite_existing=False,
+                  workers=DOWNLOAD_WORKERS, checksums=None, on_complete=None):
     """ Downloads the OECD ICIO tables
 
     Parameters
@@ -184,6 +362,17 @@ def download_oecd(storage_folder, version='v2018',
         the storage folder (default). Set to True to replace
         files.
 
+    workers: int, optional
+        Maximum number of parallel downloads
+
+    checksums: dict, optional
+        Checksums for verifying the downloads as
+        {filename: 'algorithm:hexdigest'} (default algorithm sha256)
+
+    on_complete: function, optional
+        Function receiving the path of each file as soon as it is available
+        (see pymrio.download_and_parse for parsing during the download)
+
     Returns
     -------
 
@@ -227,6 +416,8 @@ def download_oecd(storage_folder, version='v2018',
                         version=version)
 
     oecd_webcontent = requests.get(OECD_CONFIG['url_db_view']).text
+    urls = []
+    filenames = []
     for yy in years:
         if yy not in OECD_CONFIG['datafiles'][version].keys():
             raise ValueError(
@@ -243,23 +434,25 @@ def download_oecd(storage_folder, version='v2018',
                 'Perhaps filenames have been changed - update OECD_CONFIG '
                 'to the new filenames'.format(yy, url_to_check))
 
-        filename = 'ICIO' + version.lstrip('v') + '_' + yy + '.zip'
-        storage_file = os.path.join(storage_folder, filename)
-        req = requests.get(OECD_CONFIG['datafiles'][version][yy],
-                           stream=True)
-        with open(storage_file, 'wb') as lf:
-            for chunk in req.iter_content(1024*5):
-                lf.write(chunk)
-
-        meta._add_fileio('Downloaded {} to {}'.format(
-            OECD_CONFIG['datafiles'][version][yy], filename))
+        urls.append(OECD_CONFIG['datafiles'][version][yy])
+        filenames.append('ICIO' + version.lstrip('v') + '_' + yy + '.zip')
 
-    meta.save()
+    meta = _download_urls(url_list=urls,
+                          storage_folder=storage_folder,
+                          overwrite_existing=overwrite_existing,
+                          meta_handler=meta,
+                          filenames=filenames,
+                          method='get',
+                          workers=workers,
+                          checksums=checksums,
+                          on_complete=on_complete)
     return meta
 
 
 def download_wiod2013(storage_folder, years=None, overwrite_existing=False,
-                      satellite_urls=WIOD_CONFIG['satellite_urls']):
+                      satellite_urls=WIOD_CONFIG['satellite_urls'],
+                      workers=DOWNLOAD_WORKERS, checksums=None,
+                      on_complete=None):
     """ Downloads the 2013 wiod release
 
     Note
@@ -293,6 +486,17 @@ def download_wiod2013(storage_folder, years=None, overwrite_existing=False,
         in WIOD_CONFIG - list of all available urls Remove items from this list
         to only download a subset of extensions
 
+    workers: int, optional
+        Maximum number of parallel downloads
+
+    checksums: dict, optional
+        Checksums for verifying the downloads as
+        {filename: 'algorithm:hexdigest'} (default algorithm sha256)
+
+    on_complete: function, optional
+        Function receiving the path of each file as soon as it is available
+        (see pymrio.download_and_parse for parsing during the download)
+
     Returns
     -------
 
@@ -326,12 +530,14 @@ def download_wiod2013(storage_folder, years=None, overwrite_existing=False,
                         system='IxI',
                         version='data13')
 
-    meta = _download_urls(url_list=restricted_wiod_io_urls + satellite_urls,
+    # satellite accounts first - these are needed for parsing any year
+    meta = _download_urls(url_list=satellite_urls + restricted_wiod_io_urls,
                           storage_folder=storage_folder,
                           overwrite_existing=overwrite_existing,
-                          meta_handler=meta)
-
-    meta.save()
+                          meta_handler=meta,
+                          workers=workers,
+                          checksums=checksums,
+                          on_complete=on_complete)
     return meta
 
 
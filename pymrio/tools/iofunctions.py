@@ -4,6 +4,11 @@ Mostly developed for Exiobase 1 and 2, may not be compatible with other database
 by adrien fabre (aka. bixiou on github), feel free to ask: adrien.fabre@psemail.eu
 """
 
+import functools
+import hashlib
+import inspect
+from collections import OrderedDict, namedtuple
+
 from pymrio.core.mriosystem import IOSystem as IOS
 from pymrio.tools.iomath import div0
 from pymrio.tools.iomath import sorted_series
@@ -12,7 +17,15 @@ from pymrio.tools.iomath import mult_cols
 from pymrio.tools.iomath import mult_rows
 from pymrio.tools.iomath import inter_secs
 from pymrio.tools.iomath import gras
+from pymrio.tools.iomath import calc_S
 from pymrio.tools.ioparser import themis_parser
+from pymrio.tools.iospa import structural_path_analysis
+from pymrio.tools.iolinkages import DIAGONAL_BLOCK_SIZE
+from pymrio.tools.iolinkages import LeontiefSolver
+from pymrio.tools.iolinkages import calc_linkages
+from pymrio.tools.iolinkages import extraction_losses
+from pymrio.tools.iolinkages import hypothetical_extraction
+from pymrio.tools.ioprices import calc_prices
 import pandas as pd
 import numpy as np
 import scipy.sparse as sp 
@@ -21,6 +34,139 @@ from openpyxl import load_workbook
 
 # TODO: manage Themis, Cecilia, and futures
 
+# Default number of results kept by the result cache of each IOSystem (see result_cache)
+RESULT_CACHE_SIZE = 128
+
+# Final demand categories which can not be negative (Exiobase, see final_demand)
+POSITIVE_Y_CATEGORIES = ['Final consumption expenditure by government', 'Gross fixed capital formation', 'Export', 
+                         'Final consumption expenditure by non-profit organisations serving households (NPISH)', 'Final consumption expenditure by households']
+
+# Rows of the impact matrix S of THEMIS summed by its satellite indicators (labels of labels.idx_impacts or positions, see indicator)
+THEMIS_INDICATORS = {
+    'value_added': list(range(1618, 1624)) + [1630],
+    'employment_low': [1624],
+    'employment_medium': [1625],
+    'employment_high': [1626],
+    'employment_all': [1624, 1625, 1626],
+    }
+
+def _copy_result(result): return(result.copy() if isinstance(result, (np.ndarray, pd.Series, pd.DataFrame)) else result)
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class ResultCache(object):
+    '''
+    LRU cache for the results of embodied_prod and embodied_impact of one IOSystem.
+    
+    The cache is cleared when the tables the results depend on are replaced (see result_cache) or when the version of the system changes (e.g. in change_mix).
+    Arrays and pandas objects are stored as copies and copied at each hit.
+    '''
+    def __init__(self, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self.sources = ()
+        self._entries = OrderedDict()
+        
+    def __len__(self): return(len(self._entries))
+    
+    def __getstate__(self):
+        # the entries (which can hold factorizations that can not be pickled) and the sources are not pickled, only the settings
+        return(dict(self.__dict__, sources=(), _entries=OrderedDict()))
+    
+    def cache_info(self): return(CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries)))
+    
+    def clear(self): self._entries.clear()
+    
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self._entries) > maxsize: self._entries.popitem(last=False)
+    
+    def validate(self, sources):
+        '''
+        Clears the cache if the sources (see _result_sources) are not the ones of the cached results.
+        '''
+        if len(sources) != len(self.sources) or any(old is not new for old, new in zip(self.sources, sources)):
+            self._entries.clear()
+            self.sources = sources
+            
+    def get(self, key, compute):
+        '''
+        Returns the result cached for key, or computes it with compute() and stores it.
+        '''
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return(_copy_result(self._entries[key]))
+        self.misses += 1
+        result = compute()
+        if self.maxsize:
+            self._entries[key] = _copy_result(result)
+            self.resize(self.maxsize)
+        return(result)
+
+def result_cache(self, maxsize=None):
+    '''
+    Returns the ResultCache of the IOSystem (created at the first call), maxsize sets its number of entries (0 deactivates the cache). 
+    
+    The cache is cleared when one of the tables of _result_sources is replaced. Hit and miss statistics are given by result_cache().cache_info().
+    '''
+    if '_result_cache' not in self.__dict__: self._result_cache = ResultCache()
+    if maxsize is not None: self._result_cache.resize(maxsize)
+    self._result_cache.validate(_result_sources(self))
+    return(self._result_cache)
+
+def _result_sources(self):
+    '''
+    Returns the tables the cached results depend on: A, L, x, the energy demand and supply (energy.secondary_demand, supply_filled, 
+    secondary_energy_supply), the impact extension (S, F) and the version of the system.
+    '''
+    attributes = self.__dict__
+    impact, energy = attributes.get('impact'), attributes.get('energy')
+    return((attributes.get('A'), attributes.get('L'), attributes.get('x'), getattr(energy, 'secondary_demand', None), attributes.get('supply_filled'), 
+            attributes.get('secondary_energy_supply'), getattr(impact, 'S', None), getattr(impact, 'F', None), attributes.get('_data_version', 0)))
+
+def _bump_version(self):
+    '''
+    Marks the data of the IOSystem as changed (invalidates the result cache), to call after modifying A, L, x or the energy demand in place.
+    '''
+    self._data_version = self.__dict__.get('_data_version', 0) + 1
+
+def _cache_key(value):
+    if value is None or isinstance(value, (str, int, float, bool)): return(value)
+    if isinstance(value, (list, tuple, pd.Index)) or (isinstance(value, np.ndarray) and value.dtype.kind in 'OUS'):
+        return(tuple(_cache_key(v) for v in value))
+    if sp.issparse(value): value = value.toarray()
+    values = np.ascontiguousarray(np.asarray(value, dtype=float))
+    return(('array', values.shape, hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()))
+
+def memoized(func=None, **defaults):
+    '''
+    Decorator storing the results of the IOSystem method func in the result cache of the system (see result_cache), keyed by the arguments 
+    (selections of sectors and regions, options and the content of vectors passed).
+    defaults gives, for arguments left to None, functions of (system, arguments) computing their value before the key is built 
+    (e.g. the production vector, so that results follow the data it is computed from).
+    '''
+    if func is None: return(lambda func: memoized(func, **defaults))
+    signature = inspect.signature(func)
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        for name, default in defaults.items():
+            if bound.arguments[name] is None: bound.arguments[name] = default(self, bound.arguments)
+        try: key = (func.__name__,) + tuple(_cache_key(v) for k, v in list(bound.arguments.items())[1:])
+        except (TypeError, ValueError): return(func(*bound.args, **bound.kwargs))
+        return(self.result_cache().get(key, lambda: func(*bound.args, **bound.kwargs)))
+    return(wrapper)
+
+def _cached_for(self, name, tables, compute, *args):
+    '''
+    Returns compute() kept in the result cache of the IOSystem under a key made of name, the identity of the tables it depends on 
+    (in addition to those of _result_sources) and args. The cache entry holds the tables, so that their ids can not be reused.
+    '''
+    key = (name, tuple(id(t) for t in tables)) + tuple(_cache_key(a) for a in args)
+    return(self.result_cache().get(key, lambda: (tables, compute()))[1])
+
 def energy_sectors(self, notion): # TODO: other sectors, difference from elecs_names to add after elec and to display
     '''
     Returns the list of energy sectors (or names) corresponding to notion, which can be: secondary, secondary_fuels, elec_hydrocarbon, electricities,elecs_names
@@ -75,13 +221,104 @@ def energy_sectors(self, notion): # TODO: other sectors, difference from elecs_n
     else: print('Function not yet implemented for this IOSystem')
     return(sectors)
 
+def _label_codes(labels):
+    '''
+    Returns (integer code of each label, dict label: code), codes are given in order of first appearance.
+    '''
+    codes, uniques = pd.factorize(np.asarray(labels, dtype=object))
+    return((codes, {label: i for i, label in enumerate(uniques)}))
+
+def _label_positions(labels):
+    '''
+    Returns a dict label: array of the positions of label in labels.
+    '''
+    positions = {}
+    for i, label in enumerate(labels): positions.setdefault(label, []).append(i)
+    return({label: np.array(pos) for label, pos in positions.items()})
+
+def _as_labels(labels):
+    if labels is None or isinstance(labels, str): return(labels if labels is None else [labels])
+    return(labels)
+
+class LabelIndex(object):
+    '''
+    Integer codes and hash maps of the regions and sectors of an IOSystem, for selections in its (region, sector) double index.
+    
+    Built once per IOSystem by label_index. idx_regions and idx_sectors are the region and sector of each row of the double index, 
+    by default all regions x sectors (regions as outer level).
+    '''
+    def __init__(self, regions, sectors, idx_regions=None, idx_sectors=None):
+        self.regions, self.sectors = list(regions), list(sectors)
+        self.reg_positions, self.sec_positions = _label_positions(self.regions), _label_positions(self.sectors)
+        self.product = idx_regions is None
+        if self.product: 
+            idx_regions = np.repeat(np.asarray(self.regions, dtype=object), len(self.sectors))
+            idx_sectors = np.tile(np.asarray(self.sectors, dtype=object), len(self.regions))
+        self.row_labels = list(zip(idx_regions, idx_sectors))
+        self.row_regs, self.reg_codes = _label_codes(idx_regions)
+        self.row_secs, self.sec_codes = _label_codes(idx_sectors)
+        self.sources = ()
+        
+    def _codes(self, labels, codes):
+        return(np.array([codes[l] for l in _as_labels(labels) if l in codes], dtype=int))
+        
+    def _selected(self, labels, codes):
+        selected = np.zeros(len(codes), dtype=bool)
+        if labels is None: selected[:] = True
+        else: selected[self._codes(labels, codes)] = True
+        return(selected)
+    
+    def mask(self, secs=None, regs=None):
+        '''
+        Returns the boolean mask of the rows (reg, sec) of the double index with reg in regs and sec in secs (None: all).
+        '''
+        return(self._selected(regs, self.reg_codes)[self.row_regs] & self._selected(secs, self.sec_codes)[self.row_secs])
+        
+    def positions(self, secs=None, regs=None):
+        '''
+        Returns the sorted array of the positions of the rows (reg, sec) of the double index with reg in regs and sec in secs (None: all).
+        '''
+        if not self.product or len(self.reg_codes) != len(self.regions) or len(self.sec_codes) != len(self.sectors): 
+            return(np.flatnonzero(self.mask(secs, regs)))
+        reg_codes = np.arange(len(self.regions)) if regs is None else np.unique(self._codes(regs, self.reg_codes))
+        sec_codes = np.arange(len(self.sectors)) if secs is None else np.unique(self._codes(secs, self.sec_codes))
+        return((reg_codes[:, None] * len(self.sectors) + sec_codes[None, :]).ravel())
+    
+    def label_positions(self, labels, of='sectors'):
+        '''
+        Returns the sorted array of the positions of labels in the regions or sectors (of='regions' or 'sectors').
+        '''
+        positions = self.sec_positions if of=='sectors' else self.reg_positions
+        found = [positions[l] for l in set(_as_labels(labels)) if l in positions]
+        return(np.sort(np.concatenate(found)) if found else np.array([], dtype=int))
+
+def _label_sources(self):
+    if self.name == 'THEMIS' or self.name == 'Cecilia': return((self.labels,))
+    return(tuple(self.__dict__[df].columns for df in ['A', 'L', 'Z', 'Y'] if self.__dict__.get(df) is not None))
+
+def label_index(self):
+    '''
+    Returns the LabelIndex of the IOSystem. 
+    
+    It is built at the first call and rebuilt when the labels change (new tables, rename_regions/sectors or aggregate).
+    '''
+    sources = _label_sources(self)
+    idx = self.__dict__.get('_label_idx')
+    if idx is None or len(idx.sources) != len(sources) or any(old is not new for old, new in zip(idx.sources, sources)):
+        if self.name == 'THEMIS': idx = LabelIndex(self.labels.regions, self.labels.sectors, self.labels.idx_regions, self.labels.idx_sectors)
+        elif self.name == 'Cecilia': idx = LabelIndex(self.labels.regions, self.labels.sectors)
+        else: idx = LabelIndex(self.get_regions(), self.get_sectors())
+        idx.sources = sources
+        self._label_idx = idx
+    return(idx)
+
 @property
 def regions(self): 
     '''
     Returns the list of all regions in the IOSystem
     '''
     if self.name == 'THEMIS' or self.name == 'Cecilia': return(self.labels.regions)
-    else: return(list(self.get_regions())) 
+    else: return(list(self.label_index().regions)) 
 
 @property
 def sectors(self): 
@@ -89,7 +326,7 @@ def sectors(self):
     Returns the list of all sectors in the IOSystem
     '''
     if self.name == 'THEMIS' or self.name == 'Cecilia': return(self.labels.sectors)
-    else: return(list(self.get_sectors()))
+    else: return(list(self.label_index().sectors))
 
 def prepare_secs_regs(self, secs, regs):
     '''
@@ -108,9 +345,9 @@ def index_secs(self, secs, vec_sectors=None):
     If secs is a string, returns the indexes of secs in vec_sectors; if secs is a list or array, returns the indexes of any of its elements.
     By default, vec_sectors is the sectors of the IOSystem.
     '''
-    if vec_sectors is None: vec_sectors = self.sectors
-    if type(secs)==str: return(np.array([i for i,x in enumerate(vec_sectors) if x == secs]))
-    else: return(np.array([i for i,x in enumerate(vec_sectors) if x in secs]))
+    if vec_sectors is None: return(self.label_index().label_positions(secs, of='sectors'))
+    secs = set(_as_labels(secs))
+    return(np.array([i for i,x in enumerate(vec_sectors) if x in secs], dtype=int))
     
 def index_regs(self, regs, vec_regions=None):
     '''
@@ -119,9 +356,9 @@ def index_regs(self, regs, vec_regions=None):
     If regs is a string, returns the indexes of regs in vec_regions; if regs is a list or array, returns the indexes of any of its elements.
     By default, vec_regions is the regions of the IOSystem.
     '''
-    if vec_regions is None: vec_regions = self.regions
-    if type(regs)==str: return(np.array([i for i,x in enumerate(vec_regions) if x == regs]))
-    else: return(np.array([i for i,x in enumerate(vec_regions) if x in regs]))
+    if vec_regions is None: return(self.label_index().label_positions(regs, of='regions'))
+    regs = set(_as_labels(regs))
+    return(np.array([i for i,x in enumerate(vec_regions) if x in regs], dtype=int))
 
 def regs_or_no(self, regs, yes=True):
     if yes: res = regs
@@ -150,13 +387,11 @@ def find(self, string, vec='impacts', unit = False): # TODO: allow insensitivity
 
 def is_in(self, secs = None, regs = None): # TODO: trim spaces for themis' foreground
     '''
-    Returns a list of booleans, where an element i is True iff it corresponds to a reg in regs and a sec in secs in the double index regions x sectors.
+    Returns an array of booleans, where an element i is True iff it corresponds to a reg in regs and a sec in secs in the double index regions x sectors.
     
     By default, secs is set to all sectors and regs to all regions.
     '''
-    secs, regs = self.prepare_secs_regs(secs, regs)
-    if self.name=='THEMIS': return(np.array([r in regs for r in self.labels.idx_regions])*np.array([s in secs for s in self.labels.idx_sectors]))
-    else: return([r in regs and s in secs for r in self.regions for s in self.sectors])
+    return(self.label_index().mask(secs, regs))
 
 def index_secs_regs(self, secs = None, regs = None):
     '''
@@ -164,19 +399,53 @@ def index_secs_regs(self, secs = None, regs = None):
     
     By default, secs is set to all sectors and regs to all regions.
     '''
-    return(list(np.where(self.is_in(secs, regs))[0]))
+    return(self.label_index().positions(secs, regs))
+
+def _region_operator(self, labels, keep=None):
+    '''
+    Returns the sparse matrix summing the columns with labels (region, ...) by region, one column per region of the IOSystem.
+    Columns where keep is False are left out.
+    '''
+    reg_codes = {reg: i for i, reg in enumerate(self.regions)}
+    codes = np.array([reg_codes.get(label[0], -1) for label in labels], dtype=int)
+    keep = codes >= 0 if keep is None else (codes >= 0) & np.asarray(keep, dtype=bool)
+    rows = np.flatnonzero(keep)
+    return(sp.csr_matrix((np.ones(len(rows)), (rows, codes[rows])), shape=(len(codes), len(reg_codes))))
+
+def _demand_categories(self, only_positive=True, categories=None):
+    if categories is None: categories = 'positive' if only_positive and self.name=='EXIOBASE' else 'all'
+    if isinstance(categories, str) and categories=='all': return(None)
+    if isinstance(categories, str) and categories=='positive': return(tuple(POSITIVE_Y_CATEGORIES))
+    return(tuple(_as_labels(categories)))
+
+def final_demand_blocks(self, only_positive=True, categories=None):
+    '''
+    Returns the matrix of final demand of each region (one column per region of the IOSystem), summing the categories of Y selected by categories: 
+    'all', 'positive' (all but 'Changes in inventories' and 'Changes in valuables') or a list of categories. 
+    By default, the positive categories for Exiobase if only_positive is True, otherwise all categories.
+    Computed once per selection of categories with a sparse operator on the columns of Y, and kept in the result cache of the IOSystem.
+    '''
+    categories = _demand_categories(self, only_positive, categories)
+    def compute():
+        keep = None if categories is None else self.Y.columns.get_level_values(1).isin(categories)
+        blocks = np.asarray(self.Y.values @ _region_operator(self, self.Y.columns, keep))
+        blocks.setflags(write=False)
+        return(blocks)
+    return(_cached_for(self, 'final_demand_blocks', (self.Y,), compute, categories))
 
-def final_demand(self, secs = None, regs = None, only_positive = True):
+def final_demand(self, secs = None, regs = None, only_positive = True, categories = None):
     '''
-    Returns the vector of final demand for (sec, reg) in secs x regs, computed from Y.
+    Returns the vector of final demand for (sec, reg) in secs x regs (0 for the other rows), computed from Y.
     
     If only_positive is True, doesn't take into account 'Changes in inventories' and 'Changes in valuables', which can be negative. (Works only for Exiobase)
-    '''
-    if only_positive and self.name=='EXIOBASE':
-        pos_y = ['Final consumption expenditure by government', 'Gross fixed capital formation', 'Export', \
-                'Final consumption expenditure by non-profit organisations serving households (NPISH)', 'Final consumption expenditure by households']
-        return(self.Y[[(reg,dom) for reg in self.regions for dom in pos_y]].sum(axis='columns')*self.is_in(secs, regs))
-    else: return(self.Y[[(reg,dom) for reg in self.regions for dom in io.Y.columns.levels[1]]].sum(axis='columns')*self.is_in(secs, regs))
+    categories selects other final demand categories: 'all', 'positive' or a list of categories (see final_demand_blocks).
+    '''
+    demand = self.final_demand_blocks(only_positive, categories).sum(axis=1)
+    if secs is not None or regs is not None:
+        pos = self.index_secs_regs(secs, regs)
+        demand, selected = np.zeros(len(demand)), demand
+        demand[pos] = selected[pos]
+    return(pd.Series(demand, index=self.Y.index))
 
 @property
 def secondary_energy_demand(self): # TODO: precalculate at the instantiation / TODO!: rename in 'electricity_demand' because this is what it is
@@ -186,15 +455,79 @@ def secondary_energy_demand(self): # TODO: precalculate at the instantiation / T
     if self.name=='THEMIS': return(self.energy.secondary_demand)
     else: return(self.final_demand(self.energy_sectors('secondary')))
     
+class IndicatorCache(object):
+    '''
+    Satellite indicators of an extension: its matrix S converted once to CSR, and the indicator vectors (sums of rows of S) extracted from it.
+    
+    Built by indicators for each extension and rebuilt when the S matrix of the extension (or the labels of its rows) are replaced.
+    Cached vectors are read-only.
+    '''
+    def __init__(self, S, labels):
+        self.S = S.tocsr() if sp.issparse(S) else sp.csr_matrix(np.asarray(S, dtype=float))
+        self.labels = list(labels)
+        self.positions = {label: i for i, label in enumerate(self.labels)}
+        self.sources = ()
+        self._vectors = {}
+        
+    def row_positions(self, rows):
+        '''
+        Returns the positions in S of rows, given by their labels or positions.
+        '''
+        if isinstance(rows, (str, tuple, int, np.integer)): rows = [rows]
+        return([int(row) if isinstance(row, (int, np.integer)) else self.positions[row] for row in rows])
+    
+    def matching(self, pattern):
+        '''
+        Returns the positions of the rows whose label contains pattern.
+        '''
+        return([i for i, label in enumerate(self.labels) if pattern in str(label)])
+        
+    def get(self, name, compute):
+        '''
+        Returns the vector cached under name, or computes it with compute() and stores it.
+        '''
+        if name not in self._vectors:
+            vector = np.asarray(compute(), dtype=float).ravel()
+            vector.setflags(write=False)
+            self._vectors[name] = vector
+        return(self._vectors[name])
+        
+    def vector(self, rows):
+        '''
+        Returns the sum of rows (labels or positions) of S.
+        '''
+        positions = self.row_positions(rows)
+        return(self.get(('rows',) + tuple(positions), lambda: self.S[positions].sum(axis=0)))
+
+def indicators(self, extension='impact'):
+    '''
+    Returns the IndicatorCache of extension (name or Extension, default: impact). 
+    
+    It is built at the first call and rebuilt when the S matrix of the extension is replaced (edit S in place only before the first call).
+    '''
+    ext = getattr(self, extension) if isinstance(extension, str) else extension
+    labels = self.labels.idx_impacts if sp.issparse(ext.S) else ext.S.index
+    caches = self.__dict__.setdefault('_indicators', {})
+    cache = caches.get(ext.name)
+    if cache is None or cache.sources[0] is not ext.S or cache.sources[1] is not labels:
+        cache = IndicatorCache(ext.S, labels)
+        cache.sources = (ext.S, labels)
+        caches[ext.name] = cache
+    return(cache)
+
+def indicator(self, rows, extension='impact'):
+    '''
+    Returns the vector of the indicator summing the rows (labels or positions) of the S matrix of extension, see indicators.
+    '''
+    return(self.indicators(extension).vector(rows))
+
 @property
 def VA(self): # TODO: exiobase
     '''
     Returns the vector of value added, by summing Operating surplus (Consumption of fixed capital, Rents on land, Royalties on resources, 
     Remainin net operating surplus), Compensation of Employees (wages & salaries, employers social contributions) and Fixed capital formation, unit: M€
     '''
-    if self.name=='THEMIS':
-        if not hasattr(self, 'VA_filled'): self.VA_filled = np.array(self.impact.S.tocsc()[list(range(1618,1624))+[1630]].sum(axis=0)).flatten()
-        return(self.VA_filled)
+    if self.name=='THEMIS': return(self.indicator(THEMIS_INDICATORS['value_added']))
     else: print('"Value added" not yet implemented for database other than THEMIS')
 
 def production(self, secs=None, regs=None, non_unitary_themis = True): # TODO: change name 'non_unitary_themis' to 'secondary_energy_sector'?
@@ -245,12 +578,15 @@ def energy_supply(self):
         return(self.materials.S.loc[[s.startswith('Gross Energy Supply - ') for s in self.materials.S.index]].sum())
     elif self.name=='EXIOBASE' and self.meta.version[0]=='2': return(self.impact.S.loc['Total Energy supply'])
     elif self.name=='THEMIS': 
-        if not hasattr(self, 'supply_filled'): 
-            self.supply_filled = ['Energy Carrier Supply' in sector for sector in self.labels.idx_impacts] * self.impact.S # act as .dot()
-            self.supply_filled[self.index_secs_regs('Electricity by solar CSP')] = np.ones(self.regions.size) * \
-                max(self.supply_filled[self.index_secs_regs('Electricity by solar CSP')]) # to have credible figures for solar CSP
+        if 'supply_filled' in self.__dict__: return(self.supply_filled) # filled by change_mix
+        def supply():
+            indicators = self.indicators()
+            supply = indicators.vector(indicators.matching('Energy Carrier Supply')).copy()
+            csp = self.index_secs_regs('Electricity by solar CSP')
+            if len(csp): supply[csp] = supply[csp].max() # to have credible figures for solar CSP
                 # without this, supply[CSP] = [0,0,0,10,80,5,0,0] which is weird, I set everything to 80 # except wind, no such discrepancy in other technos
-        return(self.supply_filled)
+            return(supply)
+        return(self.indicators().get('energy_supply', supply))
     else: return('Property not yet implemented for this IOSystem.')
     
 @property
@@ -258,9 +594,7 @@ def employment_low(self): # TODO: exiobase
     '''
     Returns the vector of Employment: low skilled, unit: 1000 persons
     '''
-    if self.name=='THEMIS':
-        if not hasattr(self, 'empl_low'): self.empl_low = self.impact.S.tocsc()[1624].toarray().flatten()
-        return(self.empl_low)
+    if self.name=='THEMIS': return(self.indicator(THEMIS_INDICATORS['employment_low']))
     else: print('"Employment" not yet implemented for database other than THEMIS')
     
 @property
@@ -268,9 +602,7 @@ def employment_medium(self): # TODO: exiobase
     '''
     Returns the vector of Employment: medium skilled, unit: 1000 persons
     '''
-    if self.name=='THEMIS':
-        if not hasattr(self, 'empl_medium'): self.empl_medium = self.impact.S.tocsc()[1625].toarray().flatten()
-        return(self.empl_medium)
+    if self.name=='THEMIS': return(self.indicator(THEMIS_INDICATORS['employment_medium']))
     else: print('"Employment" not yet implemented for database other than THEMIS')
             
 @property
@@ -278,9 +610,7 @@ def employment_high(self): # TODO: exiobase
     '''
     Returns the vector of Employment: high skilled, unit: 1000 persons
     '''
-    if self.name=='THEMIS':
-        if not hasattr(self, 'empl_high'): self.empl_high = self.impact.S.tocsc()[1626].toarray().flatten()
-        return(self.empl_high)
+    if self.name=='THEMIS': return(self.indicator(THEMIS_INDICATORS['employment_high']))
     else: print('"Employment" not yet implemented for database other than THEMIS')
                     
 @property
@@ -288,17 +618,17 @@ def employment_all(self): # TODO: exiobase
     '''
     Returns the vector of Employment (all skills combined), unit: 1000 persons
     '''
-    if self.name=='THEMIS':
-        if not hasattr(self, 'empl_all'): self.empl_all = np.array(self.impact.S.tocsc()[1624:1627].sum(axis=0)).flatten()
-        return(self.empl_all)
+    if self.name=='THEMIS': return(self.indicator(THEMIS_INDICATORS['employment_all']))
     else: print('"Employment" not yet implemented for database other than THEMIS')
              
+@memoized(prod=lambda self, args: self.production(args['secs'], args['regs']))
 def embodied_prod(self, secs=None, regs=None, prod = None):
     '''
     Returns the vector of embodied production for (sec, reg) in secs x regs, i.e. all the production required to produce their production, including them.
     
     When the Leontief inverse is not known, computes an approximate solution from the technology matrix A.
     If the production is pre-calculated, it can be passed as an argument.
+    Results are kept in the result cache of the IOSystem (see result_cache).
     /!\ Beware, for THEMIS, production is inferred using energy_demand/energy_supply for energy sectors, but is unitary for non-energy sectors.
     '''
     secs, regs = self.prepare_secs_regs(secs, regs)
@@ -306,10 +636,12 @@ def embodied_prod(self, secs=None, regs=None, prod = None):
     if self.L is None: return(spla.cgs(sp.eye(self.A.shape[0])-self.A, prod, approx_solution(self.A,prod).transpose().toarray()[0], tol=1e-7)[0])
     else: return(np.dot(self.L, prod))
 
+@memoized(production=lambda self, args: self.production(args['secs'], args['regs']))
 def embodied_impact(self, secs=None, regs=None, var='Total Energy supply', source='secondary', group_by='region', sort=False, production = None):
     '''
     Returns a vector of impact of type var embodied in the production of (sec, reg) in secs x regs, excluding their own production, and including only impacts
     from sectors in energy_sectors(source) if self.name!='exio34_ntnu'. Results are grouped by group_by (default: region) and can be sorted in decreasing order (default: unsorted).
+    Results are kept in the result cache of the IOSystem (see result_cache).
     '''
     secs, regs = self.prepare_secs_regs(secs, regs) # TODO: source = None
     if production is None: production = self.production(secs, regs)
@@ -350,14 +682,47 @@ def employments(self, secs = None, skill='all', recompute = True, indirect = Tru
         self.employ = employments
     return(self.employ)
 
+def _primary_inputs(self):
+    '''
+    Returns (table it is read from, vector of value added per unit of production): VA for THEMIS, the sum of the factor inputs otherwise.
+    '''
+    if self.name=='THEMIS': return((self.impact.S, self.VA))
+    ext = self.__dict__.get('factor_inputs')
+    if ext is None: raise ValueError('Value added requires the impact (THEMIS) or the factor_inputs extension')
+    S = ext.S if ext.S is not None else calc_S(ext.F, self.x)
+    return((S, np.asarray(S, dtype=float).sum(axis=0)))
+
+def prices(self, shock=None, secs=None, regs=None, va=None):
+    '''
+    Returns the series of prices (value per unit of production) of all (region, sector), computed at once with the Leontief price model p = v.L 
+    (see pymrio.calc_prices), where v is the value added per unit of production (VA for THEMIS, the factor inputs otherwise) unless va is given.
+    
+    shock is an exogenous relative price change (e.g. 0.1 for +10%) of (sec, reg) in secs x regs: their prices are fixed at (1 + shock) times 
+    their prices without shock, and the prices of all other sectors follow in one solve. 
+    Prices without shock are kept in the result cache of the IOSystem.
+    '''
+    solver = _leontief_solver(self)
+    if va is None:
+        table, va = _primary_inputs(self)
+        def compute():
+            base = calc_prices(va, lu=solver)
+            base.setflags(write=False)
+            return(base)
+        base = _cached_for(self, 'prices', (table,), compute)
+    else: base = calc_prices(va, lu=solver)
+    if shock is not None:
+        fixed = self.index_secs_regs(secs, regs)
+        base = calc_prices(va, lu=solver, exogenous=dict(zip(fixed, (1 + np.broadcast_to(shock, len(fixed))) * base[fixed])))
+    return(pd.Series(np.array(base), index=pd.MultiIndex.from_tuples(self.label_index().row_labels, names=['region', 'sector']), name='price'))
+
 def value_added(self, secs = None, regs = None, prod = None, indirect = True): # TODO: exiobase
     '''
-    For THEMIS: Returns the value added (in M€) of the embodied production of sectors secs in regions regs.
+    For THEMIS: Returns the value added (in M€) of the embodied production of sectors secs in regions regs, read from the prices (see prices).
     '''
     secs, regs = self.prepare_secs_regs(secs, regs)
     if prod is None: prod = self.production(secs, regs)
-    if indirect: return((self.VA * self.embodied_prod(secs, prod=prod)).sum())
-    else: return((self.VA * self.production(secs, prod=prod)).sum())
+    if indirect: return(self.prices().values @ np.asarray(prod, dtype=float))
+    else: return((self.VA * prod).sum())
 
 def price_energy(self, secs = None, regs = None, digits=0, indirect = True): # TODO: exiobase; while let the choice of indirect? indirect=False makes no sense
     '''
@@ -389,10 +754,14 @@ def sorted_array(self, array, index=None, group_by=None):
     if group_by is None: return(sorted_series(pd.Series(array, index=index)))
     else: return(sorted_series(pd.Series(array, index=index).groupby(group_by).sum()))
     
+def _top_items(series, nb_main):
+    if nb_main is None: return(sorted_series(series))
+    return(list(series.nlargest(nb_main).items()))
+
 # Traverse value chain backwards from regs-secs. group_by: None, sector, region / nb_main: number or 'all
 def inputs(self, secs=None, regs=None, var_impacts=[], source='all', order_recursion=4, nb_main=5, group_by='sector'): 
     '''
-    Returns the Structural Path Analysis, i.e. the inputs recursively embodied in the production of secs in regs.
+    Returns the inputs recursively embodied in the production of secs in regs, by tiers A^k.y (for the supply chain paths themselves, see structural_paths).
     
     var_impacts specifies the impacts of inputs to be displayed (e.g.: 'Total Energy supply', 'global warming (GWP100)', 'Employment' or 'Employment hour')
     source allows to restricts the inputs to certain sectors
@@ -404,36 +773,67 @@ def inputs(self, secs=None, regs=None, var_impacts=[], source='all', order_recur
     For THEMIS, returns only the second elements, embodied inputs, whose values have no clear interpretation because their units vary and can be physical.
     '''
     secs, regs = self.prepare_secs_regs(secs, regs)
-    if nb_main=='all': nb_main==self.nb_sectors()*self.nb_regions()
+    if nb_main=='all': nb_main = None
     if source=='all': source = self.sectors
     elif source=='secondary': source = self.energy_sectors('secondary')
     if type(var_impacts)==str: var_impacts = [var_impacts]
     nb_var = len(var_impacts)
+    A = _sparse_A(self)
+    multi_index = pd.MultiIndex.from_tuples(self.label_index().row_labels, names=['region', 'sector'])
+    def top(values, mask=None): 
+        values = pd.Series(np.asarray(values, dtype=float).ravel(), index=multi_index)
+        if mask is not None: values = values[mask]
+        if group_by is not None: values = values.groupby(group_by).sum()
+        return(_top_items(values, nb_main))
     demand = [None for i in range(order_recursion)]
     impacts = [[None for i in range(order_recursion)] for j in range(nb_var)]
     sums = [[] for i in range(nb_var+1)]
     if self.name=='THEMIS':
-        multi_index = pd.MultiIndex.from_arrays([self.labels.idx_regions, self.labels.idx_sectors], names=['region', 'sector']) # TODO: set as .x.index
-        demand[0] = pd.Series(self.is_in(secs, regs), index = multi_index)
+        demand[0] = self.is_in(secs, regs).astype(float)
         for i in range(0, order_recursion):
-            if i+1<order_recursion: demand[i+1] = pd.Series(self.A.dot(demand[i]), index = multi_index)
-        demand = list(map(lambda j: self.sorted_array(j * self.is_in(source, self.regions), index=multi_index, group_by=group_by)[0:nb_main], demand))
+            if i+1<order_recursion: demand[i+1] = A.dot(demand[i])
+        demand = list(map(lambda j: top(j * self.is_in(source, self.regions)), demand))
         return(demand) # TODO: stop showing recursive inputs as soon as they are 0.
     else:
     #     demand[0] = final_demand(secs, regs)
-        demand[0] = self.production(secs, regs)
+        demand[0] = np.asarray(self.production(secs, regs), dtype=float).ravel()
+        x = np.asarray(self.x, dtype=float).ravel()
+        direct_impacts = [np.asarray(self.impacts(var_impacts[l]), dtype=float).ravel() for l in range(0, nb_var)]
+        source_mask = self.is_in(source, self.regions)
         for i in range(0, order_recursion):
-            if nb_var>0: share_demand_i = div0(demand[i], self.x)
+            if nb_var>0: share_demand_i = div0(demand[i], x)
             for l in range(0, nb_var): 
-                impacts_l_i = self.impacts(var_impacts[l])*share_demand_i
-                impacts[l][i] = impacts_l_i[self.index_secs_regs(source, self.regions)]
+                impacts[l][i] = direct_impacts[l]*share_demand_i*source_mask
                 sums[l].append(impacts[l][i].sum())
-            if i+1<order_recursion: demand[i+1] = np.dot(self.A, demand[i])
+            if i+1<order_recursion: demand[i+1] = A.dot(demand[i])
             sums[nb_var].append(demand[i].sum())
-        for k in range(0, nb_var): impacts[k] = list(map(lambda j: self.sorted_array(j, group_by=group_by)[0:nb_main],impacts[k]))
-        demand = list(map(lambda j: self.sorted_array(j, group_by=group_by)[0:nb_main], demand))
+        for k in range(0, nb_var): impacts[k] = [top(impacts_k_i, source_mask) for impacts_k_i in impacts[k]]
+        demand = list(map(top, demand))
         return((impacts, demand, sums))
 
+def structural_paths(self, secs=None, regs=None, var='Total Energy supply', top_k=20, threshold=1e-4, max_depth=8, max_paths=1e5, time_budget=None):
+    '''
+    Returns the Structural Path Analysis of the production of secs in regs: the top_k supply chain paths by impact of type var (see iospa.structural_path_analysis).
+    
+    var can be an impact name, a vector of direct impacts per unit of output or None (paths of production, i.e. unit impacts).
+    The impact of paths is f[i_n] A[i_n, i_n-1] ... A[i_1, i_0] prod[i_0]: subtrees below threshold * total impact are pruned, and the search stops after max_paths
+    expanded paths or time_budget seconds (then the result is flagged as not complete).
+    Returns a namedtuple (paths, total, coverage, complete, nr_expanded), where paths gives each path as a tuple of (region, sector) going upstream.
+    '''
+    secs, regs = self.prepare_secs_regs(secs, regs)
+    prod = np.asarray(self.production(secs, regs), dtype=float).ravel()
+    if var is None: f = np.ones(len(prod))
+    elif not isinstance(var, str): f = np.asarray(var, dtype=float).ravel()
+    elif var=='Total Energy supply' and self.name != 'Cecilia': f = np.asarray(self.secondary_energy_supply, dtype=float).ravel()
+    else: f = div0(np.asarray(self.impacts(var), dtype=float).ravel(), np.asarray(self.x, dtype=float).ravel())
+    if self.L is not None: multipliers = np.asarray(f @ np.asarray(self.L), dtype=float).ravel()
+    else: multipliers = _leontief_lu(self).solve(f, trans='T')
+    res = structural_path_analysis(_sparse_A(self), prod, f, top_k=top_k, threshold=threshold, max_depth=max_depth, max_paths=max_paths, 
+                                   time_budget=time_budget, multipliers=multipliers)
+    row_labels = self.label_index().row_labels
+    res.paths['path'] = [tuple(row_labels[node] for node in path) for path in res.paths['path']]
+    return(res)
+
 def outputs(self, secs, out_sectors=None, nb_main=5):
     '''
     Returns a tuple: (the final demand, the list of sectors taking secs as inputs (i.e. the outputs), sorted decreasingly by use of secs)
@@ -451,9 +851,7 @@ def outputs(self, secs, out_sectors=None, nb_main=5):
                                     .sum().groupby('sector').sum()[out_sectors]/production)[0:nb_main]
     if not hasattr(self, 'Y') or self.Y is None: return(outputs_Z)
     else:
-        if not hasattr(self, 'y'): self.y = np.sum(self.Y, axis=1)
-        if out_sectors is None: out_sectors = self.sectors
-        return((self.y.iloc[self.index_secs_regs(secs, self.regions)].sum()/production, outputs_Z))
+        return((self.final_demand(only_positive=False).iloc[self.index_secs_regs(secs, self.regions)].sum()/production, outputs_Z))
 
 def energy_required(self, secs, regs=None, var='Total Energy supply', source='secondary', netting_fuel = True):
     '''
@@ -547,28 +945,125 @@ def erois(self, secs = None, var='Total Energy supply', source='secondary', nett
         self.share_direct_energy = des.copy() / ers.copy()
     return(self.eroi)
 
+def embodied_prods(self, prods):
+    '''
+    Returns the matrix of embodied productions of the columns of prods (one production vector per column), solving the Leontief system once for all columns.
+    
+    Uses the Leontief inverse if it is known, otherwise a sparse LU factorization of (I - A), kept in the result cache of the IOSystem.
+    '''
+    prods = np.asarray(prods, dtype=float)
+    if self.L is not None: return(np.asarray(self.L @ prods))
+    return(_leontief_lu(self).solve(prods))
+
+def _sparse_A(self):
+    return(self.result_cache().get(('sparse_A',), lambda: sp.csc_matrix(self.A.values if isinstance(self.A, pd.DataFrame) else self.A)))
+
+def _leontief_lu(self):
+    A = _sparse_A(self)
+    return(self.result_cache().get(('leontief_lu',), lambda: spla.splu(sp.csc_matrix(sp.eye(A.shape[0]) - A))))
+
+def _leontief_solver(self):
+    if self.L is not None: return(self.result_cache().get(('leontief_solver',), lambda: LeontiefSolver(L=self.L)))
+    return(self.result_cache().get(('leontief_solver',), lambda: LeontiefSolver(lu=_leontief_lu(self))))
+
+def _output(self):
+    if self.__dict__.get('x') is not None: return(np.asarray(self.x, dtype=float).ravel())
+    return(np.asarray(self.production(), dtype=float).ravel())
+
+def key_sectors(self, var=None, extension='impact', block_size=DIAGONAL_BLOCK_SIZE):
+    '''
+    Returns the table of key sectors: backward and forward linkages (see pymrio.calc_linkages) and output losses of the hypothetical extraction 
+    of each (region, sector) (see pymrio.hypothetical_extraction), or losses of impact var (a stressor of extension, see embodied_trade) if given.
+    All sectors are computed at once, with L or the factorization of (I - A), both kept in the result cache of the IOSystem with the diagonal of L.
+    /!\ For THEMIS, the output is the production (see production), which is 0 for non-energy sectors.
+    '''
+    x = _output(self)
+    solver = _leontief_solver(self)
+    index = pd.MultiIndex.from_tuples(self.label_index().row_labels, names=['region', 'sector'])
+    f = None if var is None else _intensities(self, var, extension)[1][0]
+    linkages = calc_linkages(None, x, lu=solver, index=index)
+    extraction = hypothetical_extraction(None, x, lu=solver, f=f, index=index, block_size=block_size)
+    return(linkages.join(extraction.add_prefix('extraction_')))
+
+def extract(self, secs=None, regs=None, var=None, extension='impact', kind='total', batch=None):
+    '''
+    Returns the losses of output (and of impact var, a stressor of extension, see embodied_trade) when (sec, reg) in secs x regs are 
+    hypothetically extracted, without copying the IOSystem: kind='total' removes all their inputs, outputs and final demand, 'backward' 
+    their intermediate inputs and 'forward' their intermediate sales (Ghosh model, no impact losses). See pymrio.extraction_losses.
+    
+    Without batch, all (sec, reg) are extracted together and the losses are given for each (region, sector) (columns output and impact).
+    batch='sector', 'region' or 'region_sector' extracts each sector (in all regs), each region (with all secs) or each (region, sector) separately, 
+    and returns the total losses per extraction (columns output, output_share, and impact, impact_share).
+    Uses the Woodbury update with the columns (or rows) of L of the extracted sectors, read from L or solved with the factorization of (I - A) 
+    kept in the result cache of the IOSystem.
+    '''
+    if var is not None and kind=='forward': raise ValueError('The Ghosh model (kind=forward) gives no impact losses')
+    secs, regs = self.prepare_secs_regs(secs, regs)
+    x, solver = _output(self), _leontief_solver(self)
+    f = None if var is None else _intensities(self, var, extension)[1][0]
+    if batch is None:
+        loss = extraction_losses(x, self.index_secs_regs(secs, regs), lu=solver, kind=kind)
+        res = pd.DataFrame({'output': loss}, index=pd.MultiIndex.from_tuples(self.label_index().row_labels, names=['region', 'sector']))
+        if f is not None: res['impact'] = f * loss
+        return(res)
+    if batch=='region_sector': 
+        pos = self.index_secs_regs(secs, regs)
+        index = pd.MultiIndex.from_tuples([self.label_index().row_labels[i] for i in pos], names=['region', 'sector'])
+        res = pd.DataFrame({'output': hypothetical_extraction(None, x, lu=solver)[kind].values[pos]}, index=index)
+        if f is not None: res['impact'] = hypothetical_extraction(None, x, lu=solver, f=f)[kind].values[pos]
+    else:
+        if batch=='sector': groups = {sec: self.index_secs_regs(sec, regs) for sec in secs}
+        elif batch=='region': groups = {reg: self.index_secs_regs(secs, reg) for reg in regs}
+        else: raise ValueError('batch must be one of sector, region, region_sector')
+        losses = {label: extraction_losses(x, pos, lu=solver, kind=kind) for label, pos in groups.items() if len(pos)}
+        res = pd.DataFrame({'output': [loss.sum() for loss in losses.values()]}, index=pd.Index(list(losses.keys()), name=batch))
+        if f is not None: res['impact'] = [f @ loss for loss in losses.values()]
+    res.insert(1, 'output_share', res.output / x.sum())
+    if f is not None: res['impact_share'] = res.impact / (f @ x)
+    return(res)
+
+def _erois_and_prices_loop(self, secs, regs_sel, secs_sel, var, source, netting_fuel, factor_elec):
+    erois, prices = [], []
+    for regs in regs_sel:
+        for s in secs_sel:
+            erois.append(self.ger(secs=s, regs=regs, var=var, source=source, netting_fuel=netting_fuel, factor_elec=factor_elec))
+            prices.append(self.price_energy(secs = s, regs = regs, digits=5, indirect = True))
+    return((np.array(erois, dtype=float), np.array(prices, dtype=float)))
+
 def erois_and_prices(self, secs = None, var='Total Energy supply', source='secondary', netting_fuel = True, factor_elec = 1, recompute=False):
     '''
     Returns the series of regional EROIs and prices of the list of sectors secs for each region, considering the energy from source with notion var.
+    
+    All (region, sector) selections are computed at once: their production vectors form one matrix for which the Leontief system is solved once (see embodied_prods), 
+    EROIs (as in ger) then follow from matrix products, and prices (as in price_energy) from the price vector (see prices). Cecilia and other var or source are computed selection by selection.
     '''
     if secs is None: 
         if self.scenario in ['REF', 'ER', 'ADV', 'combo']: secs = list(np.array(self.energy_sectors('electricities'))\
                                                                     [['CCS' not in s for s in self.energy_sectors('electricities')]])
         else: secs = self.energy_sectors('electricities')
     if recompute or not hasattr(self, 'eroi_price'):
-        res = pd.DataFrame(index = pd.MultiIndex.from_product([list(self.regions)+['World'], secs+['total']], names=['region', 'sector']), \
-                           columns = ['eroi', 'price'])
-        for reg in self.regions:
-            for i, sec in enumerate(secs):
-                res['eroi'][(reg, sec)] =self.ger(secs=sec,regs=reg,var=var,source=source,netting_fuel=netting_fuel,factor_elec=factor_elec)
-                res['price'][(reg, sec)] = self.price_energy(secs = sec, regs = reg, digits=5, indirect = True)
-            res['eroi'][(reg, 'total')]=self.ger(secs=secs,regs=reg,var=var,source=source,netting_fuel=netting_fuel,factor_elec=factor_elec)
-            res['price'][(reg, 'total')] = self.price_energy(secs = secs, regs = reg, digits=5, indirect = True)
-        for i, sec in enumerate(secs):
-            res['eroi'][('World', sec)]=self.ger(secs=sec, regs=self.regions, var=var, source=source, netting_fuel=netting_fuel, factor_elec=factor_elec)
-            res['price'][('World', sec)] = self.price_energy(secs = sec, regs = self.regions, digits=5, indirect = True)        
-        res['eroi'][('World', 'total')]=self.ger(secs=secs,regs=self.regions,var=var,source=source,netting_fuel=netting_fuel,factor_elec=factor_elec)
-        res['price'][('World', 'total')] = self.price_energy(secs = secs, regs = self.regions, digits=5, indirect = True)
+        TWh2TJ = 3.6e3
+        index = pd.MultiIndex.from_product([list(self.regions)+['World'], secs+['total']], names=['region', 'sector'])
+        regs_sel = [[reg] for reg in self.regions] + [list(self.regions)] # order of index: regions then World, sectors then total
+        secs_sel = [[sec] for sec in secs] + [list(secs)]
+        if self.name == 'Cecilia' or var != 'Total Energy supply' or source != 'secondary':
+            erois, prices = _erois_and_prices_loop(self, secs, regs_sel, secs_sel, var, source, netting_fuel, factor_elec)
+        else:
+            masks = np.column_stack([self.is_in(s, regs) for regs in regs_sel for s in secs_sel])
+            prod = masks * np.asarray(self.production(), dtype=float).reshape(-1, 1) # production() also sets secondary_energy/fuel_supply
+            embodied = self.embodied_prods(prod)
+            # energy_required for 'electricities' and 'secondary_heats' (as in ger), the latter net of fuels embodied in thermal plants
+            secondary_supply = np.asarray(self.secondary_energy_supply, dtype=float).ravel()
+            weights = factor_elec * secondary_supply * self.is_in(self.energy_sectors('electricities')) + \
+                secondary_supply * self.is_in(self.energy_sectors('secondary_heats'))
+            er = weights @ (embodied - prod)
+            if netting_fuel: 
+                fuel_inputs = np.asarray(self.A.T.dot(np.asarray(self.secondary_fuel_supply, dtype=float).ravel())).ravel()
+                er = er - (fuel_inputs * self.is_in(self.energy_sectors('elec_hydrocarbon'))) @ embodied
+            supply = np.asarray(self.secondary_energy_demand, dtype=float).ravel() @ masks
+            erois = np.round(factor_elec * supply / er, 1)
+            prices = np.round((self.prices().values @ prod) / ((np.asarray(self.energy_supply, dtype=float).ravel() @ prod) / TWh2TJ), 5)
+        res = pd.DataFrame({'eroi': erois, 'price': prices}, index = index, columns = ['eroi', 'price'])
         self.eroi_price = res.copy()
     return(self.eroi_price)
 
@@ -695,6 +1190,7 @@ def change_mix(self, global_mix = None, inplace = True, method = 'regional', pat
     if hasattr(self, 'dlr_elec'): dlr_sectors = self.dlr_elec['World'].index
     else: dlr_sectors = self.energy_sectors('elecs_names')
     TWh2TJ = 3.6e3
+    _bump_version(self) # the energy demand (and A if inplace) are modified in place
     self.secondary_energy_demand[np.where(self.secondary_energy_demand!=0)[0]] = 0
     for reg in self.regions: # TODO: integrate this change in secondary_energy_demand more properly
         if hasattr(self, 'dlr_elec'):
@@ -954,18 +1450,94 @@ def consumption_sectors(self, notion): # TODO: other sectors, difference from el
     elif notion=='undecided': sectors = ['Beverages', 'Paper and paper products', 'Printed matter and recorded media (22)']
     return(sectors)
 
-def embodied_conso(self, regs, secs): return(np.dot(self.L, final_demand(self, secs, regs)))
+def embodied_conso(self, regs, secs): return(self.embodied_prods(np.asarray(final_demand(self, secs, regs), dtype=float)))
 
-def embodied_import(self, var, secs, regs_imp, regs_exp=None, add=True, join=False, round_bn=False): 
-    # TODO: /!\ this function hasn't been checked/tested
+def embodied_demand(self, only_positive=True, categories=None):
     '''
-    sums across all regions embodied hours/employment/gain (=var) imported from sectors secs in regs_exp to regs_imp,
-    where var embodied in imports from reg to regs_imp in sector secs is equal to the product of:
-    . share of production in sec in reg exported to regs_imp
-    . (hours of, if var='hours') employment in sec in reg
-    . (if var=='gain') hourly wage in reg_ref - hourly wage in reg
-    join=False returns the results per country
-    add=True sums all hours/gain/employment across sectors
+    Returns the matrix of production embodied in the final demand of each region (one column per region), i.e. L y_r for each region r.
+    The final demand categories are selected as in final_demand_blocks. All regions are solved at once and the result is kept in the result cache of the IOSystem.
+    '''
+    categories = _demand_categories(self, only_positive, categories)
+    def compute():
+        prods = self.embodied_prods(self.final_demand_blocks(categories=categories or 'all'))
+        prods.setflags(write=False)
+        return(prods)
+    return(_cached_for(self, 'embodied_demand', (self.Y,), compute, categories))
+
+def _intensities(self, stressors=None, extension='impact'):
+    '''
+    Returns (stressors, matrix of their direct intensities per unit of production, one row per stressor) from the S matrix of extension.
+    By default all the stressors of extension. The stressor 'production' has intensity one, and 'Total Energy supply' is the energy_supply for THEMIS.
+    '''
+    ext = getattr(self, extension) if isinstance(extension, str) else extension
+    S = ext.S if getattr(ext, 'S', None) is not None else calc_S(ext.F, self.x)
+    if sp.issparse(S): S, names = sp.csr_matrix(S), list(self.labels.idx_impacts)
+    else: S, names = S.values, list(S.index)
+    if stressors is None: return((names, S.toarray() if sp.issparse(S) else S))
+    stressors = [stressors] if isinstance(stressors, (str, tuple)) else list(stressors)
+    positions = {name: i for i, name in enumerate(names)}
+    rows = []
+    for stressor in stressors:
+        if stressor in positions: row = S[positions[stressor]]
+        elif stressor=='production': row = np.ones(S.shape[1])
+        elif stressor=='Total Energy supply' and self.name=='THEMIS': row = self.energy_supply
+        else: raise KeyError('Stressor {} not found in the extension'.format(stressor))
+        rows.append(np.asarray(row.toarray() if sp.issparse(row) else row, dtype=float).ravel())
+    return((stressors, np.vstack(rows)))
+
+def _embodied_trade_array(self, stressors, extension, secs, by_sector, only_positive):
+    '''
+    Returns (stressors, positions of the rows of origin, array of embodied trade): stressor x row of origin x region_imp if by_sector, 
+    else stressor x region_exp x region_imp. Kept in the result cache of the IOSystem.
+    '''
+    ext = getattr(self, extension) if isinstance(extension, str) else extension
+    def compute():
+        names, intensity = _intensities(self, stressors, ext)
+        pos = self.index_secs_regs(secs)
+        embodied = embodied_demand(self, only_positive)
+        if by_sector: flows = intensity[:, pos, None] * embodied[None, pos, :]
+        else: # one product per region of origin, without the stressor x row x region array
+            row_regs = self.label_index().row_regs[pos]
+            flows = np.stack([intensity[:, rows] @ embodied[rows] for rows in (pos[row_regs==r] for r in range(self.nb_regions))], axis=1)
+        flows.setflags(write=False)
+        return((names, pos, flows))
+    return(_cached_for(self, 'embodied_trade', (self.Y, ext, getattr(ext, 'S', None), getattr(ext, 'F', None)), compute, 
+                       stressors, secs, by_sector, only_positive))
+
+def embodied_trade(self, stressors=None, extension='impact', secs=None, by_sector=False, only_positive=True):
+    '''
+    Returns the stressors embodied in the final demand of each region (region_imp), by region of origin (region_exp), as a tidy DataFrame
+    with the columns region_exp, (sector if by_sector), region_imp, stressor and value.
+    
+    The value of stressor k from region e to region i is the sum over the sectors s of e of S[k, (e,s)] * (L y_i)[(e,s)], where y_i is the final 
+    demand of i. Domestic flows (region_exp == region_imp) are included, such that summing over region_exp gives the footprint of region_imp.
+    stressors are rows of the S matrix of extension (default: all), or 'production' for the embodied production. secs restricts the sectors of origin.
+    All regions are computed with one product of L (or the factorization of I - A) with the final demand blocks, and the results are kept in 
+    the result cache of the IOSystem: embodied_import and imports read their slices from there.
+    '''
+    names, pos, flows = _embodied_trade_array(self, stressors, extension, secs, by_sector, only_positive)
+    regions = np.asarray(self.regions, dtype=object)
+    nb_exp, nb_imp, nb_var = flows.shape[1], flows.shape[2], flows.shape[0]
+    values = flows.transpose(1, 2, 0).ravel()
+    stressor = np.empty(len(names), dtype=object)
+    stressor[:] = names
+    res = pd.DataFrame({'region_exp': np.repeat(np.asarray(self.label_index().row_labels, dtype=object)[pos, 0] if by_sector else regions, nb_imp * nb_var)})
+    if by_sector: res['sector'] = np.repeat(np.asarray(self.label_index().row_labels, dtype=object)[pos, 1], nb_imp * nb_var)
+    res['region_imp'] = np.tile(np.repeat(regions, nb_var), nb_exp)
+    res['stressor'] = np.tile(stressor, nb_exp * nb_imp)
+    res['value'] = values
+    return(res)
+
+def embodied_import(self, var, secs, regs_imp, regs_exp=None, add=True, join=False, round_bn=False, extension='impact'): 
+    '''
+    sums across all regions embodied hours/employment/value added (=var, a stressor of extension) imported from sectors secs in regs_exp 
+    to regs_imp, where var embodied in imports from reg to regs_imp in sector secs is equal to the product of:
+    . share of production in sec in reg embodied in the final demand of regs_imp
+    . var in sec in reg
+    join=False returns the results per country (imports of each region in regs_imp from all other regions if regs_exp is None, 
+    exports of each region in regs_exp to all other regions if regs_imp is None)
+    add=True sums across sectors
+    Read from the embodied trade of all regions (see embodied_trade).
     '''
     # taking share_export if function of embodied_conso instead of embodied_value_added amounts to assume that the 
     #    ratio of value_added per production is constant within a sector-region among the different processes
@@ -974,87 +1546,61 @@ def embodied_import(self, var, secs, regs_imp, regs_exp=None, add=True, join=Fal
     #    will be biased upward, and imports of Chinese labor by other countries biased downard. 
     #    Still, this assumption seems reasonable. And we cannot relax it simply (if so, we could not use L any more,
     #    we would have to compute A, A^2, A^3,... and the value added at each step in the global value chain).
+    secs = _as_labels(secs)
+    names, pos, flows = _embodied_trade_array(self, var, extension, secs, True, True)
+    flows = flows[0]
+    row_regs = np.asarray(self.label_index().row_labels, dtype=object)[pos, 0]
+    def trade(exp, imp): return(flows[np.isin(row_regs, exp)][:, self.index_regs(imp)].sum(axis=1))
     if join:
-        if regs_imp is None: print('regs_imp should not be None for join=True')
-        if type(regs_exp)==str: nb_regs_exp = 1
-        else: nb_regs_exp = len(regs_exp)
+        if regs_imp is None: raise ValueError('regs_imp should not be None for join=True')
+        regs_imp = _as_labels(regs_imp)
         if regs_exp is None: regs_exp = self.not_regs(regs_imp)
-        share_export = div0(self.embodied_conso(regs_imp)[self.index_secs_regs(secs, regs_exp)], self.x.loc[regs_exp,secs])
-        if var!='gain': res = self.impacts(var, regs_exp, secs)*share_export
-        else: 
-            hourly_wage_ref = np.tile(hourly_wage(regs_imp, secs), nb_regs_exp)
-            res = (hourly_wage_ref - hourly_wage(regs_exp, secs))*impact('Employment hour', regs_exp, secs)*share_export
-    else:
-        if regs_exp is None: 
-            regs_ref = regs_imp
-            yes = True
-        elif regs_imp is None:
-            regs_ref = regs_exp
-            yes = False
-        else: print("regs_exp or regs_imp should be None for join=False")
-        share_export = np.array([div0(self.embodied_conso(self.regs_or_no(reg, yes))[self.index_secs_regs(self.regs_or_no(reg, not yes), \
-                                secs)], self.x.loc[self.regs_or_no(reg, not yes),secs]) for reg in regs_ref])
-        if  var!='unknown':
-            res = np.array([self.impacts(var, self.regs_or_no(reg, not yes), secs) for reg in regs_ref])*share_export
-        else:          
-            hourly_wage_ref = np.array([np.tile(hourly_wage(reg, secs), len(regions)-1) for reg in regs_ref])
-            hourly_wage_not_ref = np.array([hourly_wage(self.regs_or_no(reg, not yes), secs) for reg in regs_ref])
-            hours = np.array([impact('Employment hour', self.regs_or_no(reg, not yes), secs) for reg in regs_ref])
-#              # /!\ Employment hours are computed indirectly because data is aberrant
-#             hours = 1600*np.array([impact('Employment', regs_or_no(reg, not yes), secs) for reg in regs_ref])
-            if regs_imp is None:
-                share_export = np.array([np.concatenate([div0(self.embodied_conso(r)[self.index_secs_regs([reg], secs)], \
-                    self.x.loc[[reg],secs]) for r in self.not_regs(reg)]) for reg in regs_ref])
-                hours = np.array(list(map(lambda r: np.tile(r,(len(regions)-1)), hours))) 
-                hourly_wage_not_ref = np.array([np.concatenate([hourly_wage(r, secs, indirect=True, \
-                    positive=True) for r in self.not_regs(reg)]) for reg in regs_ref]) # TODO: better assessment of hourly wages
-            res = (hourly_wage_ref - hourly_wage_not_ref)*hours*share_export
-    if not add:
-        if round_bn:
-            return(round(res*pow(10,-9)))
-        else:
-            return(res)
-    else:
-        if join: 
-            r = res.sum()
-            if Var=='Employment hour': res = print(round(r), 'hours')
-            elif Var=='Employment': print(round(r*pow(10,-3),1), 'M persons')
-            else: print(round(r*pow(10,-9),1), 'G€')
-        else: r = [res[i].sum() for i in range(len(res))]
-        if round_bn:
-            return(round(r*pow(10,-9)))
-        else:
-            return(r)
+        res = trade(_as_labels(regs_exp), regs_imp)
+    elif regs_exp is None: 
+        res = np.array([trade(self.not_regs([reg]), reg) for reg in _as_labels(regs_imp)])
+    elif regs_imp is None:
+        res = np.array([trade(reg, self.not_regs([reg])) for reg in _as_labels(regs_exp)])
+    else: raise ValueError('regs_exp or regs_imp should be None for join=False')
+    if add: res = res.sum() if join else res.sum(axis=1)
+    if round_bn: return(np.round(res*pow(10,-9)))
+    else: return(res)
+
+def _trade_flows(self):
+    '''
+    Returns the matrix of direct deliveries (intermediate and final) of each row to each region (one column per region), computed from Z and Y.
+    '''
+    def compute():
+        flows = np.asarray(self.Z.values @ _region_operator(self, self.Z.columns) + self.Y.values @ _region_operator(self, self.Y.columns))
+        flows.setflags(write=False)
+        return(flows)
+    return(_cached_for(self, 'trade_flows', (self.Z, self.Y), compute))
 
 def imports(self, secs, regs_imp, regs_exp=None):
     '''
     Returns value of imports by regions in regs_imp from sectors in secs from regions in regs_exp, decomposed by secs, regs_exp.
     '''
-
-    if regs_imp is None: print('regs_imp should not be None for join=True')
+    if regs_imp is None: raise ValueError('regs_imp should not be None')
+    regs_imp = _as_labels(regs_imp)
     if regs_exp is None: regs_exp = self.not_regs(regs_imp)
-    imps = (self.Z.loc[[(r, s) for r in regs_exp for s in secs], [(r, s) for r in regs_imp for s in self.sectors]].sum(1)
-        + self.Y.loc[[(r, s) for r in regs_exp for s in secs], [r in regs_imp for r in self.Y.columns.get_level_values('region')]].sum(1))
-    return(imps)
+    pos = self.index_secs_regs(secs, regs_exp)
+    return(pd.Series(_trade_flows(self)[pos][:, self.index_regs(regs_imp)].sum(axis=1), index=self.Z.index[pos]))
     
-def impact_imports(self, var, secs, regs_imp, regs_exp=None):  
+def impact_imports(self, var, secs, regs_imp, regs_exp=None, extension='impact'):  
     '''
-    Returns impact of type var of goods imported by regions in regs_imp from sectors in secs from regions in regs_exp.
+    Returns impact of type var (a stressor of extension) of goods imported by regions in regs_imp from sectors in secs from regions in regs_exp.
     '''
-    if regs_exp is None: regs_exp = self.not_regs(regs_imp)
+    if regs_exp is None: regs_exp = self.not_regs(_as_labels(regs_imp))
     imps = self.imports(secs, regs_imp, regs_exp)
-    share_export = div0(imps, self.x.loc[regs_exp,secs])
-    impact = self.impacts(var, regs_exp, secs) * share_export
-    return(impact.sum())
+    intensity = _intensities(self, var, extension)[1][0][self.index_secs_regs(secs, regs_exp)]
+    return((intensity * imps.values).sum())
            
 def disseminate(self, vec, regs, secs):
     '''
     Returns a vector of the same size as self.x where the coefficients of vec are 'disseminated' 
     at locations of regs, secs (other coefficients are 0).
     '''
-    temp = self.x.copy()
-    temp.at[[(r, s) for r in regs for s in secs]] = vec
-    temp = temp*self.is_in(secs = secs, regs = regs)    
+    temp = pd.Series(0., index=self.x.index)
+    temp.iloc[self.index_secs_regs(secs, regs)] = np.asarray(vec, dtype=float)
     return(temp)
 
 def embodied_impact_imports(self, var, secs, regs_imp, regs_exp=None):  
@@ -1075,6 +1621,8 @@ IOS.not_regs = not_regs
 IOS.regs_or_no = regs_or_no
 IOS.embodied_conso = embodied_conso
 IOS.embodied_import = embodied_import
+IOS.embodied_trade = embodied_trade
+IOS.embodied_demand = embodied_demand
 IOS.aggregate_mix = aggregate_mix
 IOS.mix_matrix = mix_matrix
 IOS.change_mix = change_mix
@@ -1087,20 +1635,27 @@ IOS.nb_regions = nb_regions
 IOS.nb_sectors = nb_sectors
 IOS.find = find
 IOS.is_in = is_in
+IOS.label_index = label_index
 IOS.final_demand = final_demand
+IOS.final_demand_blocks = final_demand_blocks
 IOS.index_secs_regs = index_secs_regs
 IOS.production = production
 IOS.impacts = impacts
 IOS.embodied_prod = embodied_prod
 IOS.embodied_impact = embodied_impact
+IOS.result_cache = result_cache
 IOS.sorted_array = sorted_array
 IOS.inputs = inputs
+IOS.structural_paths = structural_paths
+IOS.key_sectors = key_sectors
+IOS.extract = extract
 IOS.outputs = outputs
 IOS.ger = ger
 IOS.err = err
 IOS.errs = errs
 IOS.erois = erois
 IOS.erois_and_prices = erois_and_prices
+IOS.embodied_prods = embodied_prods
 IOS.energy_sectors = energy_sectors
 IOS.regions = regions
 IOS.sectors = sectors
@@ -1108,7 +1663,10 @@ IOS.secondary_energy_demand = secondary_energy_demand
 IOS.energy_supply = energy_supply
 IOS.energy_required = energy_required
 IOS.VA = VA
+IOS.indicators = indicators
+IOS.indicator = indicator
 IOS.value_added = value_added
+IOS.prices = prices
 IOS.price_energy = price_energy
 IOS.energy_prices = energy_prices
 IOS.employment_high = employment_high
@@ -0,0 +1,387 @@
+""" Key sector analysis: linkages, Ghosh model and hypothetical extraction
+
+All sectors are analysed at once: the linkages need one solve of the
+Leontief system (and of its transpose), the hypothetical extractions
+additionally the diagonal of the Leontief inverse L, which is read from L
+if given or computed by batched solves with a (sparse) LU factorization of
+(I - A).
+
+The hypothetical extractions use closed forms of the rank-one
+(Sherman-Morrison) update of L. For the total output x = L y of the system,
+the output lost when
+
+    - all inputs and outputs of sector j are removed (total extraction) is
+      x_j (u L)_j / L_jj
+    - sector j buys no intermediate inputs (backward extraction) is
+      x_j ((u L)_j - 1) / L_jj
+    - sector j sells no intermediate products (forward extraction, Ghosh
+      model) is ((L x)_j - x_j) / L_jj
+
+with u a row vector of ones (replaced by the direct impacts f for the
+losses of an impact).
+
+The extraction of a group of sectors S (extraction_losses) uses the
+Woodbury update, which needs only the columns (or rows) of L of the
+extracted sectors: for the total extraction, the output lost is
+L[:, S] L[S, S]^-1 x[S].
+
+>>> lk = pymrio.calc_linkages(io.A, io.x, L=io.L)
+>>> hem = pymrio.hypothetical_extraction(io.A, io.x, L=io.L)
+>>> loss = pymrio.extraction_losses(io.x, [3, 11, 19], L=io.L)
+
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import linalg as spla
+
+from pymrio.tools.iomath import div0
+
+# Number of columns of the Leontief inverse computed per batch (diagonal)
+DIAGONAL_BLOCK_SIZE = 500
+
+
+def calc_B(Z, x):
+    """ Calculate the Ghosh allocation coefficients B from Z and x
+
+    B = diag(x)^-1 Z, the share of the output of the row sector sold to
+    the column sector.
+
+    Parameters
+    ----------
+    Z : pandas.DataFrame or numpy.array
+        Symmetric input output table (flows)
+    x : pandas.DataFrame or numpy.array
+        Industry output column vector
+
+    Returns
+    -------
+    pandas.DataFrame or numpy.array
+        Allocation coefficients B
+        The type is determined by the type of Z.
+        If DataFrame index/columns as Z
+
+    """
+    if isinstance(x, (pd.DataFrame, pd.Series)):
+        x = x.values
+    recix = div0(1, np.asarray(x, dtype=float).reshape((-1, 1)))
+    if type(Z) is pd.DataFrame:
+        return pd.DataFrame(Z.values * recix,
+                            index=Z.index, columns=Z.columns)
+    else:
+        return Z * recix
+
+
+def calc_G(B):
+    """ Calculate the Ghosh inverse G from B
+
+    Parameters
+    ----------
+    B : pandas.DataFrame or numpy.array
+        Allocation coefficients
+
+    Returns
+    -------
+    pandas.DataFrame or numpy.array
+        Ghosh inverse (I - B)^-1
+        The type is determined by the type of B.
+        If DataFrame index/columns as B
+
+    """
+    I = np.eye(B.shape[0])   # noqa
+    if type(B) is pd.DataFrame:
+        return pd.DataFrame(np.linalg.inv(I-B),
+                            index=B.index, columns=B.columns)
+    else:
+        return np.linalg.inv(I-B)
+
+
+def calc_G_from_L(L, x):
+    """ Calculate the Ghosh inverse G from the Leontief inverse L
+
+    G = diag(x)^-1 L diag(x), which avoids a second inversion.
+
+    Parameters
+    ----------
+    L : pandas.DataFrame or numpy.array
+        Leontief inverse
+    x : pandas.DataFrame or numpy.array
+        Industry output column vector
+
+    Returns
+    -------
+    pandas.DataFrame or numpy.array
+        Ghosh inverse G
+        The type is determined by the type of L.
+        If DataFrame index/columns as L
+
+    """
+    if isinstance(x, (pd.DataFrame, pd.Series)):
+        x = x.values
+    x = np.asarray(x, dtype=float).ravel()
+    G = div0(1, x).reshape((-1, 1)) * np.asarray(L) * x.reshape((1, -1))
+    if type(L) is pd.DataFrame:
+        return pd.DataFrame(G, index=L.index, columns=L.columns)
+    else:
+        return G
+
+
+class LeontiefSolver(object):
+
+    def __init__(self, A=None, L=None, lu=None):
+        """ Solutions of the Leontief system for many right hand sides
+
+        Uses the Leontief inverse L if given, otherwise the LU
+        factorization lu of (I - A) (computed from A if not given).
+
+        Parameters
+        ----------
+        A : numpy.array, scipy.sparse matrix or pandas.DataFrame, optional
+            Technical coefficients
+
+        L : numpy.array or pandas.DataFrame, optional
+            Leontief inverse
+
+        lu : scipy.sparse.linalg.SuperLU, optional
+            Factorization of (I - A), as returned by splu
+
+        """
+        self.L = None if L is None else np.asarray(L, dtype=float)
+        self.lu = lu
+        if self.L is None and lu is None:
+            if A is None:
+                raise ValueError('A, L or lu must be given')
+            A = sp.csc_matrix(np.asarray(A) if isinstance(A, pd.DataFrame)
+                              else A)
+            self.lu = spla.splu(sp.csc_matrix(sp.eye(A.shape[0]) - A))
+        self.shape = self.L.shape if self.L is not None else self.lu.shape
+        self._diagonal = None
+
+    def solve(self, b):
+        """ L b """
+        b = np.asarray(b, dtype=float)
+        return self.L @ b if self.L is not None else self.lu.solve(b)
+
+    def solve_T(self, b):
+        """ L' b (e.g. the multipliers f L for b = f) """
+        b = np.asarray(b, dtype=float)
+        if self.L is not None:
+            return self.L.T @ b
+        return self.lu.solve(b, trans='T')
+
+    def columns(self, positions):
+        """ Columns of L at positions (one solve per column if L is not known)
+        """
+        positions = np.asarray(positions, dtype=int)
+        if self.L is not None:
+            return self.L[:, positions]
+        unit = np.zeros((self.shape[0], len(positions)))
+        unit[positions, np.arange(len(positions))] = 1
+        return self.lu.solve(unit)
+
+    def rows(self, positions):
+        """ Rows of L at positions (one solve per row if L is not known)
+        """
+        positions = np.asarray(positions, dtype=int)
+        if self.L is not None:
+            return self.L[positions, :]
+        unit = np.zeros((self.shape[0], len(positions)))
+        unit[positions, np.arange(len(positions))] = 1
+        return self.lu.solve(unit, trans='T').T
+
+    def diagonal(self, block_size=DIAGONAL_BLOCK_SIZE):
+        """ Diagonal of L, by batches of block_size columns if L is not known
+
+        The diagonal is computed once per solver.
+        """
+        if self._diagonal is None:
+            if self.L is not None:
+                self._diagonal = np.diag(self.L).copy()
+            else:
+                nn = self.shape[0]
+                self._diagonal = np.empty(nn)
+                for start in range(0, nn, block_size):
+                    cols = np.arange(start, min(start + block_size, nn))
+                    unit = np.zeros((nn, len(cols)))
+                    unit[cols, np.arange(len(cols))] = 1
+                    self._diagonal[cols] = self.lu.solve(unit)[
+                        cols, np.arange(len(cols))]
+        return self._diagonal.copy()
+
+
+def _solver(A, L, lu):
+    return lu if isinstance(lu, LeontiefSolver) else LeontiefSolver(A, L, lu)
+
+
+def _index(A, L, index):
+    if index is not None:
+        return index
+    for mat in [A, L]:
+        if isinstance(mat, pd.DataFrame):
+            return mat.index
+    return None
+
+
+def calc_linkages(A, x, L=None, lu=None, index=None):
+    """ Backward and forward linkages of all sectors
+
+    Parameters
+    ----------
+    A : numpy.array, scipy.sparse matrix or pandas.DataFrame
+        Technical coefficients (can be None if L or lu are given)
+
+    x : array like
+        Industry output
+
+    L : numpy.array or pandas.DataFrame, optional
+        Leontief inverse, used instead of a factorization of (I - A)
+
+    lu : scipy.sparse.linalg.SuperLU or LeontiefSolver, optional
+        Factorization of (I - A), to reuse between calls
+
+    index : pandas.Index, optional
+        Labels of the sectors, by default the index of A (or L)
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per sector, with the columns
+
+        backward : total backward linkage, column sums of L
+        forward : total forward linkage, row sums of the Ghosh inverse G
+        backward_index, forward_index : linkages divided by their mean
+        key_sector : True if both indices are above 1
+
+    """
+    solver = _solver(A, L, lu)
+    x = np.asarray(x, dtype=float).ravel()
+    backward = solver.solve_T(np.ones(len(x)))
+    forward = div0(solver.solve(x), x)
+    linkages = pd.DataFrame(
+        dict(backward=backward, forward=forward,
+             backward_index=backward / backward.mean(),
+             forward_index=div0(forward, forward.mean())),
+        index=_index(A, L, index),
+        columns=['backward', 'forward', 'backward_index', 'forward_index'])
+    linkages['key_sector'] = ((linkages.backward_index > 1) &
+                              (linkages.forward_index > 1))
+    return linkages
+
+
+def hypothetical_extraction(A, x, L=None, lu=None, f=None, index=None,
+                            block_size=DIAGONAL_BLOCK_SIZE):
+    """ Output losses of the hypothetical extraction of each sector
+
+    Parameters
+    ----------
+    A : numpy.array, scipy.sparse matrix or pandas.DataFrame
+        Technical coefficients (can be None if L or lu are given)
+
+    x : array like
+        Industry output
+
+    L : numpy.array or pandas.DataFrame, optional
+        Leontief inverse, used instead of a factorization of (I - A)
+
+    lu : scipy.sparse.linalg.SuperLU or LeontiefSolver, optional
+        Factorization of (I - A), to reuse between calls
+
+    f : array like, optional
+        Direct impact per unit of output (e.g. a row of S). If given,
+        the losses of the impact f x are returned instead of the output
+        losses.
+
+    index : pandas.Index, optional
+        Labels of the sectors, by default the index of A (or L)
+
+    block_size : int, optional
+        Number of columns of L computed per batch for its diagonal
+        (only used without L)
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per sector, with the columns
+
+        total : loss when all inputs and outputs of the sector are removed
+        backward : loss when the sector buys no intermediate inputs
+        forward : loss when the sector sells no intermediate products
+            (not computed for impacts, as the Ghosh model gives no
+            impacts)
+        total_share : total loss relative to the total output (or impact)
+
+    """
+    solver = _solver(A, L, lu)
+    x = np.asarray(x, dtype=float).ravel()
+    diag = solver.diagonal(block_size)
+    if f is None:
+        f = np.ones(len(x))
+        losses = dict(forward=div0(solver.solve(x) - x, diag))
+    else:
+        f = np.asarray(f, dtype=float).ravel()
+        losses = dict()
+    multipliers = solver.solve_T(f)
+    losses['total'] = div0(x * multipliers, diag)
+    losses['backward'] = div0(x * (multipliers - f), diag)
+    extraction = pd.DataFrame(
+        losses, index=_index(A, L, index),
+        columns=[col for col in ['total', 'backward', 'forward']
+                 if col in losses])
+    extraction['total_share'] = extraction.total / (f @ x)
+    return extraction
+
+
+def extraction_losses(x, extracted, A=None, L=None, lu=None, kind='total'):
+    """ Output losses of the hypothetical extraction of a group of sectors
+
+    Parameters
+    ----------
+    x : array like
+        Industry output
+
+    extracted : array like of int
+        Positions of the sectors extracted together
+
+    A : numpy.array, scipy.sparse matrix or pandas.DataFrame, optional
+        Technical coefficients (not needed if L or lu are given)
+
+    L : numpy.array or pandas.DataFrame, optional
+        Leontief inverse, used instead of a factorization of (I - A)
+
+    lu : scipy.sparse.linalg.SuperLU or LeontiefSolver, optional
+        Factorization of (I - A), to reuse between calls
+
+    kind : str, optional
+        'total' (default): all inputs, outputs and the final demand of the
+        extracted sectors are removed, 'backward': the extracted sectors buy
+        no intermediate inputs, 'forward': the extracted sectors sell no
+        intermediate products (Ghosh model)
+
+    Returns
+    -------
+    numpy.array
+        Loss of output of each sector (for kind='total', the extracted
+        sectors lose all their output). Multiply by the direct impacts
+        per unit of output to get the losses of an impact (except for
+        kind='forward').
+
+    """
+    solver = _solver(A, L, lu)
+    x = np.asarray(x, dtype=float).ravel()
+    extracted = np.unique(np.asarray(extracted, dtype=int))
+    if kind in ['total', 'backward']:
+        cols = solver.columns(extracted)
+        weights = np.linalg.solve(cols[extracted], x[extracted])
+        loss = cols @ weights
+        if kind == 'backward':
+            loss[extracted] -= weights
+    elif kind == 'forward':
+        rows = solver.rows(extracted)
+        weights = np.linalg.solve(rows[:, extracted].T,
+                                  np.ones(len(extracted)))
+        loss = x * (rows.T @ weights)
+        loss[extracted] -= x[extracted] * weights
+    else:
+        raise ValueError('kind must be one of total, backward, forward')
+    return loss
@@ -391,6 +391,85 @@ def calc_accounts(S, L, Y, nr_sectors):
 
     return (D_cba, D_pba, D_imp, D_exp)
 
+
+def calc_Z_from_SUT(V, U, technology='industry', output='pxp'):
+    """ Calculate the symmetric flow table Z from supply and use tables
+
+    Implements the four basic models for transforming supply and use tables
+    into symmetric input output tables (Eurostat Manual of Supply, Use and
+    Input-Output Tables, 2008, chapter 11):
+
+        ============ =========== ==============================
+        technology   output      Z
+        ============ =========== ==============================
+        'product'    'pxp'       U V^-1 diag(q)      (model A)
+        'industry'   'pxp'       U diag(g)^-1 V'     (model B)
+        'product'    'ixi'       diag(g) V^-1 U      (model C)
+        'industry'   'ixi'       V' diag(q)^-1 U     (model D)
+        ============ =========== ==============================
+
+    with the product output q (row sums of V) and the industry output g
+    (column sums of V). Rows (columns) with zero output are set to zero.
+    The product technology models require a square supply table.
+
+    Parameters
+    ----------
+    V : pandas.DataFrame, numpy.array or scipy.sparse matrix
+        Supply table (products x industries)
+    U : pandas.DataFrame, numpy.array or scipy.sparse matrix
+        Use table (products x industries)
+    technology : str, optional
+        'industry' (default) or 'product' technology assumption
+    output : str, optional
+        'pxp' (default) for a product by product or 'ixi' for an
+        industry by industry table
+
+    Returns
+    -------
+    pandas.DataFrame or numpy.array
+        Z, the type is determined by the type of U. In case of DataFrames,
+        the index/columns are given by the rows of U (pxp) or the
+        columns of U (ixi).
+
+    """
+    if technology not in ['industry', 'product']:
+        raise ValueError('technology must be "industry" or "product"')
+    if output not in ['pxp', 'ixi']:
+        raise ValueError('output must be "pxp" or "ixi"')
+
+    labels = None
+    if type(U) is pd.DataFrame:
+        labels = U.index if output == 'pxp' else U.columns
+    V_val = V if sp.issparse(V) else np.asarray(V, dtype='float')
+    U_val = U if sp.issparse(U) else np.asarray(U, dtype='float')
+
+    q = np.asarray(V_val.sum(axis=1), dtype='float').flatten()
+    g = np.asarray(V_val.sum(axis=0), dtype='float').flatten()
+    q_inv = np.divide(1, q, out=np.zeros_like(q), where=q != 0)
+    g_inv = np.divide(1, g, out=np.zeros_like(g), where=g != 0)
+
+    if technology == 'industry':
+        # diagonal matrices as sparse products: no dense n x n diagonal
+        if output == 'pxp':
+            Z = (U_val @ sp.diags(g_inv)) @ V_val.T
+        else:
+            Z = V_val.T @ (sp.diags(q_inv) @ U_val)
+    else:
+        V_dense = V_val.toarray() if sp.issparse(V_val) else V_val
+        U_dense = U_val.toarray() if sp.issparse(U_val) else U_val
+        if output == 'pxp':
+            # U V^-1 = (V'^-1 U')'
+            Z = np.linalg.solve(V_dense.T, U_dense.T).T * q.reshape((1, -1))
+        else:
+            Z = g.reshape((-1, 1)) * np.linalg.solve(V_dense, U_dense)
+
+    if sp.issparse(Z):
+        Z = Z.toarray()
+    Z = np.asarray(Z)
+    if labels is not None:
+        return pd.DataFrame(Z, index=labels, columns=labels)
+    return Z
+
 def sorted_series(series): 
     '''
     Returns the sorted panda series, grouped by group_by if it is not None, and indexed by index (the default index is that of regions x sectors)
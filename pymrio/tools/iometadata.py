@@ -11,6 +11,7 @@ from pathlib import Path
 from collections import OrderedDict
 
 from pymrio.core.constants import DEFAULT_FILE_NAMES
+from pymrio.tools.ioutil import open_archive
 
 
 class MRIOMetaData(object):
@@ -23,7 +24,8 @@ class MRIOMetaData(object):
                  version=None,
                  year=None,
                  path_in_arc='',
-                 logger_function=logging.info): #   
+                 logger_function=logging.info,
+                 archive=None): #   
 
         """ Organzises the MRIO meta data
 
@@ -87,18 +89,24 @@ class MRIOMetaData(object):
             passed to this function. By default, the funtion
             is set to logging.info. Set to None for no output.
 
+        archive: ArchiveSession, optional
+            Open session of the zip archive given at 'location'. If given,
+            the metadata is read through this session instead of opening
+            the archive again.
+
         """
+        self._archive = None
         if location:
             location = Path(location)
             self._path_in_arc = None
             if location.is_file():
                 self._metadata_file = location
-                if zipfile.is_zipfile(str(location)):
-                    with zipfile.ZipFile(file=str(location)) as zf:
-                        if path_in_arc not in zf.namelist():
-                            path_in_arc = os.path.join(
-                                path_in_arc,
-                                DEFAULT_FILE_NAMES['metadata'])
+                self._archive = open_archive(location, archive)
+                if self._archive:
+                    if path_in_arc not in self._archive:
+                        path_in_arc = os.path.join(
+                            path_in_arc,
+                            DEFAULT_FILE_NAMES['metadata'])
 
                     self._path_in_arc = str(path_in_arc)
 
@@ -119,7 +127,7 @@ class MRIOMetaData(object):
             self._read_content()
             self.logger("Read metadata from {}".format(self._metadata_file))
 
-            if zipfile.is_zipfile(str(self._metadata_file)):
+            if self._archive:
                 self._metadata_file = None
                 self._path_in_arc = None
 
@@ -147,6 +155,10 @@ class MRIOMetaData(object):
                 ])
             self.logger("Start recording metadata")
 
+        if self._archive and self._archive is not archive:
+            self._archive.close()
+        self._archive = None
+
     def __repr__(self):
         return (self.__str__())
 
@@ -292,7 +304,9 @@ class MRIOMetaData(object):
         should not be used in isolation: it overwrites
         unsafed metadata.
         """
-        if self._path_in_arc:
+        if self._path_in_arc and self._archive:
+            self._content = self._archive.read_json(self._path_in_arc)
+        elif self._path_in_arc:
             with zipfile.ZipFile(file=str(self._metadata_file)) as zf:
                 self._content = json.loads(
                     zf.read(self._path_in_arc).decode('utf-8'),
@@ -5,9 +5,14 @@ as
 KST 20140903
 """
 
+import collections.abc
+import functools
+import json
 import os
 import re
 import logging
+import multiprocessing
+import threading
 import warnings
 
 import pandas as pd
@@ -16,6 +21,8 @@ import scipy.io
 import scipy.sparse as sp
 import zipfile
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 
 from pymrio.core.mriosystem import IOSystem
 from pymrio.core.mriosystem import Extension
@@ -23,11 +30,19 @@ from pymrio.core.fileio import load_all
 from pymrio.tools.iometadata import MRIOMetaData
 from pymrio.tools.ioutil import sniff_csv_format
 from pymrio.tools.ioutil import get_repo_content
+from pymrio.tools.ioutil import read_csv_table
+from pymrio.tools.ioutil import ArchiveSession
+from pymrio.tools.ioutil import thread_map
+from pymrio.tools.ioutil import CachedExcelFile
+from pymrio.tools.ioutil import build_agg_matrix
+from pymrio.tools.iocache import cached_parser
+from pymrio.tools.iocache import _source_files
 
 # Constants and global variables
 from pymrio.core.constants import PYMRIO_PATH
 
 from pymrio.tools.iomath import div0
+from pymrio.tools.iomath import calc_Z_from_SUT
 
 
 # Exceptions
@@ -65,10 +80,14 @@ IDX_NAMES = {
     '_reg_sec_unit': ['region', 'sector', 'unit'],
 }
 
+# Start of the names of the OECD ICIO files, followed by the year
+OECD_FILE_STARTS = ['ICIO2016_', 'ICIO2018_']
+
 
 # Top level functions
 def parse_exio12_ext(ext_file, index_col, name, drop_compartment=True,
-                     version=None, year=None, iosystem=None, sep=','):
+                     version=None, year=None, iosystem=None, sep=',',
+                     dtype='float64'):
     """ Parse an EXIOBASE version 1 or 2 like extension file into pymrio.Extension
 
     EXIOBASE like extensions files are assumed to have two
@@ -114,6 +133,9 @@ def parse_exio12_ext(ext_file, index_col, name, drop_compartment=True,
     sep : string, optional
         Delimiter to use; default ','
 
+    dtype : str or numpy dtype, optional
+        Type of the parsed values, default 'float64'.
+
     Returns
     -------
     pymrio.Extension
@@ -123,11 +145,11 @@ def parse_exio12_ext(ext_file, index_col, name, drop_compartment=True,
 
     ext_file = os.path.abspath(str(ext_file))
 
-    F = pd.read_csv(
+    F = read_csv_table(
         ext_file,
-        header=[0, 1],
-        index_col=list(range(index_col)),
-        sep=sep)
+        index_col=index_col,
+        header_rows=2,
+        sep=sep, dtype=dtype)
 
     F.columns.names = ['region', 'sector']
 
@@ -262,7 +284,8 @@ def get_exiobase_files(path, coefficients=True):
     return exio_files
 
 
-def generic_exiobase12_parser(exio_files, system=None):
+def generic_exiobase12_parser(exio_files, system=None, dtype='float64',
+                              workers=None, engine='c'):
     """ Generic EXIOBASE version 1 and 2 parser
 
     This is used internally by parse_exiobase1 / 2 functions to
@@ -278,6 +301,22 @@ def generic_exiobase12_parser(exio_files, system=None):
     system: str (pxp or ixi)
         Only used for the metadata
 
+    dtype: str or numpy dtype, optional
+        Type of the parsed values, default 'float64'.
+        Pass 'float32' to half the memory requirement.
+
+    workers: int, optional
+        Number of threads for parsing the files concurrently.
+        Default: None (sequential parsing)
+
+    engine: str, optional
+        CSV engine for the numerical tables (see
+        pymrio.tools.ioutil.read_csv_table): 'c' (default) reads each table
+        in chunks, which bounds the memory requirement, 'pyarrow' (requires
+        pyarrow) parses each table at once with multiple threads, which is
+        faster but needs memory for the parsed table in addition to the
+        resulting one.
+
     """
 
     version = ' & '.join({dd.get('version', '')
@@ -297,25 +336,37 @@ def generic_exiobase12_parser(exio_files, system=None):
 
     core_data = dict()
     ext_data = dict()
-    for tt, tpara in exio_files.items():
+    archives = {tpara['root_repo']: ArchiveSession(tpara['root_repo'])
+                for tpara in exio_files.values()
+                if tpara['root_repo'][-3:] == 'zip'}
+
+    def _parse_file(tpara):
         full_file_path = os.path.join(tpara['root_repo'], tpara['file_path'])
         logging.debug("Parse {}".format(full_file_path))
-        if tpara['root_repo'][-3:] == 'zip':
-            with zipfile.ZipFile(tpara['root_repo'], 'r') as zz:
-                raw_data = pd.read_csv(
-                    zz.open(tpara['file_path']),
-                    index_col=list(range(tpara['index_col'])),
-                    header=list(range(tpara['index_rows'])),
-                    sep='\t')
+        if tpara['root_repo'] in archives:
+            return read_csv_table(
+                tpara['file_path'],
+                index_col=tpara['index_col'],
+                header_rows=tpara['index_rows'],
+                sep='\t', dtype=dtype, engine=engine,
+                zip_file=archives[tpara['root_repo']])
         else:
-            raw_data = pd.read_csv(
+            return read_csv_table(
                 full_file_path,
-                index_col=list(range(tpara['index_col'])),
-                header=list(range(tpara['index_rows'])),
-                sep='\t')
+                index_col=tpara['index_col'],
+                header_rows=tpara['index_rows'],
+                sep='\t', dtype=dtype, engine=engine)
+
+    try:
+        parsed = thread_map(_parse_file, exio_files.values(),
+                            workers=workers)
+    finally:
+        for arc in archives.values():
+            arc.close()
 
+    for (tt, tpara), raw_data in zip(exio_files.items(), parsed):
         meta_rec._add_fileio('EXIOBASE data {} parsed from {}'.format(
-            tt, full_file_path))
+            tt, os.path.join(tpara['root_repo'], tpara['file_path'])))
         if tt in core_components:
             core_data[tt] = raw_data
         else:
@@ -426,7 +477,8 @@ def _get_MRIO_system(path):
     return system
 
 
-def parse_exiobase1(path):
+@cached_parser()
+def parse_exiobase1(path, dtype='float64', workers=None, engine='c'):
     """ Parse the exiobase1 raw data files.
 
     This function works with
@@ -446,6 +498,22 @@ def parse_exiobase1(path):
     path : pathlib.Path or string
         Path of the exiobase 1 data
 
+    dtype : str or numpy dtype, optional
+        Type of the parsed values, default 'float64'.
+        Pass 'float32' to half the memory requirement.
+
+    workers : int, optional
+        Number of threads for parsing the EXIOBASE files concurrently.
+        Default: None (sequential parsing)
+
+    engine : str, optional
+        CSV engine for the numerical tables (see
+        pymrio.tools.ioutil.read_csv_table): 'c' (default) reads each table
+        in chunks, which bounds the memory requirement, 'pyarrow' (requires
+        pyarrow) parses each table at once with multiple threads, which is
+        faster but needs memory for the parsed table in addition to the
+        resulting one.
+
     Returns
     -------
     pymrio.IOSystem with exio1 data
@@ -462,11 +530,14 @@ def parse_exiobase1(path):
         logging.warning("Could not determine system (pxp or ixi)"
                         " set system parameter manually")
 
-    io = generic_exiobase12_parser(exio_files, system=system)
+    io = generic_exiobase12_parser(exio_files, system=system, dtype=dtype,
+                                   workers=workers, engine=engine)
     return io
 
 
-def parse_exiobase2(path, charact=True, popvector='exio2'):
+@cached_parser()
+def parse_exiobase2(path, charact=True, popvector='exio2', dtype='float64',
+                    workers=None, excel_cache=True, engine='c'):
     """ Parse the exiobase 2.2.2 source files for the IOSystem
 
     The function parse product by product and industry by industry source file
@@ -494,6 +565,25 @@ def parse_exiobase2(path, charact=True, popvector='exio2'):
         pd.DataFrame(index = population, columns = countrynames) or, (default)
         will be taken from the pymrio module. If popvector = None no population
         data will be passed to the IOSystem.
+    dtype : str or numpy dtype, optional
+        Type of the parsed values, default 'float64'.
+        Pass 'float32' to half the memory requirement.
+    workers : int, optional
+        Number of threads for parsing the EXIOBASE files concurrently.
+        Default: None (sequential parsing)
+    excel_cache : boolean or string, optional
+        If True (default), the sheets of the characterisation file are
+        stored as binary files in a folder '.excel_cache' next to the
+        source files and read from there in subsequent calls.
+        Pass a path to use a different cache folder or False to read
+        the Excel file directly.
+    engine : str, optional
+        CSV engine for the numerical tables (see
+        pymrio.tools.ioutil.read_csv_table): 'c' (default) reads each table
+        in chunks, which bounds the memory requirement, 'pyarrow' (requires
+        pyarrow) parses each table at once with multiple threads, which is
+        faster but needs memory for the parsed table in addition to the
+        resulting one.
 
     Returns
     -------
@@ -517,7 +607,8 @@ def parse_exiobase2(path, charact=True, popvector='exio2'):
         logging.warning("Could not determine system (pxp or ixi)"
                         " set system parameter manually")
 
-    io = generic_exiobase12_parser(exio_files, system=system)
+    io = generic_exiobase12_parser(exio_files, system=system, dtype=dtype,
+                                   workers=workers, engine=engine)
 
     # read the characterisation matrices if available
     # and build one extension with the impacts
@@ -560,13 +651,9 @@ def parse_exiobase2(path, charact=True, popvector='exio2'):
         Q_head_col_rowunit['Q_resources'] = 1
         Q_head_col_rowunit['Q_materials'] = 1
 
-        if charact is str:
-            charac_data = {Qname: pd.read_excel(
-                           charact,
-                           sheet_name=Qname,
-                           skiprows=list(range(0, Q_head_row[Qname])),
-                           header=None)
-                           for Qname in Qsheets}
+        excel_cache_dir = None if excel_cache is True else excel_cache
+        if isinstance(charact, str):
+            charac_file = CachedExcelFile(charact, cache_dir=excel_cache_dir)
         else:
             _content = get_repo_content(path)
             charac_regex = re.compile(r'(?<!\_)(?<!\.)characterisation.*xlsx')
@@ -580,78 +667,68 @@ def parse_exiobase2(path, charact=True, popvector='exio2'):
                 raise ParserError(
                     "No characcterisation file found "
                     "in {}".format(path))
+            elif _content.iszip:
+                charac_file = CachedExcelFile(path, member=charac_files[0],
+                                              cache_dir=excel_cache_dir)
             else:
-                if _content.iszip:
-                    with zipfile.ZipFile(path, 'r') as zz:
-                        charac_data = {Qname: pd.read_excel(
-                                       zz.open(charac_files[0]),
-                                       sheet_name=Qname,
-                                       skiprows=list(
-                                           range(0, Q_head_row[Qname])),
-                                       header=None)
-                                       for Qname in Qsheets}
-
-                else:
-                    charac_data = {Qname: pd.read_excel(
-                                   os.path.join(path, charac_files[0]),
-                                   sheet_name=Qname,
-                                   skiprows=list(range(0, Q_head_row[Qname])),
-                                   header=None)
-                                   for Qname in Qsheets}
-
-        _unit = dict()
-        # temp for the calculated impacts which than
-        # get summarized in the 'impact'
-        _impact = dict()
-        impact = dict()
+                charac_file = CachedExcelFile(
+                    os.path.join(path, charac_files[0]),
+                    cache_dir=excel_cache_dir)
+
+        # the workbook is opened at most once for all sheets
+        with charac_file:
+            charac_data = {Qname: charac_file.parse(
+                           sheet_name=Qname,
+                           skiprows=list(range(0, Q_head_row[Qname])),
+                           header=None)
+                           for Qname in Qsheets}
+
+        # The characterisation matrices are combined into one block
+        # diagonal operator, which is applied to the stacked stressors of
+        # all extensions at once
+        Q_blocks = []
+        Q_index = []
+        Q_unit = []
+        ext_S = []
+        ext_F_Y = []
         for Qname in Qsheets:
             # unfortunately the names in Q_emissions are
             # not completely unique - fix that
-            if Qname is 'Q_emission':
-                _index = charac_data[Qname][Q_head_col_rowname[Qname]].copy()
+            _index = charac_data[Qname][Q_head_col_rowname[Qname]].copy()
+            if Qname == 'Q_emission':
                 _index.iloc[42] = _index.iloc[42] + ' 2008'
                 _index.iloc[43] = _index.iloc[43] + ' 2008'
                 _index.iloc[44] = _index.iloc[44] + ' 2010'
                 _index.iloc[45] = _index.iloc[45] + ' 2010'
-                charac_data[Qname][Q_head_col_rowname[Qname]] = _index
-
-            charac_data[Qname].index = (
-                charac_data[Qname][Q_head_col_rowname[Qname]])
-
-            _unit[Qname] = pd.DataFrame(
-                charac_data[Qname].iloc[:, Q_head_col_rowunit[Qname]])
-            _unit[Qname].columns = ['unit']
-            _unit[Qname].index.name = 'impact'
-            charac_data[Qname] = charac_data[Qname].iloc[
-                :, Q_head_col_rowunit[Qname]+1:]
-            charac_data[Qname].index.name = 'impact'
-
+            Q_index.append(_index)
+            Q_unit.append(charac_data[Qname].iloc[
+                :, Q_head_col_rowunit[Qname]])
+            Q_blocks.append(sp.csr_matrix(charac_data[Qname].iloc[
+                :, Q_head_col_rowunit[Qname]+1:].values.astype('float')))
+
+            ext = io.__dict__[Qsheets[Qname]]
+            ext_S.append(ext.S.values)
             try:
-                _F_Y = io.__dict__[Qsheets[Qname]].F_Y.values
+                ext_F_Y.append(ext.F_Y.values)
             except AttributeError:
-                _F_Y = np.zeros([io.__dict__[Qsheets[Qname]].S.shape[0],
-                                 io.Y.shape[1]])
+                ext_F_Y.append(np.zeros([ext.S.shape[0], io.Y.shape[1]]))
 
-            _impact[Qname] = {'S': charac_data[Qname].dot(
-                io.__dict__[Qsheets[Qname]].S.values),
-                'F_Y': charac_data[Qname].dot(_F_Y),
-                'unit': _unit[Qname]
-            }
+        Q_operator = sp.block_diag(Q_blocks, format='csr')
+        impact_index = pd.Index(np.concatenate(Q_index), name='impact')
 
-        impact['S'] = (_impact['Q_factorinputs']['S']
-                       .append(_impact['Q_emission']['S'])
-                       .append(_impact['Q_materials']['S'])
-                       .append(_impact['Q_resources']['S']))
-        impact['F_Y'] = (_impact['Q_factorinputs']['F_Y']
-                         .append(_impact['Q_emission']['F_Y'])
-                         .append(_impact['Q_materials']['F_Y'])
-                         .append(_impact['Q_resources']['F_Y']))
-        impact['S'].columns = io.emissions.S.columns
-        impact['F_Y'].columns = io.emissions.F_Y.columns
-        impact['unit'] = (_impact['Q_factorinputs']['unit']
-                          .append(_impact['Q_emission']['unit'])
-                          .append(_impact['Q_materials']['unit'])
-                          .append(_impact['Q_resources']['unit']))
+        impact = dict()
+        impact['S'] = pd.DataFrame(
+            data=Q_operator.dot(np.vstack(ext_S)),
+            index=impact_index,
+            columns=io.emissions.S.columns)
+        impact['F_Y'] = pd.DataFrame(
+            data=Q_operator.dot(np.vstack(ext_F_Y)),
+            index=impact_index,
+            columns=io.emissions.F_Y.columns)
+        impact['unit'] = pd.DataFrame(
+            data=np.concatenate(Q_unit),
+            index=impact_index,
+            columns=['unit'])
         impact['name'] = 'impact'
         io.impact = Extension(**impact)
 
@@ -666,6 +743,7 @@ def parse_exiobase2(path, charact=True, popvector='exio2'):
     return io
 
 
+@cached_parser()
 def parse_exiobase3(path):
     """ Parses the public EXIOBASE 3 system
 
@@ -755,8 +833,25 @@ def parse_exiobase3(path):
     return io
 
 
+def _wiod_source_files(arguments):
+    """ Files read by parse_wiod (for the parse cache)
+
+    The WIOT of the parsed year and the extension files in its folder,
+    but not the WIOTs of other years.
+    """
+    path = Path(arguments['path'])
+    if path.is_dir():
+        wiot_start = 'wiot' + str(arguments['year'])[-2:]
+    else:
+        wiot_start, path = path.name[:6], path.parent
+    return [ff for ff in _source_files(path)
+            if not ff.name.startswith('wiot') or
+            ff.name.startswith(wiot_start)]
+
+
+@cached_parser(sources=_wiod_source_files)
 def parse_wiod(path, year=None, names=('isic', 'c_codes'),
-               popvector=None):
+               popvector=None, excel_cache=True):
     """ Parse the wiod source files for the IOSystem
 
     WIOD provides the MRIO tables in excel - format (xlsx) at
@@ -821,6 +916,13 @@ def parse_wiod(path, year=None, names=('isic', 'c_codes'),
         classification, fd categories), eg ('isic', 'full'). Names are case
         insensitive and passing the first character is sufficient.
     TODO popvector : TO BE IMPLEMENTED (consistent with EXIOBASE)
+    excel_cache : boolean or string, optional
+        If True (default), the parsed Excel sheets (WIOT, SEA and
+        environmental extensions) are stored as binary files in a folder
+        '.excel_cache' next to the source files. Subsequent calls read
+        from this cache, which is renewed when the source files change.
+        Pass a path to use a different cache folder or False to read
+        the Excel files directly.
 
     Returns
     -------
@@ -899,9 +1001,9 @@ def parse_wiod(path, year=None, names=('isic', 'c_codes'),
 
     # Wiod has an unfortunate file structure with overlapping metadata and
     # header. In order to deal with that first the full file is read.
-    wiot_data = pd.read_excel(wiot_file,
-                              sheet_name=wiot_sheet,
-                              header=None)
+    excel_cache_dir = None if excel_cache is True else excel_cache
+    with CachedExcelFile(wiot_file, cache_dir=excel_cache_dir) as wiot_excel:
+        wiot_data = wiot_excel.parse(sheet_name=wiot_sheet, header=None)
 
     meta_rec._add_fileio('WIOD data parsed from {}'.format(wiot_file))
     # get meta data
@@ -1036,7 +1138,7 @@ def parse_wiod(path, year=None, names=('isic', 'c_codes'),
 
     # SEA extension
     _F_sea_data, _F_sea_unit = __get_WIOD_SEA_extension(
-        root_path=root_path, year=wiot_year)
+        root_path=root_path, year=wiot_year, excel_cache=excel_cache)
     if _F_sea_data is not None:
         # None if no SEA file present
         _F_Y_sea = pd.DataFrame(index=_F_sea_data.index,
@@ -1122,7 +1224,8 @@ def parse_wiod(path, year=None, names=('isic', 'c_codes'),
         _dl_ex = __get_WIOD_env_extension(root_path=root_path,
                                           year=wiot_year,
                                           ll_co=ll_countries,
-                                          para=dl_envext_para[ik_ext])
+                                          para=dl_envext_para[ik_ext],
+                                          excel_cache=excel_cache)
         if _dl_ex is not None:
             # None if extension not available
             _F_Y = _dl_ex['F_Y']
@@ -1188,7 +1291,7 @@ def parse_wiod(path, year=None, names=('isic', 'c_codes'),
     return wiod
 
 
-def __get_WIOD_env_extension(root_path, year, ll_co, para):
+def __get_WIOD_env_extension(root_path, year, ll_co, para, excel_cache=True):
     """ Parses the wiod environmental extension
 
     Extension can either be given as original .zip files or as extracted
@@ -1213,6 +1316,8 @@ def __get_WIOD_env_extension(root_path, year, ll_co, para):
         extension data in the given folder.
     para : dict
         Defining the parameters for reading the extension.
+    excel_cache : boolean or string, optional
+        Binary cache for the xls files, see parse_wiod
 
     Returns
     -------
@@ -1267,16 +1372,21 @@ def __get_WIOD_env_extension(root_path, year, ll_co, para):
 
         pff_read = ll_pff_read[0]
 
+        excel_cache_dir = None if excel_cache is True else excel_cache
         if pf_env.endswith('.zip'):
-            ff_excel = pd.ExcelFile(rf_zip.open(pff_read))
-        else:
-            ff_excel = pd.ExcelFile(os.path.join(pf_env, pff_read))
-        if str(year) in ff_excel.sheet_names:
-            df_env = ff_excel.parse(sheet_name=str(year),
-                                    index_col=None,
-                                    header=0
-                                    )
+            ff_excel = CachedExcelFile(pf_env, member=pff_read,
+                                       cache_dir=excel_cache_dir)
         else:
+            ff_excel = CachedExcelFile(os.path.join(pf_env, pff_read),
+                                       cache_dir=excel_cache_dir)
+        with ff_excel:
+            sheet_available = str(year) in ff_excel.sheet_names
+            if sheet_available:
+                df_env = ff_excel.parse(sheet_name=str(year),
+                                        index_col=None,
+                                        header=0
+                                        )
+        if not sheet_available:
             warnings.warn('Extension {} does not include'
                           'data for the year {} - '
                           'Extension not included'.format(para['start'], year),
@@ -1349,7 +1459,8 @@ def __get_WIOD_env_extension(root_path, year, ll_co, para):
             }
 
 
-def __get_WIOD_SEA_extension(root_path, year, data_sheet='DATA'):
+def __get_WIOD_SEA_extension(root_path, year, data_sheet='DATA',
+                             excel_cache=True):
     """ Utility function to get the extension data from the SEA file in WIOD
 
     This function is based on the structure in the WIOD_SEA_July14 file.
@@ -1366,6 +1477,8 @@ def __get_WIOD_SEA_extension(root_path, year, data_sheet='DATA'):
         Year to return for the extension
     sea_data_sheet : string, optional
         Worksheet with the SEA data in the excel file
+    excel_cache : boolean or string, optional
+        Binary cache for the xlsx file, see parse_wiod
 
     Returns
     -------
@@ -1386,10 +1499,11 @@ def __get_WIOD_SEA_extension(root_path, year, data_sheet='DATA'):
         # read data
         sea_file = os.path.join(_SEA_folder, sorted(sea_folder_content)[0])
 
-        df_sea = pd.read_excel(sea_file,
-                               sheet_name=data_sheet,
-                               header=0,
-                               index_col=[0, 1, 2, 3])
+        excel_cache_dir = None if excel_cache is True else excel_cache
+        with CachedExcelFile(sea_file, cache_dir=excel_cache_dir) as sea_excel:
+            df_sea = sea_excel.parse(sheet_name=data_sheet,
+                                     header=0,
+                                     index_col=[0, 1, 2, 3])
 
         # fix years
         ic_sea = df_sea.columns.tolist()
@@ -1449,6 +1563,18 @@ def __get_WIOD_SEA_extension(root_path, year, data_sheet='DATA'):
         return None, None
 
 
+def _oecd_source_files(arguments):
+    """ Files read by parse_oecd (for the parse cache): the table of the year
+    """
+    path = Path(arguments['path'])
+    if not path.is_dir():
+        return [path]
+    return [ff for ff in _source_files(path) if ff.parent == path and
+            ff.stem in [start + str(arguments['year'])
+                        for start in OECD_FILE_STARTS]]
+
+
+@cached_parser(sources=_oecd_source_files)
 def parse_oecd(path, year=None):
     """ Parse the OECD ICIO tables
 
@@ -1494,8 +1620,6 @@ def parse_oecd(path, year=None):
 
     path = os.path.abspath(os.path.normpath(str(path)))
 
-    oecd_file_starts = ['ICIO2016_', 'ICIO2018_']
-
     # determine which oecd file to be parsed
     if not os.path.isdir(path):
         # 1. case - one file specified in path
@@ -1512,7 +1636,7 @@ def parse_oecd(path, year=None):
             fl for fl in os.listdir(path)
             if (os.path.splitext(fl)[1] in ['.csv', '.CSV', '.zip'] and
                 os.path.splitext(fl)[0] in [oo + str(year) for oo
-                                            in oecd_file_starts])]
+                                            in OECD_FILE_STARTS])]
 
         if len(oecd_file_list) > 1:
             unique_file_data = set([os.path.splitext(fl)[0]
@@ -1607,25 +1731,31 @@ def parse_oecd(path, year=None):
         CHN=[a for a in core_co_names if re.match(r'CN\d', a)],
         MEX=[a for a in core_co_names if re.match(r'MX\d', a)])
 
-    for co_name, agg_list in agg_corr.items():
-        if (co_name not in core_co_names) or (len(agg_list) == 0):
-            continue
-        # aggregate rows
-        Z.loc[co_name, :] = (Z.loc[[co_name], :] +
-                             Z.loc[agg_list, :].sum(level='sector', axis=0))
-        Z = Z.drop(agg_list, axis=0)
-        Y.loc[co_name, :] = (Y.loc[[co_name], :] +
-                             Y.loc[agg_list, :].sum(level='sector', axis=0))
-        Y = Y.drop(agg_list, axis=0)
-
-        # aggregate columns
-        Z.loc[:, co_name] = (Z.loc[:, [co_name]] +
-                             Z.loc[:, agg_list].sum(level='sector', axis=1))
-        Z = Z.drop(agg_list, axis=1)
-        F_factor_input.loc[:, co_name] = (
-            F_factor_input.loc[:, [co_name]] +
-            F_factor_input.loc[:, agg_list].sum(level='sector', axis=1))
-        F_factor_input = F_factor_input.drop(agg_list, axis=1)
+    sub_regions = {sub: co_name for co_name, agg_list in agg_corr.items()
+                   if co_name in core_co_names for sub in agg_list}
+
+    if sub_regions:
+        # One concordance for all subregions, applied to rows and columns
+        agg_index = Z.index[~Z.index.get_level_values('region').isin(
+            list(sub_regions.keys()))]
+        agg_pos = {idx: pos for pos, idx in enumerate(agg_index)}
+        try:
+            agg_vec = [agg_pos[(sub_regions.get(reg, reg), sec)]
+                       for reg, sec in Z.index]
+        except KeyError as ke:
+            raise ParserError(
+                'Sector {} of a subregion not present in the '
+                'main region'.format(ke))
+        conc = build_agg_matrix(agg_vec, sparse=True)
+
+        Z = pd.DataFrame(data=conc.dot(conc.dot(Z.values).T).T,
+                         index=agg_index, columns=agg_index.copy())
+        Z.columns.names = IDX_NAMES['Z_col']
+        Y = pd.DataFrame(data=conc.dot(Y.values),
+                         index=agg_index, columns=Y.columns)
+        F_factor_input = pd.DataFrame(
+            data=conc.dot(F_factor_input.values.T).T,
+            index=F_factor_input.index, columns=Z.columns)
 
     # unit df generation at the end to have consistent index
     unit = pd.DataFrame(index=Z.index,
@@ -1652,7 +1782,31 @@ def parse_oecd(path, year=None):
     return oecd
 
 
-def parse_eora26(path, year=None, price='bp', country_names='eora'):
+def _eora26_source_files(arguments):
+    """ Files read by parse_eora26 (for the parse cache)
+
+    The zip file of the year and price, or the unpacked files of the year
+    and price (and the label files) if there is no zip file.
+    """
+    path = Path(arguments['path'])
+    if path.suffix == '.zip':
+        return [path]
+    year, price = str(arguments['year']), str(arguments['price'])
+    if (path / year).is_dir():
+        path = path / year
+    files = [ff for ff in _source_files(path) if ff.parent == path]
+    eora_zips = [ff for ff in files if ff.suffix == '.zip' and
+                 year in ff.name and price in ff.name]
+    if eora_zips:
+        return eora_zips
+    return [ff for ff in files if ff.suffix != '.zip' and
+            (not ff.name.startswith('Eora26_') or
+             ff.name.startswith('Eora26_{}_{}_'.format(year, price)))]
+
+
+@cached_parser(sources=_eora26_source_files)
+def parse_eora26(path, year=None, price='bp', country_names='eora',
+                 workers=None):
     """ Parse the Eora26 database
 
     Note
@@ -1695,6 +1849,9 @@ def parse_eora26(path, year=None, price='bp', country_names='eora'):
         'full' = Full country names as provided by Eora
         Passing the first letter suffice.
 
+    workers: int, optional
+        Number of threads for parsing the Eora files concurrently.
+        Default: None (sequential parsing)
 
     """
     path = os.path.abspath(os.path.normpath(str(path)))
@@ -1797,23 +1954,17 @@ def parse_eora26(path, year=None, price='bp', country_names='eora'):
     }
 
     if is_zip:
-        zip_file = zipfile.ZipFile(eora_loc)
-        eora_data = {
-            key: pd.read_csv(
-                zip_file.open(filename),
-                sep=eora_sep,
-                header=None,
-            ) for
-            key, filename in eora_files.items()}
-        zip_file.close()
+        with ArchiveSession(eora_loc) as arc:
+            parsed = arc.map_members(
+                lambda member, mf: pd.read_csv(mf, sep=eora_sep,
+                                               header=None),
+                list(eora_files.values()), workers=workers)
     else:
-        eora_data = {
-            key: pd.read_csv(
-                os.path.join(eora_loc, filename),
-                sep=eora_sep,
-                header=None,
-            ) for
-            key, filename in eora_files.items()}
+        parsed = thread_map(
+            lambda filename: pd.read_csv(os.path.join(eora_loc, filename),
+                                         sep=eora_sep, header=None),
+            eora_files.values(), workers=workers)
+    eora_data = dict(zip(eora_files.keys(), parsed))
     meta_rec._add_fileio(
         'Eora26 for {year}-{price} data parsed from {loc}'.format(
             year=year, price=price, loc=eora_loc))
@@ -1895,7 +2046,198 @@ def parse_eora26(path, year=None, price='bp', country_names='eora'):
 
     return eora
 
-def themis_parser(exio_files, year = None, scenario = None, themis = None, themis_caracs=None, labels=None, dlr_files=None, combo=True, compute_all=False):
+
+def _themis_source_files(arguments):
+    """ Files read by themis_parser (for the parse cache) """
+    root = arguments['exio_files']
+    return [root + 'Data/THEMIS2.mat',
+            root + 'Data/Characterization_endpoint2.mat',
+            root + 'Data/THEMIS2_labels.xls',
+            root + 'Supplementary info & mixes.xlsx']
+
+
+class _MatMatrices(collections.abc.Mapping):
+    """ Matrices of a .mat file, converted once to one file per matrix
+
+    At the first access, the content of mat_file is written to cache_dir
+    (sparse matrices as npz, dense arrays as npy). Afterwards, each matrix
+    is only read from its own file when it is accessed. The conversion is
+    renewed when the size or modification time of mat_file changes.
+    """
+    def __init__(self, mat_file, cache_dir):
+        self.mat_file = Path(mat_file)
+        self.cache_dir = Path(cache_dir)
+        self._loaded = dict()
+        stat = self.mat_file.stat()
+        stamp = [self.mat_file.name, stat.st_size, stat.st_mtime_ns]
+        index_file = self.cache_dir / (self.mat_file.stem + '.json')
+        try:
+            with index_file.open('r') as idf:
+                index = json.load(idf)
+        except (OSError, ValueError):
+            index = dict()
+        if index.get('stamp') != stamp:
+            index = dict(stamp=stamp, matrices=self._convert())
+            with index_file.open('w') as idf:
+                json.dump(index, idf)
+        self._matrices = index['matrices']
+
+    def _convert(self):
+        logging.info('Converting {} to single matrix files in {}'.format(
+            self.mat_file, self.cache_dir))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        matrices = dict()
+        for name, value in scipy.io.loadmat(str(self.mat_file)).items():
+            if name.startswith('__'):
+                continue
+            if sp.issparse(value):
+                matrices[name] = name + '.npz'
+                sp.save_npz(str(self.cache_dir / matrices[name]),
+                            value, compressed=False)
+            else:
+                matrices[name] = name + '.npy'
+                np.save(str(self.cache_dir / matrices[name]), value)
+            self._loaded[name] = value
+        return matrices
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            matrix_file = str(self.cache_dir / self._matrices[name])
+            if matrix_file.endswith('.npz'):
+                self._loaded[name] = sp.load_npz(matrix_file)
+            else:
+                self._loaded[name] = np.load(matrix_file)
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self._matrices)
+
+    def __len__(self):
+        return len(self._matrices)
+
+
+class _LazySystems(collections.abc.MutableMapping):
+    """ Systems which are only built when accessed
+
+    build is called with the key of a missing system and must assign
+    the system to the mapping (it can access other systems of the same or
+    other lazy mappings). Pickling builds all systems and results
+    in a plain dict.
+    """
+    def __init__(self, keys, build):
+        self._keys = list(keys)
+        self._build = build
+        self._systems = dict()
+
+    def __getitem__(self, key):
+        if key not in self._systems:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._build(key)
+        return self._systems[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._systems[key] = value
+
+    def __delitem__(self, key):
+        self._keys.remove(key)
+        self._systems.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return '{{{}}}'.format(', '.join(
+            '{!r}: {}'.format(key, 'IOSystem' if key in self._systems
+                              else '(not built)') for key in self._keys))
+
+    def __reduce__(self):
+        return (dict, (dict(self.items()), ))
+
+
+# Systems evaluated by the workers of themis_compute_all. Forked workers
+# inherit them (and their matrices) from the parent process without copying.
+_THEMIS_COMPUTE_SYSTEMS = dict()
+
+
+def _themis_compute_system(system, s, y):
+    # the compute_all steps of themis_parser for the system of scenario s and year y
+    if s=='combo' and y==2050: system.world_mix = system.agg_mix
+    else: system.world_mix = system.aggregate_mix(recompute=True)
+    if s in ['REF', 'ER', 'ADV']: 
+        system.wo_GW_adj.eroi_adj = system.wo_GW_adj.erois(factor_elec = 2.6, recompute=True).rename(index={'Power sector': 'total'})
+        system.wo_GW_adj.eroi = system.wo_GW_adj.erois(recompute=True).rename(index={'Power sector': 'total'})
+        system.wo_GW_adj.energy_prices()
+        system.wo_GW_adj.employ_direct = system.wo_GW_adj.employments()
+        system.wo_GW_adj.employments(indirect = False, recompute = True)
+    system.eroi_adj = system.erois(factor_elec = 2.6, recompute=True).rename(index={'Power sector': 'total'})
+    system.eroi = system.erois(recompute=True).rename(index={'Power sector': 'total'})
+    system.energy_prices()
+    system.employ_direct = system.employments()
+    system.employments(indirect = False, recompute = True) # pb with employments combo 2050
+
+
+def _compute_targets(system):
+    return [system] + ([system.wo_GW_adj] if hasattr(system, 'wo_GW_adj') else [])
+
+
+# Private caches of the systems (see iofunctions), rebuilt on demand: not sent back by the workers
+_THEMIS_PRIVATE_CACHES = ('_result_cache', '_indicators', '_label_idx')
+
+
+def _themis_compute_job(key, system=None):
+    # runs in a worker process, returns only the attributes set by the computation
+    if system is None: system = _THEMIS_COMPUTE_SYSTEMS[key]
+    before = [dict(vars(target)) for target in _compute_targets(system)]
+    _themis_compute_system(system, *key)
+    return(key, [{att: val for att, val in vars(target).items() 
+                  if att not in _THEMIS_PRIVATE_CACHES and (att not in old or val is not old[att])} 
+                 for target, old in zip(_compute_targets(system), before)])
+
+
+def themis_compute_all(all_themis, workers=None, progress_function=logging.info):
+    """ Precalculates EROIs, prices, value-added and employments of all THEMIS systems (the compute_all option of themis_parser)
+
+    all_themis is the dict of scenarios and years returned by themis_parser. The (scenario, year) systems are independent and
+        are computed in parallel processes if workers > 1. On platforms which support fork, the workers share the systems
+        (and their A and S matrices) with the current process, only the results are sent back.
+    progress_function receives a message after each computed system (None to deactivate)
+    Returns all_themis, with the results stored in the systems as with compute_all=True
+    """
+    jobs = [(s, y) for s in all_themis for y in all_themis[s]]
+    systems = {(s, y): all_themis[s][y] for s, y in jobs} # builds the lazy systems before forking
+    def report(nr, key):
+        if progress_function: progress_function('THEMIS {} {} computed ({}/{})'.format(key[0], key[1], nr, len(jobs)))
+    
+    if not workers or workers <= 1 or len(jobs) <= 1:
+        for nr, key in enumerate(jobs, 1):
+            _themis_compute_system(systems[key], *key)
+            report(nr, key)
+        return(all_themis)
+
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    _THEMIS_COMPUTE_SYSTEMS.update(systems)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork') if fork else None) as pool:
+            futures = [pool.submit(_themis_compute_job, key, None if fork else systems[key]) for key in jobs]
+            for nr, future in enumerate(as_completed(futures), 1):
+                key, results = future.result()
+                for target, attributes in zip(_compute_targets(systems[key]), results): 
+                    target.__dict__.update(attributes)
+                    for cache in _THEMIS_PRIVATE_CACHES: target.__dict__.pop(cache, None) # may predate the computation
+                report(nr, key)
+    finally: _THEMIS_COMPUTE_SYSTEMS.clear()
+    return(all_themis)
+
+
+@cached_parser(path_arg='exio_files', sources=_themis_source_files)
+def themis_parser(exio_files, year = None, scenario = None, themis = None, themis_caracs=None, labels=None, dlr_files=None, combo=True, compute_all=False,
+                  file_cache=True, workers=None):
     """ THEMIS parser (by adrien fabre aka. bixiou on github)
 
     The THEMIS model is not open. You can ask NTNU for it, they might accept.
@@ -1909,7 +2251,12 @@ def themis_parser(exio_files, year = None, scenario = None, themis = None, themi
     compute_all precalculates EROIs, prices, value-added, employments
     The folder should include a file called 'Supplementary info & mixes.xlsx' which provides the IEA scenarios of energy demand.
         You can ask this file to adrien.fabre@psemail.eu
-    themis_parser runs in ~1h if combo=True and compute_all=True, ~1 min if they are false
+    In case 2., the systems of each scenario are only built when they are accessed (e.g. themis['BL'][2030]), all of them share the same labels.
+        With compute_all=True, all systems are built directly: themis_parser then runs in ~1h if combo=True
+    workers sets the number of processes for compute_all (see themis_compute_all), by default the systems are computed sequentially
+    if file_cache = True, the .mat files are converted at the first call to one file per matrix (in Data/npz_cache/) and the Excel sheets
+        are stored in binary files (in .excel_cache/ folders), subsequent calls only read the matrices they need from these files.
+        Pass a path to use another folder for the matrix files, or False to read the original files directly.
     """
     
     def load_themis(matrix='A', year=2010, scenario='BL'):
@@ -1943,24 +2290,24 @@ def themis_parser(exio_files, year = None, scenario = None, themis = None, themi
                     energy_demand[[(reg, year) for reg in labels['regions']]].loc[name] * TWh2TJ
         return(secondary_energy_demand)
     
+    excel_cache = None if file_cache else False
     if themis is None or themis_caracs is None or labels is None: 
-        themis = scipy.io.loadmat(exio_files + 'Data/THEMIS2.mat')
-        themis_caracs = scipy.io.loadmat(exio_files + 'Data/Characterization_endpoint2.mat')
-        label = pd.read_excel(exio_files + 'Data/THEMIS2_labels.xls', header=0)
+        if file_cache:
+            mat_cache = exio_files + 'Data/npz_cache/' if file_cache is True else file_cache
+            themis = _MatMatrices(exio_files + 'Data/THEMIS2.mat', mat_cache)
+            themis_caracs = _MatMatrices(exio_files + 'Data/Characterization_endpoint2.mat', mat_cache)
+        else:
+            themis = scipy.io.loadmat(exio_files + 'Data/THEMIS2.mat')
+            themis_caracs = scipy.io.loadmat(exio_files + 'Data/Characterization_endpoint2.mat')
+        with CachedExcelFile(exio_files + 'Data/THEMIS2_labels.xls', cache_dir=excel_cache) as label_file:
+            label = label_file.parse(sheet_name=0, header=0)
+            label2 = label_file.parse(sheet_name=2, header=0)
+            label3 = label_file.parse(sheet_name=3, header=0)
         idx_name = label['Name']
-        idx_region = label['Region']
-        idx_region.loc[np.where(idx_region=='AME')] = 'Africa and Middle East'
-        idx_region.loc[np.where(idx_region=='CN')] = 'China'
-        idx_region.loc[np.where(idx_region=='EIT')] = 'Economies in transition'
-        idx_region.loc[np.where(idx_region=='IN')] = 'India'
-        idx_region.loc[np.where(idx_region=='LA')] = 'Latin America'
-        idx_region.loc[np.where(idx_region=='PAC')] = 'OECD Pacific'
-        idx_region.loc[np.where(idx_region=='US')] = 'OECD North America'
-        idx_region.loc[np.where(idx_region=='RER')] = 'OECD Europe'
-        idx_region.loc[np.where(idx_region=='AS')] = 'Rest of developing Asia'
-        label2 = pd.read_excel(exio_files + 'Data/THEMIS2_labels.xls', header=0, sheet_name=2)
+        idx_region = label['Region'].replace({'AME': 'Africa and Middle East', 'CN': 'China', 'EIT': 'Economies in transition', 'IN': 'India', 
+                                              'LA': 'Latin America', 'PAC': 'OECD Pacific', 'US': 'OECD North America', 'RER': 'OECD Europe', 
+                                              'AS': 'Rest of developing Asia'})
         idx_impacts = label2['FullName']
-        label3 = pd.read_excel(exio_files + 'Data/THEMIS2_labels.xls', header=0, sheet_name=3)
         idx_caracs = label3['Abbreviation THEMIS']
         labels = {'regions': idx_region.unique(), 'idx_regions': idx_region, 'impacts': idx_impacts.unique(), 'idx_impacts': idx_impacts, 
                   'sectors': idx_name.unique(), 'idx_sectors': idx_name, 'caracs': idx_caracs.unique(), 'idx_caracs': idx_caracs, 'name': 'labels'}
@@ -1971,58 +2318,47 @@ def themis_parser(exio_files, year = None, scenario = None, themis = None, themi
             if type(dlr_files)!=str: dlr_files = exio_files
         else: scenarios = ['BL', 'BM']
         all_themis = dict()
-        for s in scenarios:
-            all_themis[s] = dict()
-            for y in [2010, 2030, 2050]:
-                if s == 'BL' or s == 'BM': 
-                    all_themis[s][y] = themis_parser(exio_files, y, s, themis, themis_caracs, labels)
-                    all_themis[s][y].scenario = s
-                else:
-                    if s == 'combo':
-                        if y in [2010, 2030]: 
-                            yr, not_yr, sc = 2010, 2050, 'ADV'
-                            if y == 2030: sc = 'ER'
-                            all_themis[s][y] = all_themis['BL'][yr].copy(new_name='THEMIS')
-                            all_themis[s][y].dlr_elec = all_themis[sc][2050].dlr_elec
-                            all_themis[s][y].dlr_capacity = all_themis[sc][2050].dlr_capacity
-                            global_mix = all_themis[sc][not_yr].mix(scenario = sc, path_dlr = dlr_files)[y]
-                        else: 
-                            yr, not_yr, sc = 2050, 2010, 'BL'
-                            all_themis[s][y] = all_themis['BL'][yr].copy(new_name='THEMIS')
-                            global_mix = all_themis['BL'][2010].mix_matrix(global_mix = False)
-                        all_themis[s][y].aggregate_mix(mix = global_mix)
-                        all_themis[s][y].change_mix(global_mix = global_mix, year = not_yr, only_exiobase = False)
-                        
-                    elif s == 'REF': all_themis[s][y] = all_themis['BL'][y].copy(new_name='THEMIS') # TODO: include attribute scenario
-                    else: all_themis[s][y] = all_themis['BM'][y].copy(new_name='THEMIS') 
-                    all_themis[s][y].scenario = s
-                    if s != 'combo':
-                        global_mix = all_themis[s][2010].mix(scenario = s, path_dlr = dlr_files)[y]
-                        all_themis[s][y].dlr_elec = all_themis[s][2010].dlr_elec
-                        all_themis[s][y].dlr_capacity = all_themis[s][2010].dlr_capacity
-                        all_themis[s][y].adjust_capacity = all_themis[s][2010].adjust_capacity
-                        all_themis[s][y].adjustment_capacity = all_themis[s][2010].adjustment_capacity
-                        if s in ['REF', 'ER', 'ADV']: 
-                            all_themis[s][y].wo_GW_adj = all_themis[s][y].copy(new_name='THEMIS')
-                            all_themis[s][y].wo_GW_adj.change_mix(global_mix = global_mix, year = y, only_exiobase = False, adjust_GW = False)
-                        all_themis[s][y].change_mix(global_mix = global_mix, year = y, only_exiobase = False, adjust_GW=True)
-        if compute_all:
-            for s in scenarios:
-                for y in [2010, 2030, 2050]:                  
-                    if s=='combo' and y==2050: all_themis[s][y].world_mix = all_themis[s][y].agg_mix
-                    else: all_themis[s][y].world_mix = all_themis[s][y].aggregate_mix(recompute=True)
+        shared_labels = dict()
+        def share_labels(system): # copies of systems refer to the same labels
+            system.labels = shared_labels.setdefault('labels', system.labels)
+        def build_system(s, y): # builds all_themis[s][y], the systems it depends on are built when accessed
+            if s == 'BL' or s == 'BM': 
+                all_themis[s][y] = themis_parser(exio_files, y, s, themis, themis_caracs, labels, file_cache=file_cache)
+                all_themis[s][y].scenario = s
+            else:
+                if s == 'combo':
+                    if y in [2010, 2030]: 
+                        yr, not_yr, sc = 2010, 2050, 'ADV'
+                        if y == 2030: sc = 'ER'
+                        all_themis[s][y] = all_themis['BL'][yr].copy(new_name='THEMIS')
+                        all_themis[s][y].dlr_elec = all_themis[sc][2050].dlr_elec
+                        all_themis[s][y].dlr_capacity = all_themis[sc][2050].dlr_capacity
+                        global_mix = all_themis[sc][not_yr].mix(scenario = sc, path_dlr = dlr_files)[y]
+                    else: 
+                        yr, not_yr, sc = 2050, 2010, 'BL'
+                        all_themis[s][y] = all_themis['BL'][yr].copy(new_name='THEMIS')
+                        global_mix = all_themis['BL'][2010].mix_matrix(global_mix = False)
+                    all_themis[s][y].aggregate_mix(mix = global_mix)
+                    all_themis[s][y].change_mix(global_mix = global_mix, year = not_yr, only_exiobase = False)
+                    
+                elif s == 'REF': all_themis[s][y] = all_themis['BL'][y].copy(new_name='THEMIS') # TODO: include attribute scenario
+                else: all_themis[s][y] = all_themis['BM'][y].copy(new_name='THEMIS') 
+                all_themis[s][y].scenario = s
+                if s != 'combo':
+                    global_mix = all_themis[s][2010].mix(scenario = s, path_dlr = dlr_files)[y]
+                    all_themis[s][y].dlr_elec = all_themis[s][2010].dlr_elec
+                    all_themis[s][y].dlr_capacity = all_themis[s][2010].dlr_capacity
+                    all_themis[s][y].adjust_capacity = all_themis[s][2010].adjust_capacity
+                    all_themis[s][y].adjustment_capacity = all_themis[s][2010].adjustment_capacity
                     if s in ['REF', 'ER', 'ADV']: 
-                        all_themis[s][y].wo_GW_adj.eroi_adj = all_themis[s][y].wo_GW_adj.erois(factor_elec = 2.6, \
-                                                                                               recompute=True).rename(index={'Power sector': 'total'})
-                        all_themis[s][y].wo_GW_adj.eroi = all_themis[s][y].wo_GW_adj.erois(recompute=True).rename(index={'Power sector': 'total'})
-                        all_themis[s][y].wo_GW_adj.energy_prices()
-                        all_themis[s][y].wo_GW_adj.employ_direct = all_themis[s][y].wo_GW_adj.employments()
-                        all_themis[s][y].wo_GW_adj.employments(indirect = False, recompute = True)
-                    all_themis[s][y].eroi_adj = all_themis[s][y].erois(factor_elec = 2.6, recompute=True).rename(index={'Power sector': 'total'})
-                    all_themis[s][y].eroi = all_themis[s][y].erois(recompute=True).rename(index={'Power sector': 'total'})
-                    all_themis[s][y].energy_prices()
-                    all_themis[s][y].employ_direct = all_themis[s][y].employments()
-                    all_themis[s][y].employments(indirect = False, recompute = True) # pb with employments combo 2050
+                        all_themis[s][y].wo_GW_adj = all_themis[s][y].copy(new_name='THEMIS')
+                        all_themis[s][y].wo_GW_adj.change_mix(global_mix = global_mix, year = y, only_exiobase = False, adjust_GW = False)
+                        share_labels(all_themis[s][y].wo_GW_adj)
+                    all_themis[s][y].change_mix(global_mix = global_mix, year = y, only_exiobase = False, adjust_GW=True)
+            share_labels(all_themis[s][y])
+        for s in scenarios:
+            all_themis[s] = _LazySystems([2010, 2030, 2050], functools.partial(build_system, s))
+        if compute_all: themis_compute_all(all_themis, workers=workers)
 
         return(all_themis)
     elif year is None or scenario is None: print('scenario and year must be both given or None')
@@ -2031,13 +2367,13 @@ def themis_parser(exio_files, year = None, scenario = None, themis = None, themi
         S = load_themis('S', year, scenario)
         if scenario=='BL': skip, skipfoot = 6, 67 # TODO: make a separate function the extraction of IEA scenarios
         elif scenario=='BM': skip, skipfoot = 52, 21
-        energy_demand = pd.read_excel(exio_files+'Supplementary info & mixes.xlsx', \
-                                         header=[0,1], index_col=0, skiprows=list(range(skip)), skipfooter=skipfoot, sheet_name=11) #TODO: select good columns>?
+        mixes_file = CachedExcelFile(exio_files+'Supplementary info & mixes.xlsx', cache_dir=excel_cache)
+        energy_demand = mixes_file.parse(header=[0,1], index_col=0, skiprows=list(range(skip)), skipfooter=skipfoot, sheet_name=11) #TODO: select good columns>?
         energy_demand.index = ['Electricity by ' + name[0].lower() + name[1:] for name in list(energy_demand.index)]
         if scenario=='BL': skip, skipfoot = 27, 46
         if scenario=='BM': skip, skipfoot = 73, 0
-        capacity = pd.read_excel(exio_files+'Supplementary info & mixes.xlsx', \
-                                         header=[0,1], index_col=0, skiprows=list(range(skip)), skipfooter=skipfoot, sheet_name=11)
+        capacity = mixes_file.parse(header=[0,1], index_col=0, skiprows=list(range(skip)), skipfooter=skipfoot, sheet_name=11)
+        mixes_file.close()
         capacity.index = ['Electricity by ' + name[0].lower() + name[1:] for name in list(capacity.index)] # in GW
 #         C = themis_caracs['C_H_CED_22'] # midpoint characterization
 #         C_large = themis_caracs['C_H_CED_large'] # midpoint characterization taken by Thomas Gibon: should be preferred to C
@@ -2052,7 +2388,7 @@ def themis_parser(exio_files, year = None, scenario = None, themis = None, themi
 
         return IOSystem(A=A, name='THEMIS', version=scenario, year=year, meta=meta_rec, **dict(core_data, **extensions))
 
-def cecilia_parser(path, step = None, system='pxp'):
+def cecilia_parser(path, step = None, system='pxp', technology='industry', workers=None):
     """ Cecilia 2050 parser (by adrien fabre aka. bixiou on github)
 
     The Cecilia 2050 model is open and can be found at https://cecilia2050.eu/publications/168
@@ -2065,13 +2401,19 @@ def cecilia_parser(path, step = None, system='pxp'):
                                                            3: curbing growth to respect the 2 degree scenario)
                                  either provide none of them, and all combinations will be loaded in a dict
     path must give the path to the root folder of Cecilia 2050, and files of both .zip should be placed in that folder.
+    technology is the assumption used to derive the IO tables from the supply and use tables: 'industry' (default, as in previous versions) or 'product'
+        (see pymrio.calc_Z_from_SUT)
+    All steps share the initial (step -1) tables, which are loaded only once. If all steps are loaded, workers > 1 loads them in parallel threads.
     For further information, ask adrien.fabre@psemail.eu
     """
     
-    def IOT_from_SUT(S, U, kind='p'): # Computes Z table
-        S = np.array(S, dtype='float')
-        if kind=='pxp': return(np.transpose(U.dot(div0(S,np.diag(np.sum(S, axis=1)).dot(np.ones(S.shape)))))) #sum(S).ones=sum of rows of S
-        elif kind=='ixi': return(div0(S,(np.ones(S.shape)).dot(np.diag(np.sum(S, axis=0)))).dot(U)) # ones.sum(S) = sum of columns of S
+    def IOT_from_SUT(S, U, kind='pxp'): # Computes Z table, S is given as industries x products
+        Z = calc_Z_from_SUT(np.transpose(S), U, technology=technology, output=kind)
+        if kind=='pxp': Z = np.transpose(Z) # same orientation as the pxp tables of previous versions
+        return(Z)
+
+    def read_matrix(file, **kwargs): # same values as np.loadtxt, but much faster
+        return(pd.read_csv(file, sep='\t', header=None, float_precision='round_trip', **kwargs).values)
 
     def load_matrix(matrix='U', step=0, system='pxp'):
         if type(step) == str: step_num = int(step[0])
@@ -2081,45 +2423,52 @@ def cecilia_parser(path, step = None, system='pxp'):
         if step_num<=0: step = 'preprocess/'
         if step_num==-1: # TODO: other matrices
             if matrix=='U':
-                M = np.loadtxt(path + 'preprocess/mrUseAggregated.txt', delimiter='\t', skiprows=2, usecols=list(range(3,519)))
+                M = read_matrix(path + 'preprocess/mrUseAggregated.txt', skiprows=2, usecols=list(range(3,519)))
             elif matrix=='V':
-                M = np.loadtxt(path + 'preprocess/mrSupplyAggregated.txt', delimiter='\t', skiprows=2, usecols=list(range(3,519))) 
+                M = read_matrix(path + 'preprocess/mrSupplyAggregated.txt', skiprows=2, usecols=list(range(3,519))) 
             elif matrix=='Y': 
-                M = np.loadtxt(path + 'preprocess/mrFinalDemandAggregated.txt', delimiter='\t', skiprows=2, usecols=list(range(3,31)))
-        elif step_num==0: M = np.loadtxt(path + step + matrix + '.txt', delimiter='\t')
-        else: M = np.loadtxt(path + 'step' + step + '/' + matrix + 'end.txt', delimiter='\t')                
+                M = read_matrix(path + 'preprocess/mrFinalDemandAggregated.txt', skiprows=2, usecols=list(range(3,31)))
+        elif step_num==0: M = read_matrix(path + step + matrix + '.txt')
+        else: M = read_matrix(path + 'step' + step + '/' + matrix + 'end.txt')                
         return(M)
     
     def load_extensions():
         sectors = pd.read_excel(path + 'supply_use_tables_bau_2050.xlsx', 2, skiprows=2).iloc[0:129,2]
         regions = ['EU', 'HI', 'BX', 'WW'] # EU, High Income, Fast developing countries, RoW
         index = pd.MultiIndex.from_product([regions, sectors], names=['region', 'sector'])
-        F_init = np.loadtxt(path + 'preprocess/mrMaterialsAggregated.txt', delimiter='\t', skiprows=2, usecols=tuple(range(2,518)))
+        F_init = read_matrix(path + 'preprocess/mrMaterialsAggregated.txt', skiprows=2, usecols=list(range(2,518)))
         index_F = np.loadtxt(path + 'preprocess/mrMaterialsAggregated.txt', dtype='str', delimiter='\t', skiprows=2, usecols=0)
         F_init = pd.DataFrame(F_init, index = index_F, columns = index)
         return({'labels': {'regions': regions, 'sectors': sectors, 'index': index, 'name': 'labels'}, 'materials': {'F_init': F_init, 'index': index_F, 'name': 'impact'}})
 
-    def load_system(step=0, system='pxp', x_init = None):
-        S = load_matrix('V', step, system)
-        U = load_matrix('U', step, system)
-        y = load_matrix('Y', step, system)
-        Z = IOT_from_SUT(S, U, system)
-        x = y.sum(axis=1) + Z.sum(axis=1)
-        A = Z.dot(np.diag(div0(1,x)))
+    init = dict()
+    init_lock = threading.Lock()
+    def initial_tables(): # step -1 tables, loaded once and shared by all steps
+        with init_lock:
+            if not init:
+                init['S'], init['U'], init['Y'] = [load_matrix(matrix, -1, system) for matrix in ['V', 'U', 'Y']]
+                init['Z'] = IOT_from_SUT(init['S'], init['U'], system)
+                init['x'] = init['Y'].sum(axis=1) + init['Z'].sum(axis=1)
+                init['S_materials'] = pd.DataFrame(div0(extensions['materials']['F_init'], init['x']), index = extensions['materials']['index'], 
+                                                   columns = extensions['labels']['index'])
+        return(init)
+
+    def load_system(step=0, system='pxp'):
+        if step==-1: y, Z, x = initial_tables()['Y'], initial_tables()['Z'], initial_tables()['x']
+        else:
+            S = load_matrix('V', step, system)
+            U = load_matrix('U', step, system)
+            y = load_matrix('Y', step, system)
+            Z = IOT_from_SUT(S, U, system)
+            x = y.sum(axis=1) + Z.sum(axis=1)
+        A = Z * div0(1,x).reshape((1, -1)) # Z.diag(1/x)
         L = np.linalg.inv(np.eye(A.shape[0])-A)
         index = extensions['labels']['index']
         index_y = pd.MultiIndex.from_product([extensions['labels']['regions'], ['Final consumption expenditure by households', \
             'Final consumption expenditure by non-profit organisations serving households (NPISH)', 'Final consumption expenditure by government', \
             'Gross fixed capital formation', 'Changes in inventories', 'Changes in valuables', 'Export']], names=['region', 'sector'])
-        if step==-1: x_init = x
-        elif x_init is None: 
-            S_init = load_matrix('V', -1, system)
-            U_init = load_matrix('U', -1, system)
-            y_init = load_matrix('Y', -1, system)
-            Z_init = IOT_from_SUT(S_init, U_init, system)
-            x_init = y_init.sum(axis=1) + Z_init.sum(axis=1)            
-        extensions['materials'].update({'S': pd.DataFrame(div0(extensions['materials']['F_init'], x_init), index = extensions['materials']['index'], columns = index)})
-        extensions['materials'].update({'F': pd.DataFrame(extensions['materials']['S'] * x, index = extensions['materials']['index'], columns = index)})
+        S_materials = initial_tables()['S_materials']
+        materials = dict(extensions['materials'], S=S_materials, F=pd.DataFrame(S_materials * x, index = extensions['materials']['index'], columns = index))
         Z = pd.DataFrame(Z, index = index, columns = index)
         Y = pd.DataFrame(y, index = index, columns = index_y)
         x = pd.Series(x, index = index)
@@ -2128,12 +2477,10 @@ def cecilia_parser(path, step = None, system='pxp'):
         if step==0 or step==-1: year = 2000
         else: year = 2050
         core_data = dict()
-        return IOSystem(A=A, Z=Z, Y=Y, x=x, L=L, name='Cecilia', version=step, year=year, meta=meta_rec, **dict(core_data, **extensions))
-    x_init = None
+        return IOSystem(A=A, Z=Z, Y=Y, x=x, L=L, name='Cecilia', version=step, year=year, meta=meta_rec, 
+                        **dict(core_data, labels=extensions['labels'], materials=materials))
     extensions = load_extensions()
     if step is None:
-        cecilias = dict()
-        for step in [-1, 0, 1, '2a', '2b', 3]: cecilias[step] = load_system(step, system, x_init)
-        if step==-1: x_init = cecilias[-1].x
-        return(cecilias)
-    else: return(load_system(step, system, x_init))
\ No newline at end of file
+        steps = [-1, 0, 1, '2a', '2b', 3]
+        return(dict(zip(steps, thread_map(lambda step: load_system(step, system), steps, workers=workers))))
+    else: return(load_system(step, system))
@@ -0,0 +1,70 @@
+""" Leontief (cost-push) price model
+
+The price of each sector covers its primary inputs (value added) and the
+prices of its intermediate inputs, p_j = v_j + sum_i p_i A_ij, thus
+
+    p' = v' L
+
+for all sectors at once. For exogenous prices of some sectors E (e.g. an
+energy price shock), the prices of the other sectors N follow from
+
+    p_N' (I - A_NN) = v_N' + p_E' A_EN
+
+which is solved with a rank |E| (Woodbury) update of L or of the
+factorization of (I - A), using only the rows and columns of L of E.
+
+>>> p = pymrio.calc_prices(v, L=io.L)
+>>> p_shock = pymrio.calc_prices(v, L=io.L, exogenous={3: 1.1 * p[3]})
+
+"""
+
+import numpy as np
+
+from pymrio.tools.iolinkages import LeontiefSolver
+
+
+def calc_prices(v, A=None, L=None, lu=None, exogenous=None):
+    """ Prices of all sectors in the cost-push price model
+
+    Parameters
+    ----------
+    v : array like
+        Primary inputs (e.g. value added) per unit of output
+
+    A : numpy.array, scipy.sparse matrix or pandas.DataFrame, optional
+        Technical coefficients (not needed if L or lu are given)
+
+    L : numpy.array or pandas.DataFrame, optional
+        Leontief inverse, used instead of a factorization of (I - A)
+
+    lu : scipy.sparse.linalg.SuperLU or LeontiefSolver, optional
+        Factorization of (I - A), to reuse between calls
+
+    exogenous : dict, optional
+        position: price of the sectors with exogenous prices
+
+    Returns
+    -------
+    numpy.array
+        Price of each sector (per unit of output)
+
+    """
+    solver = lu if isinstance(lu, LeontiefSolver) else LeontiefSolver(A, L,
+                                                                      lu)
+    v = np.asarray(v, dtype=float).ravel()
+    if not exogenous:
+        return solver.solve_T(v)
+
+    fixed = np.array(sorted(exogenous), dtype=int)
+    b = v.copy()
+    b[fixed] = [exogenous[pos] for pos in fixed]
+    # the columns of (I - A) of the fixed sectors are replaced by unit
+    # vectors: (I - A) + A[:, E] E', with inverse (Woodbury)
+    # L - (L[:, E] - E) L[E, E]^-1 E' L
+    cols = solver.columns(fixed)
+    rows = solver.rows(fixed)
+    correction = cols.T @ b - b[fixed]
+    prices = solver.solve_T(b) - rows.T @ np.linalg.solve(cols[fixed].T,
+                                                          correction)
+    prices[fixed] = b[fixed]
+    return prices
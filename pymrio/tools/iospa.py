@@ -0,0 +1,177 @@
+""" Structural path analysis
+
+Enumerates the supply chain paths of an input-output system, starting from
+a (final) demand vector y. A path i_0 <- i_1 <- ... <- i_n contributes
+
+    f[i_n] * A[i_n, i_n-1] * ... * A[i_1, i_0] * y[i_0]
+
+to the total impact f L y. Paths are expanded best-first (priority queue
+ordered by the total impact of all paths passing through a node, given by
+the multipliers m = f L) and subtrees below a threshold are pruned. The
+search stops as soon as no remaining subtree can enter the top-k paths or
+when the path/time budget is exhausted. The pruning assumes non-negative
+A, y and f (as for production and most impacts).
+
+>>> res = pymrio.structural_path_analysis(A, y, f, top_k=20)
+>>> res.paths
+
+"""
+
+import heapq
+import itertools
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import linalg as spla
+
+spa_result = namedtuple('spa_result',
+                        ['paths', 'total', 'coverage', 'complete',
+                         'nr_expanded'])
+
+
+def calc_multipliers(A, f):
+    """ Total impact multipliers m = f (I - A)^-1
+
+    Parameters
+    ----------
+    A : numpy.array, scipy.sparse matrix or pandas.DataFrame
+        Technical coefficients
+    f : array like
+        Direct impact per unit of output
+
+    Returns
+    -------
+    numpy.array
+    """
+    A = sp.csc_matrix(np.asarray(A) if isinstance(A, pd.DataFrame) else A)
+    f = np.asarray(f, dtype=float).ravel()
+    lu = spla.splu(sp.csc_matrix(sp.eye(A.shape[0]) - A))
+    return lu.solve(f, trans='T')
+
+
+def structural_path_analysis(A, y, f, top_k=100, threshold=1e-4,
+                             max_depth=10, max_paths=1e6, time_budget=None,
+                             multipliers=None):
+    """ Top-k supply chain paths by their impact
+
+    Parameters
+    ----------
+    A : numpy.array, scipy.sparse matrix or pandas.DataFrame
+        Technical coefficients (inputs of row sector per unit of output
+        of column sector)
+
+    y : array like
+        Demand vector, the starting points of the paths
+
+    f : array like
+        Direct impact per unit of output (e.g. a row of S), use a vector of
+        ones to analyse the production itself
+
+    top_k : int, optional
+        Number of paths returned, default 100
+
+    threshold : float, optional
+        Subtrees of the supply chain whose total impact is below
+        threshold times the total impact are not expanded. Default 1e-4
+
+    max_depth : int, optional
+        Maximum number of upstream steps of a path, default 10
+
+    max_paths : int, optional
+        Maximum number of paths expanded, default 1e6
+
+    time_budget : float, optional
+        Maximum run time in seconds, default None (no limit)
+
+    multipliers : array like, optional
+        Total impact multipliers f L, computed if not given
+        (see calc_multipliers)
+
+    Returns
+    -------
+    namedtuple with
+
+        paths : pandas.DataFrame
+            One row per path (sorted by decreasing contribution) with the
+            columns 'path' (tuple of positions, starting at the demand
+            sector and going upstream), 'depth', 'contribution' and 'share'
+            (contribution / total)
+
+        total : float
+            Total impact f L y
+
+        coverage : float
+            Share of the total impact covered by the returned paths
+
+        complete : boolean
+            False if the search was stopped by max_paths or time_budget
+            before the top-k paths were found
+
+        nr_expanded : int
+            Number of paths expanded
+
+    """
+    A = sp.csc_matrix(np.asarray(A) if isinstance(A, pd.DataFrame) else A)
+    y = np.asarray(y, dtype=float).ravel()
+    f = np.asarray(f, dtype=float).ravel()
+    if multipliers is None:
+        multipliers = calc_multipliers(A, f)
+    multipliers = np.asarray(multipliers, dtype=float).ravel()
+
+    total = float(multipliers @ y)
+    cut = abs(threshold * total)
+    start = time.perf_counter()
+    counter = itertools.count()
+
+    # queue of paths to expand: (-bound of the subtree, tiebreak, flow, path)
+    queue = [(-abs(y[ii] * multipliers[ii]), next(counter), y[ii], (ii,))
+             for ii in np.flatnonzero(y)
+             if abs(y[ii] * multipliers[ii]) >= cut]
+    heapq.heapify(queue)
+    # current top-k: min heap of (abs contribution, tiebreak, contr., path)
+    top = []
+    nr_expanded = 0
+    complete = True
+
+    while queue:
+        neg_bound, _, flow, path = heapq.heappop(queue)
+        if len(top) == top_k and -neg_bound <= top[0][0]:
+            break
+        if (nr_expanded >= max_paths or (
+                time_budget is not None and
+                time.perf_counter() - start > time_budget)):
+            complete = False
+            break
+        nr_expanded += 1
+
+        node = path[-1]
+        contribution = flow * f[node]
+        if contribution != 0:
+            entry = (abs(contribution), next(counter), contribution, path)
+            if len(top) < top_k:
+                heapq.heappush(top, entry)
+            elif entry[0] > top[0][0]:
+                heapq.heapreplace(top, entry)
+
+        if len(path) > max_depth:
+            continue
+        rows = A.indices[A.indptr[node]:A.indptr[node + 1]]
+        flows = flow * A.data[A.indptr[node]:A.indptr[node + 1]]
+        bounds = np.abs(flows * multipliers[rows])
+        for ii in np.flatnonzero(bounds >= cut):
+            heapq.heappush(queue, (-bounds[ii], next(counter), flows[ii],
+                                   path + (rows[ii],)))
+
+    top = sorted(top, key=lambda entry: (-entry[0], entry[1]))
+    paths = pd.DataFrame(
+        dict(path=[tuple(int(nn) for nn in entry[3]) for entry in top],
+             depth=[len(entry[3]) - 1 for entry in top],
+             contribution=[entry[2] for entry in top]),
+        columns=['path', 'depth', 'contribution'])
+    paths['share'] = paths.contribution / total if total else np.nan
+    coverage = paths.contribution.sum() / total if total else np.nan
+    return spa_result(paths=paths, total=total, coverage=coverage,
+                      complete=complete, nr_expanded=nr_expanded)
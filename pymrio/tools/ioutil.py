@@ -3,17 +3,30 @@ Utility function for pymrio
 
 KST 20140502
 """
+import contextlib
+import hashlib
+import itertools
 import json
 import logging
 import os
+import threading
 import zipfile
+from io import BytesIO
 
 import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 from collections import namedtuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from pymrio.core.constants import PYMRIO_PATH
 from pymrio.core.constants import DEFAULT_FILE_NAMES
+from pymrio.version import __version__
+
+# Name of the cache folder created next to Excel source files
+EXCEL_CACHE_FOLDER = '.excel_cache'
 
 
 def is_vector(inp):
@@ -43,6 +56,173 @@ def is_vector(inp):
         return False
 
 
+def thread_map(func, items, workers=None):
+    """ Applies func to all items, optionally in a thread pool
+
+    Parameters
+    ----------
+    func: function
+        Function accepting one item
+
+    items: iterable
+
+    workers: int, optional
+        Number of threads to use. If None or 1 (default),
+        the items are processed sequentially.
+
+    Returns
+    -------
+    list with the results of func, in the order of items
+    """
+    items = list(items)
+    if not workers or workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+class ArchiveSession(object):
+    """ Keeps a zip archive open for repeated reads
+
+    The archive is opened once and the list of members as well as already
+    parsed json files are cached. This avoids re-scanning the central
+    directory of (large) zip archives for every table, as it happens when
+    calling zipfile.ZipFile for each member.
+
+    Members can be read in parallel (see map_members). A zipfile handle is
+    not safe to share between threads, thus each worker thread gets its own
+    handle which is closed together with the session.
+
+    The session can be used as context manager:
+
+    >>> with ArchiveSession('mrio.zip') as arc:
+    >>>     para = arc.read_json('file_parameters.json')
+
+    Parameters
+    ----------
+    path: pathlib.Path or string
+        Location of the zip archive
+
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._handles = []
+        self._json_cache = dict()
+        self._zf = zipfile.ZipFile(file=str(self.path), mode='r')
+        self._handles.append(self._zf)
+        self._namelist = self._zf.namelist()
+        self._nameset = set(self._namelist)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, member):
+        return member in self._nameset
+
+    @property
+    def namelist(self):
+        """ List of all members in the archive """
+        return self._namelist
+
+    def _handle(self):
+        """ The zipfile handle of the current thread """
+        if threading.current_thread() is threading.main_thread():
+            return self._zf
+        zf = getattr(self._local, 'zf', None)
+        if zf is None:
+            zf = zipfile.ZipFile(file=str(self.path), mode='r')
+            self._local.zf = zf
+            with self._lock:
+                self._handles.append(zf)
+        return zf
+
+    def open(self, member):
+        """ File like object of member (opened with the thread's handle) """
+        return self._handle().open(member)
+
+    def read(self, member):
+        """ Bytes content of member """
+        return self._handle().read(member)
+
+    def read_json(self, member):
+        """ Parsed json content of member, cached for subsequent calls
+
+        Returns a copy of the cached content, thus the returned
+        dict can be modified without altering the cache.
+        """
+        if member not in self._json_cache:
+            self._json_cache[member] = self.read(member).decode('utf-8')
+        return json.loads(self._json_cache[member],
+                          object_pairs_hook=OrderedDict)
+
+    def map_members(self, func, members, workers=None):
+        """ Applies func to each member and its open file handle
+
+        Parameters
+        ----------
+        func: function
+            Function accepting the member name and a file like object
+
+        members: list of str
+            Members of the archive to process
+
+        workers: int, optional
+            Number of threads to use. If None or 1 (default),
+            the members are processed sequentially.
+
+        Returns
+        -------
+        list with the results of func, in the order of members
+        """
+        def _run(member):
+            with self.open(member) as mf:
+                return func(member, mf)
+
+        return thread_map(_run, members, workers=workers)
+
+    def close(self):
+        """ Closes all zipfile handles of the session """
+        with self._lock:
+            for zf in self._handles:
+                zf.close()
+            self._handles = []
+            self._local = threading.local()
+
+    @property
+    def closed(self):
+        return len(self._handles) == 0
+
+
+def open_archive(path, archive=None):
+    """ Returns an ArchiveSession for path or None if path is not a zip
+
+    If an (open) session for the same path is passed at 'archive', this
+    session is returned instead of opening the archive again.
+
+    Parameters
+    ----------
+    path: pathlib.Path or string
+
+    archive: ArchiveSession, optional
+
+    Returns
+    -------
+    ArchiveSession or None
+    """
+    if archive is not None and not archive.closed:
+        if Path(archive.path).resolve() == Path(path).resolve():
+            return archive
+    if Path(path).is_file() and zipfile.is_zipfile(str(path)):
+        return ArchiveSession(path)
+    return None
+
+
 def get_repo_content(path):
     """ List of files in a repo (path or zip)
 
@@ -71,7 +251,7 @@ def get_repo_content(path):
     return namedtuple('repocontent', ['iszip', 'filelist'])(iszip, filelist)
 
 
-def get_file_para(path, path_in_arc=''):
+def get_file_para(path, path_in_arc='', archive=None):
     """ Generic method to read the file parameter file
 
     Helper function to consistently read the file parameter file, which can
@@ -97,6 +277,10 @@ def get_file_para(path, path_in_arc=''):
         (default), for data in e.g. the folder 'emissions' pass 'emissions/'.
         Only used if parameter 'path' points to an compressed zip file.
 
+    archive: ArchiveSession, optional
+        Open session of the zip archive at 'path'. If given, the archive is
+        not opened again for reading the parameter file.
+
     Returns
     -------
 
@@ -115,16 +299,16 @@ def get_file_para(path, path_in_arc=''):
     """
     path = Path(path)
 
-    if zipfile.is_zipfile(str(path)):
+    session = open_archive(path, archive)
+    if session:
         para_file_folder = str(path_in_arc)
-        with zipfile.ZipFile(file=str(path)) as zf:
-            files = zf.namelist()
+        files = session.namelist
     else:
         para_file_folder = str(path)
         files = [str(f) for f in path.glob('**/*')]
 
     if para_file_folder not in files:
-        if zipfile.is_zipfile(str(path)):
+        if session:
             # b/c in win os.path.join adds \ also for within zipfile
             if para_file_folder != '':
                 para_file_full_path = (para_file_folder + '/' +
@@ -141,14 +325,16 @@ def get_file_para(path, path_in_arc=''):
         para_file_folder = os.path.dirname(para_file_full_path)
 
     if para_file_full_path not in files:
+        if session and session is not archive:
+            session.close()
         raise FileNotFoundError(
             'File parameter file {} not found'.format(
                 para_file_full_path))
 
-    if zipfile.is_zipfile(str(path)):
-        with zipfile.ZipFile(file=str(path)) as zf:
-            para_file_content = json.loads(
-                zf.read(para_file_full_path).decode('utf-8'))
+    if session:
+        para_file_content = session.read_json(para_file_full_path)
+        if session is not archive:
+            session.close()
     else:
         with open(para_file_full_path, 'r') as pf:
             para_file_content = json.load(pf)
@@ -160,7 +346,469 @@ def get_file_para(path, path_in_arc=''):
         para_file_content)
 
 
-def build_agg_matrix(agg_vector, pos_dict=None):
+def get_table_fingerprint(df, *args):
+    """ Content fingerprint of a DataFrame
+
+    The fingerprint covers the values, the index, the columns (including
+    their names) and the dtypes of df. Additional arguments (e.g. the
+    format used for saving the table) are included in the fingerprint
+    as well.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+
+    args : str, optional
+        Additional strings to include in the fingerprint
+
+    Returns
+    -------
+    str (sha1 hexdigest)
+    """
+    sha = hashlib.sha1()
+    sha.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    sha.update(pd.util.hash_pandas_object(
+        df.columns.to_frame(index=False), index=False).values.tobytes())
+    sha.update(repr((list(df.index.names), list(df.columns.names),
+                     [str(dt) for dt in df.dtypes], df.shape)).encode('utf-8'))
+    for arg in args:
+        sha.update(str(arg).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def table_density(df):
+    """ Share of non-zero values in df, None if df is not numeric """
+    if df.size == 0:
+        return None
+    if all(isinstance(dt, pd.SparseDtype) for dt in df.dtypes):
+        return (df.sparse.to_coo() != 0).sum() / df.size
+    if not all(np.issubdtype(dt, np.number) for dt in df.dtypes):
+        return None
+    return np.count_nonzero(df.values) / df.size
+
+
+def _labels_to_arrays(labels, prefix):
+    """ Index or columns as dict of numpy arrays (for np.savez) """
+    arrays = dict()
+    for nr in range(labels.nlevels):
+        level = np.asarray(labels.get_level_values(nr))
+        if level.dtype == object:
+            level = level.astype(str)
+        arrays['{}_level_{}'.format(prefix, nr)] = level
+    arrays[prefix + '_names'] = np.array(json.dumps(list(labels.names)))
+    return arrays
+
+
+def _arrays_to_labels(arrays, prefix):
+    """ Index from the arrays stored by _labels_to_arrays """
+    names = json.loads(str(arrays[prefix + '_names']))
+    levels = [arrays['{}_level_{}'.format(prefix, nr)]
+              for nr in range(len(names))]
+    if len(levels) == 1:
+        return pd.Index(levels[0], name=names[0])
+    return pd.MultiIndex.from_arrays(levels, names=names)
+
+
+def save_sparse_table(df, file):
+    """ Saves a DataFrame as compressed sparse (COO) npz file
+
+    The file contains the coordinates and values of all non-zero entries
+    ('row', 'col', 'data'), the 'shape' and the index and columns labels.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame (numeric)
+
+    file : pathlib.Path, string or file like object
+
+    """
+    if all(isinstance(dt, pd.SparseDtype) for dt in df.dtypes):
+        coo = df.sparse.to_coo()
+    else:
+        coo = sp.coo_matrix(df.values)
+    coo.eliminate_zeros()
+    arrays = dict(row=coo.row, col=coo.col, data=coo.data,
+                  shape=np.array(coo.shape))
+    arrays.update(_labels_to_arrays(df.index, 'index'))
+    arrays.update(_labels_to_arrays(df.columns, 'columns'))
+    if not hasattr(file, 'write'):
+        file = str(file)
+    np.savez_compressed(file, **arrays)
+
+
+def load_sparse_table(file, dense=False):
+    """ Loads a table saved with save_sparse_table
+
+    Parameters
+    ----------
+    file : pathlib.Path, string or file like object
+
+    dense : boolean, optional
+        If False (default), returns a sparse backed DataFrame,
+        otherwise a standard (dense) DataFrame
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    if not hasattr(file, 'read'):
+        file = str(file)
+    with np.load(file, allow_pickle=False) as arrays:
+        coo = sp.coo_matrix((arrays['data'], (arrays['row'], arrays['col'])),
+                            shape=tuple(arrays['shape']))
+        index = _arrays_to_labels(arrays, 'index')
+        columns = _arrays_to_labels(arrays, 'columns')
+    if dense:
+        return pd.DataFrame(coo.toarray(), index=index, columns=columns)
+    return pd.DataFrame.sparse.from_spmatrix(
+        coo, index=index, columns=columns)
+
+
+@contextlib.contextmanager
+def _open_binary(csv_file, zip_file=None):
+    """ Opens csv_file (optionally within zip_file) in binary mode """
+    if zip_file is None:
+        with open(str(csv_file), 'rb') as ff:
+            yield ff
+    elif isinstance(zip_file, ArchiveSession):
+        with zip_file.open(csv_file) as ff:
+            yield ff
+    else:
+        with zipfile.ZipFile(str(zip_file), 'r') as zz:
+            with zz.open(csv_file) as ff:
+                yield ff
+
+
+def _count_lines(binary_handle, chunk_size=2**24):
+    """ Number of lines remaining in binary_handle """
+    nr_lines = 0
+    last = b'\n'
+    for chunk in iter(lambda: binary_handle.read(chunk_size), b''):
+        nr_lines += chunk.count(b'\n')
+        last = chunk[-1:]
+    if last != b'\n':
+        nr_lines += 1
+    return nr_lines
+
+
+def _infer_label_type(labels):
+    """ Converts a string array of labels to numbers if possible """
+    try:
+        return pd.to_numeric(labels)
+    except (ValueError, TypeError):
+        return labels
+
+
+def _build_index(levels, names):
+    if len(levels) == 1:
+        return pd.Index(levels[0], name=names[0])
+    return pd.MultiIndex.from_arrays(levels, names=names)
+
+
+def read_csv_table(csv_file, index_col, header_rows, sep='\t',
+                   dtype='float64', zip_file=None, engine='c',
+                   chunksize=50000):
+    """ Reads a numeric table with (multi) index and (multi) header
+
+    This is a faster and less memory demanding alternative to
+    pd.read_csv(csv_file, index_col=list(range(index_col)),
+    header=list(range(header_rows))) for numerical tables (e.g. the
+    EXIOBASE txt files or tables saved by pymrio).  The header and index
+    blocks are parsed separately and the numerical block is read
+    in chunks into one array of type 'dtype'. The array is preallocated
+    for the number of lines of uncompressed files, and grown (in place if
+    possible) while reading file like objects and members of zip archives.
+
+    Parameters
+    ----------
+
+    csv_file: str, pathlib.Path or file like object
+        Path to the csv file, or the path within the zip_file.
+        If a (binary) file like object is passed, the file is read in one
+        pass (without counting its lines).
+
+    index_col: int
+        Number of columns forming the index
+
+    header_rows: int
+        Number of rows forming the header
+
+    sep: str, optional
+        Field delimiter, default: tab
+
+    dtype: str, numpy dtype or None, optional
+        Type of the numerical values, default 'float64'.
+        Use 'float32' to half the memory requirement.
+        None keeps the type of each column as found in the file (as
+        pd.read_csv, e.g. int64 for integer columns), the chunks are then
+        concatenated at the end.
+
+    zip_file: str, pathlib.Path or ArchiveSession, optional
+        Zip archive containing csv_file (default: None)
+
+    engine: str, optional
+        Engine for the numerical block: 'c' (default) reads it in chunks
+        of chunksize rows into the array (the lines of uncompressed files
+        are counted first), 'pyarrow' (requires pyarrow) parses the full
+        block at once with multiple threads, in one pass over the file but
+        without the memory bound of the chunks: the parsed block and the
+        array are in memory at the same time.
+
+    chunksize: int, optional
+        Number of rows read per chunk with the 'c' engine
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    Raises
+    ------
+    ValueError if the table contains non-numerical data
+
+    """
+    dtype = None if dtype is None else np.dtype(dtype)
+
+    def _read_head(handle):
+        return [handle.readline().decode('utf-8').rstrip('\r\n').split(sep)
+                for _ in range(header_rows + 1)]
+
+    def _parse_data(handle, nr_rows, nr_cols, first_row=None):
+        # keep_default_na=False: labels like 'NA' (Namibia) must not
+        # become NaN. Empty numerical cells are set to NaN below.
+        read_para = dict(sep=sep, header=None,
+                         dtype={nr: str for nr in range(index_col)},
+                         keep_default_na=False)
+        try:
+            if engine == 'pyarrow':
+                chunks = [pd.read_csv(handle, engine='pyarrow', **read_para)]
+            else:
+                chunks = pd.read_csv(handle, engine='c', chunksize=chunksize,
+                                     **read_para)
+        except pd.errors.EmptyDataError:
+            chunks = []
+        if first_row is not None:
+            # the row after the header is the first data row
+            chunks = itertools.chain(
+                [pd.DataFrame([first_row], dtype=object)], chunks)
+        index_data = []
+        value_chunks = []
+        if dtype is not None:
+            values = np.empty((nr_rows or 0, nr_cols), dtype=dtype)
+        row = 0
+        for chunk in chunks:
+            index_data.append(chunk.iloc[:, :index_col].to_numpy())
+            data = chunk.iloc[:, index_col:]
+            if (data.dtypes == object).any():
+                data = data.replace('', np.nan)
+            if dtype is None:
+                value_chunks.append(data.apply(pd.to_numeric))
+                continue
+            data = data.to_numpy(dtype=dtype)
+            if row + len(data) > len(values):
+                # unknown number of rows: grow (realloc) by at least half
+                values.resize((max(row + len(data), len(values) * 3 // 2),
+                               nr_cols), refcheck=False)
+            values[row:row + len(data)] = data
+            row += len(data)
+        if dtype is None:
+            values = (pd.concat(value_chunks, ignore_index=True)
+                      if value_chunks else pd.DataFrame(
+                          np.empty((0, nr_cols)), dtype='float64'))
+        elif len(values) > row:
+            values.resize((row, nr_cols), refcheck=False)
+        index_data = (np.concatenate(index_data) if index_data
+                      else np.empty((0, index_col), dtype=object))
+        return index_data, values
+
+    def _read(handle, preallocate):
+        nr_lines = None
+        if preallocate and handle.seekable():
+            nr_lines = _count_lines(handle)
+            handle.seek(0)
+        head = _read_head(handle)
+
+        header = head[:header_rows]
+        nr_cols = len(header[0]) - index_col
+        columns = [hh[index_col:] for hh in header]
+
+        if header_rows == 1:
+            index_names = [nn if nn else None for nn in header[0][:index_col]]
+            column_names = [None]
+        else:
+            index_names = [None] * index_col
+            column_names = [next((nn for nn in hh[:index_col] if nn), None)
+                            for hh in header]
+        names_row = head[header_rows]
+        first_row = None
+        if (header_rows > 1 and
+                not any(names_row[index_col:]) and
+                any(names_row[:index_col])):
+            index_names = [nn if nn else None
+                           for nn in names_row[:index_col]]
+        elif any(names_row):
+            first_row = names_row
+
+        nr_rows = None
+        if nr_lines is not None:
+            nr_rows = max(nr_lines - header_rows - (first_row is None), 0)
+        index_data, values = _parse_data(handle, nr_rows, nr_cols,
+                                         first_row)
+        return index_data, values, index_names, columns, column_names
+
+    if hasattr(csv_file, 'read'):
+        (index_data, values, index_names,
+         columns, column_names) = _read(csv_file, False)
+    else:
+        with _open_binary(csv_file, zip_file) as ff:
+            # counting the lines of a zip member would decompress it twice
+            (index_data, values, index_names,
+             columns, column_names) = _read(
+                 ff, engine != 'pyarrow' and dtype is not None and
+                 zip_file is None)
+
+    index = _build_index(
+        [_infer_label_type(index_data[:, nr]) for nr in range(index_col)],
+        index_names)
+    columns = _build_index(columns, column_names)
+
+    if dtype is None:
+        values.index, values.columns = index, columns
+        return values
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+class CachedExcelFile(object):
+
+    def __init__(self, path, member=None, cache_dir=None):
+        """ Excel file with a binary cache of the parsed sheets
+
+        Provides the sheet_names and parse methods of pandas.ExcelFile.
+        Each parsed sheet (per sheet and parse arguments) is stored as a
+        pickle file in cache_dir, the workbook itself is only opened if
+        a sheet is not in the cache yet. The cache entries are invalidated
+        when the size or modification time of the source file changes.
+
+        Parameters
+        ----------
+        path : pathlib.Path or str
+            Excel file or zip archive containing the Excel file
+
+        member : str, optional
+            Name of the Excel file in the zip archive given in path
+
+        cache_dir : pathlib.Path, str or False, optional
+            Folder for the cache files. If None (default), a folder
+            named '.excel_cache' next to the source file is used.
+            Pass False to read without cache.
+
+        """
+        self.path = Path(path)
+        self.member = member
+        if cache_dir is None:
+            cache_dir = self.path.parent / EXCEL_CACHE_FOLDER
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._workbook = None
+
+        stat = self.path.stat()
+        self._stamp = [stat.st_size, stat.st_mtime_ns, __version__]
+        self._name = self.path.name
+        if member:
+            self._name += '__' + member.replace('/', '__')
+        self._index = self._read_index()
+
+    def _read_index(self):
+        """ Cache index of the source file, cleared if the source changed """
+        empty_index = dict(stamp=self._stamp, sheet_names=None,
+                           entries=dict())
+        if not self.cache_dir:
+            return empty_index
+        try:
+            with (self.cache_dir / (self._name + '.json')).open('r') as idf:
+                index = json.load(idf)
+        except (OSError, ValueError):
+            return empty_index
+        if index.get('stamp') == self._stamp:
+            return index
+        for entry in index.get('entries', dict()).values():
+            with contextlib.suppress(OSError):
+                (self.cache_dir / entry).unlink()
+        return empty_index
+
+    def _write_index(self):
+        index_file = self.cache_dir / (self._name + '.json')
+        tmp_file = index_file.with_suffix('.tmp')
+        with tmp_file.open('w') as idf:
+            json.dump(self._index, idf)
+        os.replace(str(tmp_file), str(index_file))
+
+    def _store(self, func):
+        """ Runs func (writing to the cache), disables the cache on errors """
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            func()
+            self._write_index()
+        except OSError as ex:
+            logging.warning('Can not write the excel cache at {} ({}) - '
+                            'read without cache'.format(self.cache_dir, ex))
+            self.cache_dir = None
+
+    def _open_workbook(self):
+        if self._workbook is None:
+            if self.member:
+                with zipfile.ZipFile(str(self.path)) as zf:
+                    source = BytesIO(zf.read(self.member))
+            else:
+                source = str(self.path)
+            self._workbook = pd.ExcelFile(source)
+        return self._workbook
+
+    @property
+    def sheet_names(self):
+        """ Names of all sheets in the workbook """
+        if self._index['sheet_names'] is None:
+            self._index['sheet_names'] = self._open_workbook().sheet_names
+            if self.cache_dir:
+                self._store(lambda: None)
+        return self._index['sheet_names']
+
+    def parse(self, sheet_name=0, **kwargs):
+        """ Reads sheet_name (from the cache if available)
+
+        All keyword arguments are passed to pandas.ExcelFile.parse and
+        must be json serializable.
+        """
+        key = hashlib.sha1(json.dumps(
+            [sheet_name, kwargs], sort_keys=True).encode('utf-8')).hexdigest()
+        entry = self._index['entries'].get(key)
+        if self.cache_dir and entry and (self.cache_dir / entry).is_file():
+            return pd.read_pickle(str(self.cache_dir / entry))
+
+        df = self._open_workbook().parse(sheet_name=sheet_name, **kwargs)
+        if self.cache_dir:
+            entry = '{}.{}.pkl'.format(self._name, key)
+
+            def _write_entry():
+                tmp_file = self.cache_dir / (entry + '.tmp')
+                df.to_pickle(str(tmp_file))
+                os.replace(str(tmp_file), str(self.cache_dir / entry))
+                self._index['entries'][key] = entry
+
+            self._store(_write_entry)
+        return df
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_agg_matrix(agg_vector, pos_dict=None, sparse=False):
     """ Agg. matrix based on mapping given in input as numerical or str vector.
 
     The aggregation matrix has the from nxm with
@@ -184,6 +832,10 @@ def build_agg_matrix(agg_vector, pos_dict=None):
             'string in agg_vector' = pos
             (as int, -1 if value should not be included in the aggregation)
 
+        sparse : boolean, optional
+            If True, the aggregation matrix is returned as
+            scipy.sparse.csr_matrix. Default: False
+
     Example 1:
         input vector: np.array([0, 1, 1, 2]) or ['a', 'b', 'b', 'c']
 
@@ -226,6 +878,16 @@ def build_agg_matrix(agg_vector, pos_dict=None):
             agg_vector[ind] = seen[item]
 
     agg_vector = np.array(agg_vector, dtype=int)
+
+    if sparse:
+        agg_vector = agg_vector.flatten()
+        col_corr = np.arange(agg_vector.size)
+        included = agg_vector != -1
+        return sp.csr_matrix(
+            (np.ones(included.sum()),
+             (agg_vector[included], col_corr[included])),
+            shape=(agg_vector.max()+1, agg_vector.size))
+
     agg_vector = agg_vector.reshape((1, -1))
     row_corr = agg_vector
     col_corr = np.arange(agg_vector.size)